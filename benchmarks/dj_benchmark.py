@@ -0,0 +1,250 @@
+#! /usr/bin/env python3
+
+import argparse
+import json
+import os
+import random
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import dj_generator
+
+# --label and mapper arguments of the runs done when none are specified
+DEFAULT_RUNS = (
+    ("default", ""),
+    ("single pass", "-s"),
+    ("2 workers", "-w 2"),
+    ("4 workers", "-w 4"),
+    ("lxml parser", "--parser lxml"),
+    ("json encoder", "--json_encoder json"),
+    ("stats counts", "--stats counts"),
+)
+
+# --the mapper messages that start each phase of a run
+PHASE_MARKERS = (
+    ("Reading from:", "references"),
+    ("processing records", "records"),
+    ("adding relationships", "relationships"),
+    ("rows processed, completed!", "finish"),
+)
+
+
+# ----------------------------------------
+def mapperVersion(mapperFileName):
+    """return the git version of the mapper if it is in a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(mapperFileName)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ----------------------------------------
+def runMapper(mapperFileName, inputFileName, mapperArgs, workDir):
+    """run the mapper once and return its timings, record count and peak memory"""
+    outputFileName = os.path.join(workDir, "output.json")
+    logFileName = os.path.join(workDir, "stats.json")
+    command = [
+        sys.executable,
+        mapperFileName,
+        "-i",
+        inputFileName,
+        "-o",
+        outputFileName,
+        "-l",
+        logFileName,
+    ] + shlex.split(mapperArgs)
+
+    # --unbuffered so each message is timed when it is printed
+    environment = dict(os.environ, PYTHONUNBUFFERED="1")
+    phaseTimes = {}
+    recordCount = 0
+    phase = "startup"
+    startTime = phaseStart = time.monotonic()
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env=environment,
+    )
+    lastLines = []
+    for line in process.stdout:
+        lastLines = (lastLines + [line])[-20:]
+        for marker, nextPhase in PHASE_MARKERS:
+            if marker in line:
+                now = time.monotonic()
+                phaseTimes[phase] = phaseTimes.get(phase, 0) + now - phaseStart
+                phase, phaseStart = nextPhase, now
+                break
+        if "rows processed, completed!" in line:
+            recordCount = int(line.split()[0])
+
+    # --wait4 reports the peak memory of this run alone where it is available
+    peakRssMb = None
+    if hasattr(os, "wait4"):
+        pid, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        peakRssMb = usage.ru_maxrss / (1048576 if sys.platform == "darwin" else 1024)
+    else:
+        process.wait()
+    endTime = time.monotonic()
+    phaseTimes[phase] = phaseTimes.get(phase, 0) + endTime - phaseStart
+
+    if process.returncode != 0:
+        print("".join(lastLines))
+        return None
+
+    result = {
+        "seconds": round(endTime - startTime, 3),
+        "records": recordCount,
+        "records_per_second": round(recordCount / max(endTime - startTime, 0.001), 1),
+        "phases": {phase: round(seconds, 3) for phase, seconds in phaseTimes.items()},
+        "peak_rss_mb": round(peakRssMb, 1) if peakRssMb else None,
+    }
+    try:
+        with open(logFileName) as logFile:
+            processStats = json.load(logFile).get("PROCESS", {})
+        if processStats.get("PEAK_WORKER_RSS_MB"):
+            result["peak_worker_rss_mb"] = round(processStats["PEAK_WORKER_RSS_MB"], 1)
+    except (OSError, ValueError):
+        pass
+    return result
+
+
+# ----------------------------------------
+def printResults(results):
+    """print a table of the results"""
+    columns = ("run", "records", "seconds", "rec/sec", "pass 1", "pass 2", "peak MB")
+    rows = []
+    for result in results:
+        rows.append(
+            (
+                result["label"],
+                str(result["records"]),
+                "%.2f" % result["seconds"],
+                "%.0f" % result["records_per_second"],
+                "%.2f" % result["phases"].get("references", 0),
+                "%.2f"
+                % (
+                    result["phases"].get("records", 0)
+                    + result["phases"].get("relationships", 0)
+                ),
+                "%.0f" % result["peak_rss_mb"] if result["peak_rss_mb"] else "",
+            )
+        )
+    widths = [max(len(row[i]) for row in rows + [columns]) for i in range(len(columns))]
+    print("")
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+# ----------------------------------------
+if __name__ == "__main__":
+
+    benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+    argparser = argparse.ArgumentParser(
+        description="times the mapper on a Dow Jones file with different settings"
+    )
+    argparser.add_argument(
+        "-i",
+        "--input_file",
+        dest="input_file",
+        type=str,
+        help="Dow Jones xml file to map, a synthetic one is generated if not specified",
+    )
+    dj_generator.addGeneratorArguments(argparser, persons=50000, entities=10000)
+    argparser.add_argument(
+        "-r",
+        "--run",
+        dest="runs",
+        action="append",
+        help='a run as "label: mapper arguments", may be repeated, defaults to a standard set',
+    )
+    argparser.add_argument(
+        "-n",
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=1,
+        help="times to repeat each run, the fastest is reported",
+    )
+    argparser.add_argument(
+        "-o",
+        "--results_file",
+        dest="results_file",
+        type=str,
+        help="json lines file to append the results to for comparing releases",
+    )
+    argparser.add_argument(
+        "-m",
+        "--mapper",
+        dest="mapper",
+        type=str,
+        default=os.path.join(benchmarkDir, "..", "src", "dj_mapper.py"),
+        help="the mapper to benchmark, defaults to the one in this repository",
+    )
+    args = argparser.parse_args()
+
+    runs = DEFAULT_RUNS
+    if args.runs:
+        runs = []
+        for run in args.runs:
+            label, _, mapperArgs = run.partition(":")
+            runs.append((label.strip(), mapperArgs.strip()))
+
+    workDir = tempfile.mkdtemp(prefix="dj_benchmark_")
+    try:
+        inputFileName = args.input_file
+        if not inputFileName:
+            inputFileName = os.path.join(workDir, "%s_benchmark.xml" % args.feed)
+            print("generating %s ..." % inputFileName)
+            random.seed(args.seed)
+            dj_generator.generateFile(inputFileName, args)
+
+        version = mapperVersion(args.mapper)
+        results = []
+        for label, mapperArgs in runs:
+            print("running %s ..." % label)
+            repeatResults = []
+            for repeatNum in range(args.repeat):
+                result = runMapper(args.mapper, inputFileName, mapperArgs, workDir)
+                if result is None:
+                    print("%s failed!" % label)
+                    break
+                repeatResults.append(result)
+            if repeatResults:
+                bestResult = min(repeatResults, key=lambda result: result["seconds"])
+                bestResult.update(
+                    {
+                        "label": label,
+                        "arguments": mapperArgs,
+                        "input_file": os.path.basename(inputFileName),
+                        "input_bytes": os.path.getsize(inputFileName),
+                        "mapper_version": version,
+                        "run_date": datetime.now().isoformat(timespec="seconds"),
+                    }
+                )
+                results.append(bestResult)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    if results:
+        printResults(results)
+    if args.results_file and results:
+        with open(args.results_file, "a") as resultsFile:
+            for result in results:
+                resultsFile.write(json.dumps(result) + "\n")
+        print("")
+        print("Results appended to %s" % args.results_file)
@@ -0,0 +1,590 @@
+#! /usr/bin/env python3
+
+import argparse
+import gzip
+import random
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+# --dow jones country codes and names, some of which the base library cannot resolve
+COUNTRIES = (
+    ("AFGH", "Afghanistan"),
+    ("ALG", "Algeria"),
+    ("ARG", "Argentina"),
+    ("AUST", "Australia"),
+    ("BRAZ", "Brazil"),
+    ("CANA", "Canada"),
+    ("CHIL", "Chile"),
+    ("CHINA", "China"),
+    ("COL", "Colombia"),
+    ("CUBA", "Cuba"),
+    ("EGYPT", "Egypt"),
+    ("FRA", "France"),
+    ("GFR", "Germany"),
+    ("INDIA", "India"),
+    ("INDON", "Indonesia"),
+    ("IRAN", "Iran"),
+    ("IRAQ", "Iraq"),
+    ("ITALY", "Italy"),
+    ("JAP", "Japan"),
+    ("KAZK", "Kazakhstan"),
+    ("LEBAN", "Lebanon"),
+    ("MEX", "Mexico"),
+    ("NETH", "Netherlands"),
+    ("NEWZ", "New Zealand"),
+    ("NIGEA", "Nigeria"),
+    ("NKOR", "Korea, North"),
+    ("PAKIS", "Pakistan"),
+    ("PANA", "Panama"),
+    ("PHIL", "Philippines"),
+    ("RUSS", "Russian Federation"),
+    ("SAARAB", "Saudi Arabia"),
+    ("SAFR", "South Africa"),
+    ("SPAIN", "Spain"),
+    ("SWITZ", "Switzerland"),
+    ("SYRIA", "Syria"),
+    ("TURK", "Turkey"),
+    ("UAE", "United Arab Emirates"),
+    ("UK", "United Kingdom"),
+    ("UKRN", "Ukraine"),
+    ("USA", "United States"),
+    ("VEN", "Venezuela"),
+    ("YEMAR", "Yemen"),
+    ("NOTK", "Not Known"),
+)
+US_STATES = ("Texas", "California", "New York", "Florida", "Illinois", "Ohio")
+
+RELATIONSHIPS = (
+    ("1", "Wife"),
+    ("2", "Husband"),
+    ("3", "Brother"),
+    ("4", "Sister"),
+    ("5", "Son"),
+    ("6", "Daughter"),
+    ("7", "Business Associate"),
+    ("8", "Employee"),
+    ("9", "Employer_Of"),
+    ("10", "Financial Adviser"),
+    ("11", "Associated Special Entity"),
+    ("12", "Owner"),
+)
+RECIPROCALS = {"1": "2", "2": "1", "3": "3", "4": "4", "8": "9", "9": "8"}
+
+# --description 1 id, name and the description 2/3 ids used with it
+DESCRIPTIONS = {
+    "pfa": (
+        ("1", "Politically Exposed Person (PEP)", ("1", "2"), ("1", "2")),
+        ("2", "Relative or Close Associate (RCA)", ("3",), ()),
+        ("3", "Special Interest Person (SIP)", ("4",), ("3",)),
+        ("4", "Special Interest Entity (SIE)", ("4",), ("3",)),
+        ("5", "Sanctions Lists", ("5",), ("4", "5", "6")),
+    ),
+    "hrf": (
+        ("5", "Sanctions Lists", ("5",), ("4", "5", "6")),
+        ("6", "Other Official Lists", ("6",), ()),
+        ("7", "Other Exclusion Lists", ("6",), ()),
+    ),
+    "ame": (("8", "Adverse Media", ("7",), ("7", "8")),),
+    "soc": (("9", "State Owned Companies", ("8",), ()),),
+}
+DESCRIPTION2 = (
+    ("1", "1", "Primary PEP"),
+    ("2", "1", "Secondary PEP"),
+    ("3", "2", "Family Member"),
+    ("4", "3", "Financial Crime"),
+    ("5", "5", "Sanctions"),
+    ("6", "6", "Law Enforcement"),
+    ("7", "8", "Financial Crime"),
+    ("8", "9", "State Ownership"),
+)
+DESCRIPTION3 = (
+    ("1", "1", "Heads & Deputies State/National Government"),
+    ("2", "1", "National Government Ministers"),
+    ("3", "4", "Money Laundering"),
+    ("4", "5", "Ship"),
+    ("5", "5", "Aircraft"),
+    ("6", "5", "Terror"),
+    ("7", "7", "Fraud"),
+    ("8", "7", "Bribery & Corruption"),
+)
+SANCTIONS_REFERENCES = (
+    ("1", "OFAC - Specially Designated Nationals (SDN) List"),
+    ("2", "UN Consolidated List"),
+    ("3", "EU Consolidated Financial Sanctions List"),
+    ("4", "HM Treasury Consolidated List"),
+)
+
+FIRST_NAMES = (
+    "John Mary Ahmed Olga Wei Maria Ivan Fatima Carlos Anna Mohammed Elena "
+    "Peter Aisha Dmitri Sofia Juan Li Hassan Irina Jose Yuki Omar Nadia"
+).split()
+LAST_NAMES = (
+    "Smith Ivanov Garcia Chen Khan Rodriguez Petrov Kim Nguyen Muller Silva "
+    "Hussein Popescu Novak Kowalski Yilmaz Santos Tanaka Haddad Okafor"
+).split()
+ORG_WORDS = (
+    "Global Trading Holdings Petroleum Shipping Logistics Capital Mining "
+    "Investment Industrial United Federal National Pacific Atlantic Group"
+).split()
+ORG_SUFFIXES = ("LLC", "Ltd", "SA", "GmbH", "JSC", "Inc", "Corp")
+MONTHS = "Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec".split()
+OCCUPATIONS = (
+    "Minister of Finance",
+    "Member of Parliament",
+    "Governor",
+    "Ambassador",
+    "Director General",
+    "Judge of the Supreme Court",
+)
+
+# --id type and a function returning its notes, the mix of types DJ files contain
+ID_TYPES = (
+    ("Passport No.", lambda: "Issued by (%s)" % random.choice(COUNTRIES)[1]),
+    ("Passport No.", lambda: "Country of issue: %s" % random.choice(COUNTRIES)[1]),
+    ("National ID", lambda: random.choice(COUNTRIES)[1]),
+    ("National Tax No.", lambda: "Taxpayer Identification Number (TIN)"),
+    ("Social Security No.", lambda: ""),
+    ("Driving License No.", lambda: "Issued in %s, USA" % random.choice(US_STATES)),
+    ("OFAC Unique ID", lambda: ""),
+    ("National Provider Identifier (NPI)", lambda: "NPI"),
+    ("Others", lambda: random.choice(("Residency Permit", "Military ID", "MMSI"))),
+)
+ENTITY_ID_TYPES = (
+    ("Company Identification No.", lambda: random.choice(COUNTRIES)[1]),
+    ("DUNS Number", lambda: ""),
+    ("Legal Entity Identifier (LEI)", lambda: ""),
+    ("International Securities Identification Number (ISIN)", lambda: ""),
+    ("OFAC Unique ID", lambda: ""),
+)
+COUNTRY_TYPES = (
+    "Citizenship",
+    "Resident of",
+    "Jurisdiction",
+    "Country of Affiliation",
+    "Enhanced Risk Country",
+)
+
+# --the description sets each feed draws its profiles from
+FEED_MIX = {
+    "pfa": ("pfa",),
+    "hrf": ("hrf",),
+    "ame": ("ame",),
+    "trifecta": ("pfa", "pfa", "pfa", "ame", "soc"),
+}
+
+
+# ----------------------------------------
+def attrs(**values):
+    """format the attributes of an element, skipping empty ones"""
+    return "".join(
+        " %s=%s" % (name, quoteattr(str(value)))
+        for name, value in values.items()
+        if value
+    )
+
+
+# ----------------------------------------
+def randomDate(minYear, maxYear, precision=None):
+    """return the attributes of a DateValue with a random precision"""
+    precision = precision or random.choice(("full", "full", "full", "year", "month"))
+    day = "%02d" % random.randint(1, 28) if precision == "full" else None
+    month = random.choice(MONTHS) if precision != "year" else None
+    return attrs(Day=day, Month=month, Year=random.randint(minYear, maxYear))
+
+
+# ----------------------------------------
+def referenceLists(feed):
+    """yield the reference lists at the top of the file"""
+    yield "<CountryList>"
+    for code, name in COUNTRIES:
+        yield "<CountryName%s/>" % attrs(code=code, name=name, IsTerritory="False")
+    yield "</CountryList>"
+
+    yield "<OccupationList>"
+    for code, name in enumerate(OCCUPATIONS, 1):
+        yield "<Occupation%s/>" % attrs(code=code, name=name)
+    yield "</OccupationList>"
+
+    # --the anti-corruption (soc) feed puts the name in the text
+    yield "<RelationshipList>"
+    for code, name in RELATIONSHIPS:
+        if feed == "trifecta" and int(code) > 10:
+            yield "<Relationship%s>%s</Relationship>" % (attrs(code=code), escape(name))
+        else:
+            yield "<Relationship%s/>" % attrs(code=code, name=name)
+    yield "</RelationshipList>"
+
+    yield "<SanctionsReferencesList>"
+    for code, name in SANCTIONS_REFERENCES:
+        yield "<ReferenceName%s/>" % attrs(code=code, name=name, status="Current")
+    yield "</SanctionsReferencesList>"
+
+    yield "<Description1List>"
+    for descriptionSet in dict.fromkeys(FEED_MIX[feed]):
+        for description1Id, name, description2Ids, description3Ids in DESCRIPTIONS[
+            descriptionSet
+        ]:
+            yield "<Description1Name%s>%s</Description1Name>" % (
+                attrs(Description1Id=description1Id, RecordType="Both"),
+                escape(name),
+            )
+    yield "</Description1List>"
+    yield "<Description2List>"
+    for description2Id, description1Id, name in DESCRIPTION2:
+        yield "<Description2Name%s>%s</Description2Name>" % (
+            attrs(Description2Id=description2Id, Description1Id=description1Id),
+            escape(name),
+        )
+    yield "</Description2List>"
+    yield "<Description3List>"
+    for description3Id, description2Id, name in DESCRIPTION3:
+        yield "<Description3Name%s>%s</Description3Name>" % (
+            attrs(Description3Id=description3Id, Description2Id=description2Id),
+            escape(name),
+        )
+    yield "</Description3List>"
+
+
+# ----------------------------------------
+def nameValue(recordType):
+    """return a random NameValue element"""
+    if recordType == "Entity":
+        words = random.sample(ORG_WORDS, random.randint(1, 3))
+        orgName = " ".join(words + [random.choice(ORG_SUFFIXES)])
+        return "<NameValue><EntityName>%s</EntityName></NameValue>" % escape(orgName)
+    parts = [
+        "<FirstName>%s</FirstName>" % random.choice(FIRST_NAMES),
+        "<Surname>%s</Surname>" % random.choice(LAST_NAMES),
+    ]
+    if random.random() < 0.3:
+        parts.insert(1, "<MiddleName>%s</MiddleName>" % random.choice(FIRST_NAMES))
+    if random.random() < 0.1:
+        parts.append("<TitleHonorific>Dr</TitleHonorific>")
+    if random.random() < 0.1:
+        parts.append("<OriginalScriptName>Иван Петров</OriginalScriptName>")
+    return "<NameValue>%s</NameValue>" % "".join(parts)
+
+
+# ----------------------------------------
+def profile(recordType, profileId, descriptionSet):
+    """return a Person or Entity element"""
+    description1Id, description1, description2Ids, description3Ids = random.choice(
+        DESCRIPTIONS[descriptionSet]
+    )
+    lastUpdate = "%02d-%s-%s" % (
+        random.randint(1, 28),
+        random.choice(MONTHS),
+        random.randint(2000, 2024),
+    )
+    lines = [
+        "<%s%s>" % (recordType, attrs(id=profileId, action="add", date=lastUpdate))
+    ]
+    if recordType == "Person":
+        lines.append("<Gender>%s</Gender>" % random.choice(("Male", "Female")))
+    lines.append(
+        "<ActiveStatus>%s</ActiveStatus>"
+        % random.choice(("Active", "Active", "Inactive"))
+    )
+    if recordType == "Person":
+        lines.append("<Deceased>%s</Deceased>" % random.choice(("No",) * 9 + ("Yes",)))
+    lines.append(
+        "<ProfileNotes>%s</ProfileNotes>"
+        % escape("Profile notes for %s %s. " % (recordType, profileId) * 3)
+    )
+
+    # --names
+    lines.append("<NameDetails>")
+    lines.append('<Name NameType="Primary Name">%s</Name>' % nameValue(recordType))
+    for nameNum in range(random.choice((0, 0, 1, 1, 2, 4))):
+        lines.append('<Name NameType="Also Known As">%s</Name>' % nameValue(recordType))
+    lines.append("</NameDetails>")
+
+    # --descriptions
+    description = {"Description1": description1Id}
+    if description2Ids:
+        description["Description2"] = random.choice(description2Ids)
+    if description3Ids and random.random() < 0.5:
+        description["Description3"] = random.choice(description3Ids)
+    lines.append("<Descriptions><Description%s/></Descriptions>" % attrs(**description))
+
+    # --roles and dates
+    if recordType == "Person":
+        if description1Id == "1":
+            lines.append(
+                '<RoleDetail><Roles RoleType="Primary Occupation">'
+                "<OccTitle%s>%s</OccTitle></Roles></RoleDetail>"
+                % (
+                    attrs(
+                        OccCat=random.randint(1, len(OCCUPATIONS)),
+                        SinceYear=random.randint(1990, 2020),
+                    ),
+                    escape(random.choice(OCCUPATIONS)),
+                )
+            )
+        dates = ['<Date DateType="Date of Birth">']
+        for dateNum in range(random.choice((1, 1, 1, 2))):
+            dates.append("<DateValue%s/>" % randomDate(1930, 2000))
+        dates.append("</Date>")
+        lines.append("<DateDetails>%s</DateDetails>" % "".join(dates))
+        lines.append(
+            "<BirthPlace><Place%s/></BirthPlace>"
+            % attrs(name="%s, %s" % random.choice(COUNTRIES)[::-1])
+        )
+    elif descriptionSet == "soc":
+        lines.append(
+            '<DateDetails><Date DateTypeId="Date of Registration">'
+            "<DateValue%s/></Date></DateDetails>" % randomDate(1950, 2020)
+        )
+    else:
+        lines.append(
+            '<DateDetails><Date DateType="Date of Registration">'
+            "<DateValue%s/></Date></DateDetails>" % randomDate(1950, 2020)
+        )
+
+    # --addresses
+    addressTag = "Address" if recordType == "Person" else "CompanyDetails"
+    for addrNum in range(random.choice((0, 1, 1, 2))):
+        lines.append(
+            "<%s><AddressLine>%s</AddressLine><AddressCity>%s</AddressCity>"
+            "<AddressCountry>%s</AddressCountry>%s</%s>"
+            % (
+                addressTag,
+                "%s %s Street" % (random.randint(1, 999), random.choice(LAST_NAMES)),
+                random.choice(LAST_NAMES) + "ville",
+                random.choice(COUNTRIES)[0],
+                (
+                    "<URL>www.%s.com</URL>" % random.choice(ORG_WORDS).lower()
+                    if recordType == "Entity" and random.random() < 0.3
+                    else ""
+                ),
+                addressTag,
+            )
+        )
+
+    # --countries
+    countries = []
+    for countryNum in range(random.choice((1, 1, 2, 3))):
+        countries.append(
+            '<Country CountryType="%s"><CountryValue Code="%s"/></Country>'
+            % (
+                random.choice(
+                    COUNTRY_TYPES if recordType == "Person" else COUNTRY_TYPES[1:]
+                ),
+                random.choice(COUNTRIES)[0],
+            )
+        )
+    lines.append("<CountryDetails>%s</CountryDetails>" % "".join(countries))
+
+    # --identifiers with notes
+    idTypes = ID_TYPES if recordType == "Person" else ENTITY_ID_TYPES
+    if recordType == "Entity" and "Description3" in description:
+        if description["Description3"] == "4":
+            idTypes = (
+                ("International Maritime Organization (IMO) Ship No.", lambda: ""),
+            )
+        elif description["Description3"] == "5":
+            idTypes = (
+                ("Aircraft Manufacturer's Serial Number (MSN)", lambda: ""),
+                ("Others", lambda: "Aircraft Tail Number"),
+            )
+    ids = []
+    for idNum in range(random.choice((0, 1, 1, 2, 3))):
+        idType, idNotes = random.choice(idTypes)
+        ids.append(
+            "<ID%s><IDValue%s>%s</IDValue></ID>"
+            % (
+                attrs(IDType=idType),
+                attrs(IDnotes=idNotes()),
+                random.randint(10000000, 99999999),
+            )
+        )
+    if ids:
+        lines.append("<IDNumberTypes>%s</IDNumberTypes>" % "".join(ids))
+
+    # --sources, references and images
+    lines.append(
+        '<SourceDescription><Source name="%s"/></SourceDescription>'
+        % escape("http://www.example.com/news/%s" % profileId)
+    )
+    if description1Id in ("5", "6", "7"):
+        lines.append(
+            "<SanctionsReferences><Reference%s>%s</Reference></SanctionsReferences>"
+            % (
+                attrs(SinceYear=random.randint(2000, 2024)),
+                random.choice(SANCTIONS_REFERENCES)[0],
+            )
+        )
+    if random.random() < 0.2:
+        lines.append(
+            '<Images><Image URL="http://www.example.com/images/%s.jpg"/></Images>'
+            % profileId
+        )
+    lines.append("</%s>" % recordType)
+    return "\n".join(lines)
+
+
+# ----------------------------------------
+def associations(profileIds, associatedPct, fanOut, maxFanOut):
+    """yield the PublicFigure and SpecialEntity elements"""
+    relationCodes = [code for code, name in RELATIONSHIPS]
+    recordTypes = dict(profileIds)
+    associateLists = {}
+    for profileId, recordType in profileIds:
+        if random.random() * 100 >= associatedPct:
+            continue
+        # --most profiles have a few associates, a few have a great many
+        associateCount = min(maxFanOut, int(random.expovariate(1.0 / fanOut)) + 1)
+        for associateNum in range(associateCount):
+            otherId, otherType = random.choice(profileIds)
+            if otherId == profileId:
+                continue
+            code = random.choice(relationCodes)
+            ex = random.choice(("No",) * 9 + ("Yes",))
+            associateLists.setdefault(profileId, []).append((otherId, code, ex))
+            # --most relationships are listed from both sides
+            if random.random() < 0.7:
+                associateLists.setdefault(otherId, []).append(
+                    (profileId, RECIPROCALS.get(code, code), ex)
+                )
+
+    for profileId, associates in associateLists.items():
+        tag = "PublicFigure" if recordTypes[profileId] == "Person" else "SpecialEntity"
+        yield "<%s%s>%s</%s>" % (
+            tag,
+            attrs(id=profileId),
+            "".join(
+                "<Associate%s/>" % attrs(id=otherId, code=code, ex=ex)
+                for otherId, code, ex in associates
+            ),
+            tag,
+        )
+
+
+# ----------------------------------------
+def generateFile(outputFileName, options):
+    """write a synthetic dow jones xml file with the options of addGeneratorArguments"""
+    if outputFileName.endswith(".gz"):
+        outputFile = gzip.open(outputFileName, "wt", encoding="utf-8")
+    else:
+        outputFile = open(outputFileName, "w", encoding="utf-8")
+
+    rootTag = "PFA" if options.feed != "ame" else "AME"
+    outputFile.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    outputFile.write('<%s date="202401012200" type="full">\n' % rootTag)
+    for line in referenceLists(options.feed):
+        outputFile.write(line + "\n")
+
+    outputFile.write("<Records>\n")
+    profileIds = []
+    descriptionSets = FEED_MIX[options.feed]
+    recordTypes = ["Person"] * options.persons + ["Entity"] * options.entities
+    random.shuffle(recordTypes)
+    for profileNum, recordType in enumerate(recordTypes, 1):
+        profileId = str(profileNum * 7 + 10000)
+        profileIds.append((profileId, recordType))
+        outputFile.write(
+            profile(recordType, profileId, random.choice(descriptionSets)) + "\n"
+        )
+        if profileNum % 100000 == 0:
+            print("%s profiles written" % profileNum)
+    outputFile.write("</Records>\n")
+
+    outputFile.write("<Associations>\n")
+    associationCount = 0
+    for line in associations(
+        profileIds, options.associated_pct, options.fan_out, options.max_fan_out
+    ):
+        outputFile.write(line + "\n")
+        associationCount += 1
+    outputFile.write("</Associations>\n")
+    outputFile.write("</%s>\n" % rootTag)
+    outputFile.close()
+    return len(profileIds), associationCount
+
+
+# ----------------------------------------
+def addGeneratorArguments(argparser, persons, entities):
+    """add the arguments that describe the synthetic file to generate"""
+    argparser.add_argument(
+        "-f",
+        "--feed",
+        dest="feed",
+        choices=("pfa", "hrf", "ame", "trifecta"),
+        default="pfa",
+        help="the kind of Dow Jones file to imitate, defaults to pfa",
+    )
+    argparser.add_argument(
+        "-p",
+        "--persons",
+        dest="persons",
+        type=int,
+        default=persons,
+        help="number of Person profiles, defaults to %s" % persons,
+    )
+    argparser.add_argument(
+        "-e",
+        "--entities",
+        dest="entities",
+        type=int,
+        default=entities,
+        help="number of Entity profiles, defaults to %s" % entities,
+    )
+    argparser.add_argument(
+        "--associated_pct",
+        dest="associated_pct",
+        type=float,
+        default=40.0,
+        help="percent of the profiles with associates, defaults to 40",
+    )
+    argparser.add_argument(
+        "--fan_out",
+        dest="fan_out",
+        type=float,
+        default=3.0,
+        help="average number of associates of a profile that has them, defaults to 3",
+    )
+    argparser.add_argument(
+        "--max_fan_out",
+        dest="max_fan_out",
+        type=int,
+        default=500,
+        help="most associates a profile can have, defaults to 500",
+    )
+    argparser.add_argument(
+        "--seed",
+        dest="seed",
+        type=int,
+        default=1,
+        help="random seed so the same file can be generated again, defaults to 1",
+    )
+
+
+# ----------------------------------------
+if __name__ == "__main__":
+
+    argparser = argparse.ArgumentParser(
+        description="writes a synthetic Dow Jones xml file to benchmark the mapper with"
+    )
+    argparser.add_argument(
+        "-o",
+        "--output_file",
+        dest="output_file",
+        type=str,
+        required=True,
+        help="xml file to write, a .gz extension compresses it",
+    )
+    addGeneratorArguments(argparser, persons=10000, entities=2000)
+    args = argparser.parse_args()
+
+    if args.persons < 0 or args.entities < 0 or args.persons + args.entities == 0:
+        print("")
+        print("Please specify some persons or entities")
+        print("")
+        sys.exit(1)
+
+    random.seed(args.seed)
+    profileCount, associationCount = generateFile(args.output_file, args)
+    print(
+        "%s profiles and %s associations written to %s"
+        % (profileCount, associationCount, args.output_file)
+    )
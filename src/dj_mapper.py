@@ -3,30 +3,193 @@
 import os
 import sys
 import argparse
+import bz2
+import copy
+import cProfile
+import gzip
+import hashlib
+import io
+import multiprocessing
 import signal
+import socket
+import stat
 import time
+import traceback
 from datetime import datetime, timedelta
 import xml.etree.ElementTree as etree
 import xml.dom.minidom as minidom
 import json
+import math
+import queue
 import random
 import re
+import sqlite3
+import tempfile
+import threading
+import zipfile
+import zlib
+from array import array
+from bisect import bisect_left
+from concurrent.futures import Future, ThreadPoolExecutor
 
 # --import the base mapper library and variants
 try:
     import base_mapper
-except:
-    print("")
-    print("Please export PYTHONPATH=$PYTHONPATH:<path to mapper-base project>")
-    print("")
-    sys.exit(1)
+except ImportError as err:
+    raise ImportError(
+        "Please export PYTHONPATH=$PYTHONPATH:<path to mapper-base project>"
+    ) from err
+# --lxml parses faster but its elements are slower to map, so it is only used
+# --when asked for
+try:
+    from lxml import etree as lxmlEtree
+except ImportError:
+    lxmlEtree = None
+
+# --orjson is a faster json encoder if it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --resource reports the peak memory use where it is available
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# --zstandard is only needed for .zst input and output files
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 baseLibrary = base_mapper.base_library(
     os.path.abspath(base_mapper.__file__).replace(
         "base_mapper.py", "base_variants.json"
     )
 )
 if not baseLibrary.initialized:
-    sys.exit(1)
+    raise ImportError("The base library could not be initialized")
+
+
+SNAPSHOT_VERSION = 5
+COMPRESSION_SIGNATURES = (
+    (b"PK\x03\x04", "zip"),
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\x28\xb5\x2f\xfd", "zstd"),
+)
+RECORD_TAGS = ("Person", "Entity")
+ASSOCIATION_TAGS = ("PublicFigure", "SpecialEntity")
+REFERENCE_TAGS = (
+    "CountryList",
+    "Description1List",
+    "Description2List",
+    "Description3List",
+    "SanctionsReferencesList",
+    "RelationshipList",
+    "PublicFigure",
+    "SpecialEntity",
+    "Entity",
+    "Person",
+)
+ISO_CACHE_SIZE = 50000
+ID_TYPE_CACHE_SIZE = 10000
+# --data source of an input file from its name when -d is not given
+DATA_SOURCE_PATTERNS = (
+    (re.compile(r"(^|[\W_])HRF([\W_]|$)", re.IGNORECASE), "DJ-HRF"),
+    (re.compile(r"(^|[\W_])AME([\W_]|$)", re.IGNORECASE), "DJ-AME"),
+    (re.compile(r"(^|[\W_])PFA\d*([\W_]|$)", re.IGNORECASE), "DJ-PFA"),
+    (re.compile(r"(^|[\W_])TRIFECTA([\W_]|$)", re.IGNORECASE), "DJ-TRI"),
+)
+# --data source of each feed of a trifecta file from its description1 names, in
+# --order of precedence after pfa, which is the rest of the file
+TRIFECTA_FEEDS = (
+    ("DJ-SOC", re.compile(r"state[\s-]owned|\(SOC\)", re.IGNORECASE)),
+    ("DJ-AME", re.compile(r"adverse media", re.IGNORECASE)),
+)
+INPUT_FILE_EXTENSIONS = (".xml", ".zip", ".xml.gz", ".xml.bz2", ".xml.zst")
+ID_NOTE_GROUP_REGEX = re.compile(r"\(.*?\)")
+ID_NOTE_CONNECTING_WORDS = frozenset(("id", "in", "is", "on", "no", "and"))
+# --id type match, notes match, identifier attribute, country attribute, country check
+# --(1=country, 2=state) in order of precedence, notes matches other than startswith
+# --are not case sensitive
+ID_TYPE_RULES = (
+    (("equals", "SOCIAL SECURITY NO."), None, "SSN_NUMBER", None, 0),
+    (("equals", "PASSPORT NO."), None, "PASSPORT_NUMBER", "PASSPORT_COUNTRY", 1),
+    (
+        ("equals", "DRIVING LICENSE NO."),
+        None,
+        "DRIVERS_LICENSE_NUMBER",
+        "DRIVERS_LICENSE_STATE",
+        2,
+    ),
+    (("equals", "NATIONAL ID"), None, "NATIONAL_ID_NUMBER", "NATIONAL_ID_COUNTRY", 1),
+    (("equals", "NATIONAL TAX NO."), None, "TAX_ID_NUMBER", "TAX_ID_COUNTRY", 1),
+    (
+        ("equals", "COMPANY IDENTIFICATION NO."),
+        None,
+        "COMPANY_ID_NUMBER",
+        "COMPANY_ID_COUNTRY",
+        1,
+    ),
+    (("equals", "DUNS NUMBER"), None, "DUNS_NUMBER", None, 0),
+    (("equals", "OFAC UNIQUE ID"), None, "OFAC_ID", None, 0),
+    (("equals", "NATIONAL PROVIDER IDENTIFIER (NPI)"), None, "NPI_NUMBER", None, 0),
+    (None, ("startswith", "NPI"), "NPI_NUMBER", None, 0),
+    (None, ("contains", "(NPI)"), "NPI_NUMBER", None, 0),
+    (("equals", "LEGAL ENTITY IDENTIFIER (LEI)"), None, "LEI_NUMBER", None, 0),
+    (
+        ("equals", "NATIONAL CRIMINAL IDENTIFICATION CODE (USA)"),
+        None,
+        "NCIC_NUMBER",
+        None,
+        0,
+    ),
+    (None, ("contains", "(NCIC)"), "NCIC_NUMBER", None, 0),
+    (("equals", "CENTRAL REGISTRATION DEPOSITORY (CRD)"), None, "CRD_NUMBER", None, 0),
+    (
+        ("equals", "INTERNATIONAL MARITIME ORGANIZATION (IMO) SHIP NO."),
+        None,
+        "IMO_NUMBER",
+        None,
+        0,
+    ),
+    (
+        ("equals", "INTERNATIONAL SECURITIES IDENTIFICATION NUMBER (ISIN)"),
+        None,
+        "ISIN_NUMBER",
+        None,
+        0,
+    ),
+    (("equals", "MSB LICENSE NUMBER"), None, "MSB_LICENSE_NUMBER", None, 0),
+    (("equals", "MARIJUANA LICENSE NUMBER"), None, "MARIJUANA_LICENSE_NUMBER", None, 0),
+    (("equals", "OTHERS"), ("equals", "MMSI"), "MMSI_NUMBER", None, 0),
+    (("contains", "(MSN)"), None, "AIRCRAFT_MFG_SERIAL_NUM", None, 0),
+    (
+        ("equals", "OTHERS"),
+        ("contains", "AIRCRAFT TAIL NUMBER"),
+        "AIRCRAFT_TAIL_NUMBER",
+        None,
+        0,
+    ),
+)
+REFERENCE_TABLES = (
+    "countryCodes",
+    "countryIsoCodes",
+    "description1Codes",
+    "description2Codes",
+    "description3Codes",
+    "referenceCodes",
+    "relationCodes",
+    "profileIds",
+    "relationships",
+    "entityNames",
+    "entityDuns",
+)
+# --the mapper of a worker process, set when the pool starts it
+workerMapper = None
 
 
 # ----------------------------------------
@@ -36,38 +199,715 @@ def pause(question="PRESS ENTER TO CONTINUE ..."):
         response = input(question)
     except KeyboardInterrupt:
         response = None
-        global shutDown
-        shutDown = True
     return response
 
 
 # ----------------------------------------
-def signal_handler(signal, frame):
-    print("USER INTERRUPT! Shutting down ... (please wait)")
-    global shutDown
-    shutDown = True
-    return
+class StatCollector:
+    """mapping statistics with counters and a reservoir sample of examples"""
+
+    def __init__(self, mode="full", sampleSize=5):
+        self.mode = mode
+        self.collectCounts = mode != "off"
+        self.collectExamples = mode == "full"
+        self.sampleSize = sampleSize
+        self.counts = {}
+        self.samples = {}
+        self.process = {}
+
+    def update(self, cat1, cat2, example=None):
+        """count a category and offer its example to the sample"""
+        if not self.collectCounts:
+            return
+        key = (cat1, cat2)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        if example and self.collectExamples:
+            sample = self.samples.get(key)
+            if sample is None:
+                # --examples, number offered, next one to keep, algorithm L weight
+                sample = self.samples[key] = [[], 0, 0, 1.0]
+            self.offerExample(sample, example)
+
+    def offerExample(self, sample, example):
+        """reservoir sampling that skips ahead rather than drawing for every example"""
+        examples = sample[0]
+        sample[1] += 1
+        if len(examples) < self.sampleSize:
+            if example not in examples:
+                examples.append(example)
+                if len(examples) == self.sampleSize:
+                    self.skipAhead(sample)
+        elif sample[1] >= sample[2]:
+            if example not in examples:
+                examples[random.randrange(self.sampleSize)] = example
+            self.skipAhead(sample)
+
+    def skipAhead(self, sample):
+        """pick the next example to keep"""
+        sample[3] *= math.exp(math.log(1.0 - random.random()) / self.sampleSize)
+        if sample[3] >= 1.0:
+            sample[2] = sample[1] + 1
+        else:
+            skipCount = math.log(1.0 - random.random()) / math.log(1.0 - sample[3])
+            sample[2] = sample[1] + int(skipCount) + 1
+
+    def merge(self, other):
+        """add the statistics collected by another worker to these ones"""
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        for key, otherSample in other.samples.items():
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = [[], 0, 0, 1.0]
+            for example in otherSample[0]:
+                self.offerExample(sample, example)
+        for name, value in other.process.items():
+            if isinstance(value, dict):
+                self.addProcessCounts(name, value)
+            else:
+                self.process[name] = value
+
+    def addProcessCounts(self, name, counts):
+        """add counters such as cache hits to a process statistic"""
+        processCounts = self.process.setdefault(name, {})
+        for counter, count in counts.items():
+            processCounts[counter] = processCounts.get(counter, 0) + count
+
+    def toDict(self):
+        """return the stats in the statPack format of the log file"""
+        statPack = {}
+        for (cat1, cat2), count in self.counts.items():
+            statPack.setdefault(cat1, {})[cat2] = {"count": count}
+        for (cat1, cat2), sample in self.samples.items():
+            statPack[cat1][cat2]["examples"] = sample[0]
+        statPack["PROCESS"] = dict(self.process, STATS_MODE=self.mode)
+        return statPack
 
 
 # ----------------------------------------
-def updateStat(cat1, cat2, example=None):
-    if cat1 not in statPack:
-        statPack[cat1] = {}
-    if cat2 not in statPack[cat1]:
-        statPack[cat1][cat2] = {}
-        statPack[cat1][cat2]["count"] = 0
-
-    statPack[cat1][cat2]["count"] += 1
-    if example:
-        if "examples" not in statPack[cat1][cat2]:
-            statPack[cat1][cat2]["examples"] = []
-        if example not in statPack[cat1][cat2]["examples"]:
-            if len(statPack[cat1][cat2]["examples"]) < 5:
-                statPack[cat1][cat2]["examples"].append(example)
-            else:
-                randomSampleI = random.randint(2, 4)
-                statPack[cat1][cat2]["examples"][randomSampleI] = example
-    return
+class BoundedCache:
+    """dictionary cache that drops its oldest entries when full and counts its hits"""
+
+    MISSING = object()
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """return the cached value or MISSING"""
+        value = self.entries.get(key, self.MISSING)
+        if value is self.MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """cache a value, dropping the oldest entry if full"""
+        if len(self.entries) >= self.maxSize:
+            del self.entries[next(iter(self.entries))]
+            self.evictions += 1
+        self.entries[key] = value
+
+    def takeCounts(self):
+        """return the counters since the last call and reset them"""
+        counts = {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+        self.hits = self.misses = self.evictions = 0
+        return counts
+
+
+# ----------------------------------------
+class MappingProfiler:
+    """cumulative time and calls of each g2Mapping section and of each pass"""
+
+    def __init__(self):
+        self.sections = {}
+        self.passes = {}
+        self.lapTime = 0.0
+        self.passName = None
+        self.passTime = 0.0
+
+    def startRecord(self):
+        """start timing the sections of a record"""
+        self.lapTime = time.perf_counter()
+
+    def lap(self, section):
+        """add the time since the last lap to a section"""
+        now = time.perf_counter()
+        timing = self.sections.get(section)
+        if timing is None:
+            timing = self.sections[section] = [0.0, 0]
+        timing[0] += now - self.lapTime
+        timing[1] += 1
+        self.lapTime = now
+
+    def nextPass(self, passName=None):
+        """end the current pass, if any, and start timing the next one"""
+        now = time.perf_counter()
+        if self.passName:
+            timing = self.passes.setdefault(self.passName, [0.0, 0])
+            timing[0] += now - self.passTime
+            timing[1] += 1
+        self.passName = passName
+        self.passTime = now
+
+    def merge(self, other):
+        """add the section times of a worker to these ones"""
+        for section, (seconds, calls) in other.sections.items():
+            timing = self.sections.setdefault(section, [0.0, 0])
+            timing[0] += seconds
+            timing[1] += calls
+
+    def toDict(self):
+        """return the timings for the log file"""
+        return {
+            timingType: {
+                name: {"seconds": round(seconds, 3), "calls": calls}
+                for name, (seconds, calls) in timings.items()
+            }
+            for timingType, timings in (
+                ("SECTIONS", self.sections),
+                ("PASSES", self.passes),
+            )
+        }
+
+    def printSummary(self):
+        """print the time spent in each section, slowest first"""
+        totalSeconds = sum(seconds for seconds, calls in self.sections.values())
+        print("")
+        print("mapping time by section ...")
+        for section, (seconds, calls) in sorted(
+            self.sections.items(), key=lambda item: -item[1][0]
+        ):
+            print(
+                " %-22s %10.2fs %6.1f%%"
+                % (section, seconds, 100 * seconds / max(totalSeconds, 1e-9))
+            )
+        for passName, (seconds, calls) in self.passes.items():
+            print(" %-22s %10.2fs" % ("(" + passName + ")", seconds))
+
+
+# ----------------------------------------
+class ProgressMonitor:
+    """progress, rate and eta of each pass from the bytes of the file read so far"""
+
+    def __init__(self, metricsFileName=None):
+        self.metricsFileName = metricsFileName
+        self.passName = None
+        self.passStart = time.time()
+        self.runStart = self.passStart
+        self.trackedFile = None
+        self.totalBytes = 0
+        self.bytesDone = 0
+        self.recordCount = 0
+        self.queueDepth = None
+
+    def startPass(self, passName):
+        """start measuring a new pass"""
+        self.passName = passName
+        self.passStart = time.time()
+        self.trackedFile = None
+        self.totalBytes = 0
+        self.bytesDone = 0
+        self.recordCount = 0
+        self.queueDepth = None
+
+    def trackFile(self, fileHandle, totalBytes):
+        """measure the pass by the position in this file"""
+        self.trackedFile = fileHandle
+        self.totalBytes = totalBytes
+        self.bytesDone = 0
+
+    def setTotalBytes(self, totalBytes):
+        """measure the pass by bytes reported by the caller"""
+        self.trackedFile = None
+        self.totalBytes = totalBytes
+
+    def bytesRead(self):
+        """return the bytes of the pass consumed so far"""
+        if self.trackedFile is not None:
+            try:
+                self.bytesDone = self.trackedFile.tell()
+            except (OSError, ValueError):  # --closed once the pass is over
+                pass
+        return self.bytesDone
+
+    def report(self, recordCount, action, bytesDone=None, queueDepth=None):
+        """print the progress of the pass and update the metrics file"""
+        self.recordCount = recordCount
+        if bytesDone is not None:
+            self.bytesDone = bytesDone
+        self.queueDepth = queueDepth
+        metrics = self.metrics()
+        message = "%s %s" % (recordCount, action)
+        if metrics["progress"] is not None:
+            message += ", %.1f%% of the file" % (metrics["progress"] * 100)
+        message += ", %s/sec" % round(metrics["records_per_second"])
+        if metrics["eta_seconds"] is not None:
+            message += ", eta %s" % timedelta(seconds=round(metrics["eta_seconds"]))
+        if metrics["rss_mb"] is not None:
+            message += ", rss %s MB" % round(metrics["rss_mb"])
+        if queueDepth is not None:
+            message += ", %s chunks queued" % queueDepth
+        print(message)
+        self.writeMetrics(metrics)
+
+    def metrics(self, status="running"):
+        """return the current metrics of the run"""
+        now = time.time()
+        passSeconds = max(now - self.passStart, 0.001)
+        bytesDone = self.bytesRead()
+        progress = None
+        etaSeconds = None
+        if self.totalBytes:
+            progress = min(bytesDone / self.totalBytes, 1.0)
+            if progress > 0:
+                etaSeconds = passSeconds * (1 - progress) / progress
+        return {
+            "status": status,
+            "pass": self.passName,
+            "input_bytes": self.totalBytes,
+            "bytes_read": bytesDone,
+            "progress": progress,
+            "records": self.recordCount,
+            "records_per_second": self.recordCount / passSeconds,
+            "eta_seconds": etaSeconds,
+            "rss_mb": currentRssMb(),
+            "queue_depth": self.queueDepth,
+            "pass_seconds": passSeconds,
+            "elapsed_seconds": now - self.runStart,
+            "updated": now,
+        }
+
+    def finish(self, status, recordCount):
+        """write the final metrics of the run"""
+        self.recordCount = recordCount
+        if status == "completed" and self.totalBytes:
+            self.trackedFile = None
+            self.bytesDone = self.totalBytes
+        if self.queueDepth is not None:
+            self.queueDepth = 0
+        self.writeMetrics(self.metrics(status))
+
+    def writeMetrics(self, metrics):
+        """replace the metrics file so a scraper never reads a partial one"""
+        if not self.metricsFileName:
+            return
+        metrics = {
+            name: round(value, 3) if isinstance(value, float) else value
+            for name, value in metrics.items()
+        }
+        if self.metricsFileName.endswith(".prom"):
+            metricsText = self.prometheusText(metrics)
+        else:
+            metricsText = json.dumps(metrics, indent=4, sort_keys=True) + "\n"
+        tempFileName = self.metricsFileName + ".tmp"
+        try:
+            with open(tempFileName, "w") as metricsFile:
+                metricsFile.write(metricsText)
+            os.replace(tempFileName, self.metricsFileName)
+        except OSError as err:
+            print("Could not write metrics file %s" % self.metricsFileName)
+            print(" %s" % err)
+            self.metricsFileName = None
+
+    def prometheusText(self, metrics):
+        """return the metrics in the prometheus textfile format
+
+        The pass is left out so each metric stays one series for the whole run,
+        and the status is a gauge for each status the run can end with.
+        """
+        lines = [
+            "# HELP dj_mapper_running 1 while the mapper is running",
+            "# TYPE dj_mapper_running gauge",
+            "dj_mapper_running %s" % int(metrics["status"] == "running"),
+            "# HELP dj_mapper_status 1 for the status of the run, 0 for the others",
+            "# TYPE dj_mapper_status gauge",
+        ]
+        for status in ("running", "completed", "aborted"):
+            lines.append(
+                'dj_mapper_status{status="%s"} %s'
+                % (status, int(metrics["status"] == status))
+            )
+        for name, value in sorted(metrics.items()):
+            if name in ("status", "pass") or value is None:
+                continue
+            lines.append("# TYPE dj_mapper_%s gauge" % name)
+            lines.append("dj_mapper_%s %s" % (name, round(value, 3)))
+        return "\n".join(lines) + "\n"
+
+
+# ----------------------------------------
+class ProfileIdTable:
+    """numbers the profile ids so the other reference tables can use arrays"""
+
+    def __init__(self):
+        self.numbers = {}
+        self.ids = []
+
+    def number(self, profileId):
+        """return the number of a profile id, adding it if new"""
+        profileNumber = self.numbers.get(profileId)
+        if profileNumber is None:
+            profileNumber = self.numbers[profileId] = len(self.ids)
+            self.ids.append(profileId)
+        return profileNumber
+
+    def snapshot(self):
+        """return the json fields and binary buffers that save the table"""
+        return {"count": len(self.ids)}, {"ids": "\n".join(self.ids).encode("utf-8")}
+
+    def restore(self, fields, buffers):
+        """load the table from the fields and buffers of snapshot()"""
+        self.ids = buffers["ids"].decode("utf-8").split("\n") if fields["count"] else []
+        if len(self.ids) != fields["count"]:
+            raise ValueError("profile id count does not match")
+        self.numbers = {profileId: number for number, profileId in enumerate(self.ids)}
+
+    def footprint(self):
+        """return the approximate bytes used by the table"""
+        return (
+            sys.getsizeof(self.numbers)
+            + sys.getsizeof(self.ids)
+            + sum(sys.getsizeof(profileId) for profileId in self.ids)
+        )
+
+
+# ----------------------------------------
+class ProfileValueTable:
+    """a string per profile id, such as the entity names, kept in a single buffer"""
+
+    def __init__(self, profileIds):
+        self.profileIds = profileIds
+        self.starts = array("q")
+        self.lengths = array("i")
+        self.data = bytearray()
+
+    def valueRange(self, profileId):
+        """return the start and length of a value, or -1 and 0 if none"""
+        profileNumber = self.profileIds.numbers.get(profileId)
+        if profileNumber is None or profileNumber >= len(self.starts):
+            return -1, 0
+        return self.starts[profileNumber], self.lengths[profileNumber]
+
+    def __setitem__(self, profileId, value):
+        profileNumber = self.profileIds.number(profileId)
+        if profileNumber >= len(self.starts):
+            missingCount = profileNumber + 1 - len(self.starts)
+            self.starts.extend(array("q", [-1]) * missingCount)
+            self.lengths.extend(array("i", [0]) * missingCount)
+        valueBytes = value.encode("utf-8")
+        self.starts[profileNumber] = len(self.data)
+        self.lengths[profileNumber] = len(valueBytes)
+        self.data += valueBytes
+
+    def __contains__(self, profileId):
+        return self.valueRange(profileId)[0] >= 0
+
+    def __getitem__(self, profileId):
+        valueStart, valueLength = self.valueRange(profileId)
+        if valueStart < 0:
+            raise KeyError(profileId)
+        return self.data[valueStart : valueStart + valueLength].decode("utf-8")
+
+    def get(self, profileId, default=None):
+        return self[profileId] if profileId in self else default
+
+    def __iter__(self):
+        for profileNumber, valueStart in enumerate(self.starts):
+            if valueStart >= 0:
+                yield self.profileIds.ids[profileNumber]
+
+    def snapshot(self):
+        """return the json fields and binary buffers that save the table"""
+        return {}, {"starts": self.starts, "lengths": self.lengths, "data": self.data}
+
+    def restore(self, fields, buffers):
+        """load the table from the fields and buffers of snapshot()"""
+        self.starts = buffers["starts"]
+        self.lengths = buffers["lengths"]
+        self.data = buffers["data"]
+
+    def footprint(self):
+        """return the approximate bytes used by the table"""
+        return (
+            sys.getsizeof(self.starts)
+            + sys.getsizeof(self.lengths)
+            + sys.getsizeof(self.data)
+        )
+
+
+# ----------------------------------------
+class AssociateTable:
+    """the associates of each profile id in compressed sparse row arrays"""
+
+    def __init__(self, profileIds):
+        self.profileIds = profileIds
+        # --first row and row count of each profile number, -1 if not an association
+        self.firstRows = array("q")
+        self.rowCounts = array("i")
+        # --associate profile number and relationship code/ex flag of each row
+        self.associateNumbers = array("i")
+        self.associateKinds = array("i")
+        self.kindNumbers = {}
+        self.kinds = []
+        # --relationship and legacy relationship type of each row, see buildEdges
+        self.edgeTypes = array("i")
+        self.edgeTypeNumbers = {}
+        self.edgeTypeNames = []
+        self.profileCount = 0
+
+    def rowRange(self, profileId):
+        """return the rows of a profile's associates, or None if not an association"""
+        profileNumber = self.profileIds.numbers.get(profileId)
+        if profileNumber is None or profileNumber >= len(self.firstRows):
+            return None
+        firstRow = self.firstRows[profileNumber]
+        if firstRow < 0:
+            return None
+        return range(firstRow, firstRow + self.rowCounts[profileNumber])
+
+    def __setitem__(self, profileId, associates):
+        profileNumber = self.profileIds.number(profileId)
+        if profileNumber >= len(self.firstRows):
+            missingCount = profileNumber + 1 - len(self.firstRows)
+            self.firstRows.extend(array("q", [-1]) * missingCount)
+            self.rowCounts.extend(array("i", [0]) * missingCount)
+        if self.firstRows[profileNumber] < 0:
+            self.profileCount += 1
+        self.firstRows[profileNumber] = len(self.associateNumbers)
+        self.rowCounts[profileNumber] = len(associates)
+        for associate in associates:
+            kind = (associate["code"], associate["ex"])
+            kindNumber = self.kindNumbers.get(kind)
+            if kindNumber is None:
+                kindNumber = self.kindNumbers[kind] = len(self.kinds)
+                self.kinds.append(kind)
+            self.associateNumbers.append(self.profileIds.number(associate["id"]))
+            self.associateKinds.append(kindNumber)
+
+    def __contains__(self, profileId):
+        return self.rowRange(profileId) is not None
+
+    def __len__(self):
+        return self.profileCount
+
+    def __getitem__(self, profileId):
+        rows = self.rowRange(profileId)
+        if rows is None:
+            raise KeyError(profileId)
+        associates = []
+        for row in rows:
+            code, ex = self.kinds[self.associateKinds[row]]
+            associateId = self.profileIds.ids[self.associateNumbers[row]]
+            associates.append({"id": associateId, "code": code, "ex": ex})
+        return associates
+
+    def __iter__(self):
+        for profileNumber, firstRow in enumerate(self.firstRows):
+            if firstRow >= 0:
+                yield self.profileIds.ids[profileNumber]
+
+    def buildEdges(self, relationCodes):
+        """precompute the relationship type and reciprocal type of every row"""
+        baseTypes = []
+        relTypes = []
+        for code, ex in self.kinds:
+            baseType = relationCodes[code].replace(" ", "_").replace("-", "_")
+            baseTypes.append(baseType)
+            relTypes.append("EX_" + baseType if ex == "Yes" else baseType)
+
+        # --the rows of each profile sorted by associate, first listed first, so
+        # --the reciprocal row of an edge is found in the rows of its associate
+        associateOf = self.associateNumbers.__getitem__
+        rowsByAssociate = array("q", [0]) * len(self.associateNumbers)
+        for profileNumber, firstRow in enumerate(self.firstRows):
+            if firstRow < 0:
+                continue
+            lastRow = firstRow + self.rowCounts[profileNumber]
+            rowsByAssociate[firstRow:lastRow] = array(
+                "q", sorted(range(firstRow, lastRow), key=associateOf)
+            )
+
+        self.edgeTypes = array("i", [0]) * len(self.associateNumbers)
+        for profileNumber, firstRow in enumerate(self.firstRows):
+            if firstRow < 0:
+                continue
+            for row in range(firstRow, firstRow + self.rowCounts[profileNumber]):
+                otherNumber = self.associateNumbers[row]
+                relType = relTypes[self.associateKinds[row]]
+                legacyType = relType
+                otherType = None
+                otherFirst = -1
+                if otherNumber < len(self.firstRows):
+                    otherFirst = self.firstRows[otherNumber]
+                if otherFirst >= 0:
+                    otherLast = otherFirst + self.rowCounts[otherNumber]
+                    position = bisect_left(
+                        rowsByAssociate,
+                        profileNumber,
+                        otherFirst,
+                        otherLast,
+                        key=associateOf,
+                    )
+                    if (
+                        position < otherLast
+                        and associateOf(rowsByAssociate[position]) == profileNumber
+                    ):
+                        otherRow = rowsByAssociate[position]
+                        otherType = baseTypes[self.associateKinds[otherRow]]
+                if otherType and otherType != relType:
+                    legacyType = "/".join(sorted([relType, otherType]))
+                edgeType = (relType, legacyType)
+                edgeTypeNumber = self.edgeTypeNumbers.get(edgeType)
+                if edgeTypeNumber is None:
+                    edgeTypeNumber = self.edgeTypeNumbers[edgeType] = len(
+                        self.edgeTypeNames
+                    )
+                    self.edgeTypeNames.append(edgeType)
+                self.edgeTypes[row] = edgeTypeNumber
+
+    def edges(self, profileId):
+        """yield the associate id, relationship type, legacy type and key of each row"""
+        for row in self.rowRange(profileId) or ():
+            otherId = self.profileIds.ids[self.associateNumbers[row]]
+            relType, legacyType = self.edgeTypeNames[self.edgeTypes[row]]
+            relKey = "-".join(sorted([profileId, otherId]))
+            yield otherId, relType, legacyType, relKey
+
+    def edgeCount(self):
+        """return the number of relationships"""
+        return sum(self.rowCounts)
+
+    def snapshot(self):
+        """return the json fields and binary buffers that save the table"""
+        fields = {
+            "kinds": self.kinds,
+            "edgeTypeNames": self.edgeTypeNames,
+            "profileCount": self.profileCount,
+        }
+        buffers = {
+            "firstRows": self.firstRows,
+            "rowCounts": self.rowCounts,
+            "associateNumbers": self.associateNumbers,
+            "associateKinds": self.associateKinds,
+            "edgeTypes": self.edgeTypes,
+        }
+        return fields, buffers
+
+    def restore(self, fields, buffers):
+        """load the table from the fields and buffers of snapshot()"""
+        self.firstRows = buffers["firstRows"]
+        self.rowCounts = buffers["rowCounts"]
+        self.associateNumbers = buffers["associateNumbers"]
+        self.associateKinds = buffers["associateKinds"]
+        self.edgeTypes = buffers["edgeTypes"]
+        self.kinds = [tuple(kind) for kind in fields["kinds"]]
+        self.kindNumbers = {kind: number for number, kind in enumerate(self.kinds)}
+        self.edgeTypeNames = [tuple(edgeType) for edgeType in fields["edgeTypeNames"]]
+        self.edgeTypeNumbers = {
+            edgeType: number for number, edgeType in enumerate(self.edgeTypeNames)
+        }
+        self.profileCount = fields["profileCount"]
+
+    def footprint(self):
+        """return the approximate bytes used by the table"""
+        return sum(
+            sys.getsizeof(tableArray)
+            for tableArray in (
+                self.firstRows,
+                self.rowCounts,
+                self.associateNumbers,
+                self.associateKinds,
+                self.edgeTypes,
+            )
+        )
+
+
+# ----------------------------------------
+def inputCompression(inputFileName):
+    """return the compression format of a file from its signature"""
+    with open(inputFileName, "rb") as inputFile:
+        signature = inputFile.read(4)
+    for magicBytes, compression in COMPRESSION_SIGNATURES:
+        if signature.startswith(magicBytes):
+            return compression
+    return None
+
+
+# ----------------------------------------
+def openInputStreams(inputFileName, progressMonitor=None):
+    """yield a decompressed stream for each xml document in the input file"""
+    compression = inputCompression(inputFileName)
+    with open(inputFileName, "rb") as inputFile:
+        # --progress is the position in the file as read, compressed or not
+        if progressMonitor:
+            progressMonitor.trackFile(inputFile, os.path.getsize(inputFileName))
+        if compression == "zip":
+            with zipfile.ZipFile(inputFile) as zipFile:
+                members = [
+                    member for member in zipFile.infolist() if not member.is_dir()
+                ]
+                xmlMembers = [
+                    member
+                    for member in members
+                    if member.filename.lower().endswith(".xml")
+                ]
+                for member in xmlMembers or members:
+                    with zipFile.open(member) as inputStream:
+                        yield inputStream
+        elif compression == "gzip":
+            with gzip.GzipFile(fileobj=inputFile, mode="rb") as inputStream:
+                yield inputStream
+        elif compression == "bz2":
+            with bz2.BZ2File(inputFile, "rb") as inputStream:
+                yield inputStream
+        elif compression == "zstd":
+            with zstandard.ZstdDecompressor().stream_reader(inputFile) as inputStream:
+                yield inputStream
+        else:
+            yield inputFile
+
+
+# ----------------------------------------
+def currentRssMb():
+    """return the resident memory of this process in megabytes, if known"""
+    try:
+        with open("/proc/self/statm") as statmFile:
+            residentPages = int(statmFile.read().split()[1])
+        return residentPages * os.sysconf("SC_PAGE_SIZE") / 1048576
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peakRssMb()
+
+
+# ----------------------------------------
+def peakRssMb(who="self"):
+    """return the peak resident memory of this process or its children"""
+    if not resource:
+        return None
+    usage = resource.getrusage(
+        resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN
+    )
+    # --ru_maxrss is in bytes on mac and kilobytes elsewhere
+    if sys.platform == "darwin":
+        return usage.ru_maxrss / 1048576
+    return usage.ru_maxrss / 1024
+
+
+# ----------------------------------------
+def checkMemory(maxRssMb):
+    """return False if memory use is over --max_rss_mb, so the run can stop"""
+    rssMb = currentRssMb()
+    if rssMb is None or rssMb <= maxRssMb:
+        return True
+    print("")
+    print("Memory use of %s MB is over the %s MB limit!" % (round(rssMb), maxRssMb))
+    print("")
+    return False
 
 
 # ----------------------------------------
@@ -100,115 +940,59 @@ def getValue(segment, tagName=None):
 
 
 # ----------------------------------------
-def idNoteParse(notes, codeType):
-
-    # --check if enclosed in parens
-    notes = notes.lower().replace(".", "")
-    groupedStrings = re.findall("\(.*?\)", notes)
-    for maybeCountry in groupedStrings:
-        maybeCountry = maybeCountry[1 : len(maybeCountry) - 1]
-        isoCountry = (
-            baseLibrary.isoCountryCode(maybeCountry)
-            if codeType == "country"
-            else baseLibrary.isoStateCode(maybeCountry)
-        )
-        if isoCountry:
-            return isoCountry
-        elif "," in maybeCountry:
-            countryName = maybeCountry[maybeCountry.find(",") + 1 :].strip()
-            isoCountry = (
-                baseLibrary.isoCountryCode(maybeCountry)
-                if codeType == "country"
-                else baseLibrary.isoStateCode(maybeCountry)
-            )
-            if isoCountry:
-                return isoCountry
+def notesStartWith(notes, text):
+    return notes.startswith(text)
 
-    # --look for various labels
-    tokenList = []
-    if "country of issue:" in notes:
-        tokenList = notes[notes.find("country of issue:") + 17 :].strip().split()
-    else:  # or try the whole string
-        tokenList = notes.strip().split()
-
-    # --if single token (just confirm or deny)
-    if len(tokenList) == 1:
-        if tokenList[0][-1] in (",", ";", ":"):
-            tokenList[0] = tokenList[0][0:-1]
-        maybeCountry = tokenList[0]
-        isoCountry = (
-            baseLibrary.isoCountryCode(maybeCountry)
-            if codeType == "country"
-            else baseLibrary.isoStateCode(maybeCountry)
-        )
-        if isoCountry:
-            return isoCountry
-        else:
-            return None
 
-    priorToken1 = ""
-    priorToken2 = ""
-    priorToken3 = ""
-    maybeCountry = ""
-    for currentToken in tokenList:
-        if currentToken[-1] in (",", ";", ":"):
-            currentToken = currentToken[0:-1]
-
-        maybeCountry = currentToken
-        isoCountry0 = (
-            baseLibrary.isoCountryCode(maybeCountry)
-            if codeType == "country"
-            else baseLibrary.isoStateCode(maybeCountry)
-        )
-        isoCountry1 = None
-        isoCountry2 = None
-        isoCountry3 = None
+# ----------------------------------------
+def notesContain(notes, text):
+    return text in notes.upper()
 
-        if priorToken1:
-            maybeCountry = priorToken1 + " " + currentToken
-            isoCountry1 = (
-                baseLibrary.isoCountryCode(maybeCountry)
-                if codeType == "country"
-                else baseLibrary.isoStateCode(maybeCountry)
-            )
-        if priorToken2:
-            maybeCountry = priorToken2 + " " + priorToken1 + " " + currentToken
-            isoCountry2 = (
-                baseLibrary.isoCountryCode(maybeCountry)
-                if codeType == "country"
-                else baseLibrary.isoStateCode(maybeCountry)
-            )
-        if priorToken3:
-            maybeCountry = (
-                priorToken3 + " " + priorToken2 + " " + priorToken1 + " " + currentToken
-            )
-            isoCountry3 = (
-                baseLibrary.isoCountryCode(maybeCountry)
-                if codeType == "country"
-                else baseLibrary.isoStateCode(maybeCountry)
-            )
 
-        if isoCountry0 and currentToken not in (
-            "id",
-            "in",
-            "is",
-            "on",
-            "no",
-            "and",
-        ):  # --careful of connecting words here!
-            return isoCountry0
-        elif isoCountry1:
-            return isoCountry1
-        elif isoCountry2:
-            return isoCountry2
-        elif isoCountry3:
-            return isoCountry3
-
-        priorToken3 = priorToken2
-        priorToken2 = priorToken1
-        priorToken1 = currentToken
+# ----------------------------------------
+def notesEqual(notes, text):
+    return notes.upper() == text
+
 
-    return None
+# --test of the id notes for each kind of notes match in the id type rules
+NOTES_TESTS = {
+    "startswith": notesStartWith,
+    "contains": notesContain,
+    "equals": notesEqual,
+}
+
+
+# ----------------------------------------
+def compileIdTypeRules(idTypeRules=ID_TYPE_RULES):
+    """index the id type rules by exact id type with a test function for the notes"""
+    exactRules = {}
+    otherRules = []
+    for ruleNum, idTypeRule in enumerate(idTypeRules):
+        typeMatch, notesMatch, attrType1, attrType2, countryCheck = idTypeRule
+        ruleName = attrType1
+        if typeMatch:
+            ruleName += " | type %s %s" % typeMatch
+        if notesMatch:
+            ruleName += " | notes %s %s" % notesMatch
+        notesTest = None
+        notesText = None
+        if notesMatch:
+            notesKind, notesText = notesMatch
+            notesTest = NOTES_TESTS[notesKind]
+        compiledRule = (
+            ruleNum,
+            ruleName,
+            notesTest,
+            notesText,
+            attrType1,
+            attrType2,
+            countryCheck,
+        )
+        if typeMatch and typeMatch[0] == "equals":
+            exactRules.setdefault(typeMatch[1], []).append(compiledRule)
+        else:
+            otherRules.append((typeMatch, compiledRule))
+    return exactRules, otherRules
 
 
 # ----------------------------------------
@@ -225,680 +1009,3101 @@ def concatDateParts(day, month, year):
 
 
 # ----------------------------------------
-def g2Mapping(masterRecord, recordType):
-
-    truncation_list = []
-
-    # --header
-    jsonData = {}
-    jsonData["DATA_SOURCE"] = dataSource
-    jsonData["RECORD_ID"] = masterRecord.attrib["id"]
-
-    jsonData["LAST_UPDATE"] = masterRecord.attrib["date"]
-    jsonData["STATUS"] = getValue(masterRecord, "ActiveStatus")
-    jsonData["DJ_PROFILE_ID"] = masterRecord.attrib["id"]
-
-    gender = getValue(masterRecord, "Gender")
-    if gender:
-        jsonData["GENDER"] = gender
-        updateStat("ATTRIBUTE", "GENDER")
-
-    deceased = getValue(masterRecord, "Deceased")
-    if deceased == "Yes":
-        jsonData["DECEASED"] = deceased
-        updateStat("OTHER", "DECEASED", deceased)
-
-    if extendedFormat:
-        profileNotes = getValue(masterRecord, "ProfileNotes")
-        if profileNotes:
-            jsonData["PROFILE_NOTES"] = profileNotes
-            updateStat("ATTRIBUTE", "PROFILE_NOTES")
-
-    # --names
-    # <NameType NameTypeID="1" RecordType="Person">Primary Name</NameType>
-    # <NameType NameTypeID="2" RecordType="Person">Also Known As</NameType>
-    # <NameType NameTypeID="3" RecordType="Person">Low Quality AKA</NameType>
-    # <NameType NameTypeID="4" RecordType="Person">Maiden Name</NameType>
-    # <NameType NameTypeID="5" RecordType="Person">Formerly Known As</NameType>
-    # <NameType NameTypeID="6" RecordType="Person">Spelling Variation</NameType>
-    # <NameType NameTypeID="7" RecordType="Entity">Primary Name</NameType>
-    # <NameType NameTypeID="8" RecordType="Entity">Also Known As</NameType>
-    # <NameType NameTypeID="9" RecordType="Entity">Formerly Known As</NameType>
-    # <NameType NameTypeID="10" RecordType="Entity">Spelling Variation</NameType>
-    # <NameType NameTypeID="11" RecordType="Entity">Low Quality AKA</NameType>
-    orgPersonNameConflict = False
-    thisList = []
-    for nameRecord in masterRecord.findall("NameDetails/Name"):
-        nameType = nameRecord.attrib["NameType"][0:25]
-        if "PRIMARY" in nameType.upper():
-            nameType = "PRIMARY"
-
-        for nameValue in nameRecord.findall("NameValue"):
-            nameStr = ""
-            name = {}
-            name["NAME_TYPE"] = nameType
-            updateStat("NAME_TYPE", nameType)
-
-            nameOrg = getValue(nameValue, "EntityName")
-            if nameOrg:
-                if len(nameOrg.split()) > 16:
-                    truncation_list.append({"EntityName": nameOrg})
-                    updateStat(
-                        "TRUNCATIONS",
-                        "longNameOrgCnt",
-                        jsonData["RECORD_ID"] + " | " + nameOrg,
-                    )
-                    nameOrg = " ".join(nameOrg.split()[:16])
-                name["NAME_ORG"] = nameOrg
-                nameStr = nameOrg
-
-            nameLast = getValue(nameValue, "Surname")
-            if nameLast:
-                if len(nameLast.split()) > 10:
-                    truncation_list.append({"Surname": nameLast})
-                    updateStat(
-                        "TRUNCATIONS",
-                        "longNameLastCnt",
-                        jsonData["RECORD_ID"] + " | " + nameLast,
-                    )
-                    nameLast = " ".join(nameLast.split()[:10])
-                name["NAME_LAST"] = nameLast
-                nameStr = nameLast
-
-            nameMaiden = getValue(nameValue, "MaidenName")
-            if (
-                nameMaiden and not nameLast
-            ):  # --either Surname or MaidenName will be populated
-                if len(nameMaiden.split()) > 10:
-                    truncation_list.append({"MaidenName": nameMaiden})
-                    updateStat(
-                        "TRUNCATIONS",
-                        "longNameMaidenCnt",
-                        jsonData["RECORD_ID"] + " | " + nameMaiden,
-                    )
-                    nameMaiden = " ".join(nameMaiden.split()[:10])
-                name["NAME_LAST"] = nameMaiden
-                nameStr = nameLast
-
-            nameFirst = getValue(nameValue, "FirstName")
-            if nameFirst:
-                if len(nameFirst.split()) > 10:
-                    truncation_list.append({"FirstName": nameFirst})
-                    updateStat(
-                        "TRUNCATIONS",
-                        "longNameFirstCnt",
-                        jsonData["RECORD_ID"] + " | " + nameFirst,
-                    )
-                    nameFirst = " ".join(nameFirst.split()[:10])
-                name["NAME_FIRST"] = nameFirst
-                nameStr += " " + nameFirst
-
-            nameMiddle = getValue(nameValue, "MiddleName")
-            if nameMiddle:
-                if len(nameMiddle.split()) > 10:
-                    truncation_list.append({"MiddleName": nameMiddle})
-                    updateStat(
-                        "TRUNCATIONS",
-                        "longNameMiddleCnt",
-                        jsonData["RECORD_ID"] + " | " + nameMiddle,
-                    )
-                    nameMiddle = " ".join(nameMiddle.split()[:10])
-                name["NAME_MIDDLE"] = nameMiddle
-                nameStr += " " + nameMiddle
-
-            namePrefix = getValue(nameValue, "TitleHonorific")
-            if namePrefix:
-                name["NAME_PREFIX"] = namePrefix
-            nameSuffix = getValue(nameValue, "Suffix")
-            if nameSuffix:
-                name["NAME_SUFFIX"] = nameSuffix
-
-            thisList.append(name)
-
-            # --check for a name conflict
-            if (recordType == "PERSON" and "NAME_ORG" in name) or (
-                recordType != "PERSON" and "NAME_LAST" in name
-            ):
-                orgPersonNameConflict = True
-
-            # --duplicate this name segment for original script version if supplied
-            originalScriptName = getValue(nameValue, "OriginalScriptName")
-            if originalScriptName:
-                name = {}
-                updateStat("NAME_TYPE", "OriginalScriptName")
-                name["NAME_TYPE"] = "OriginalScriptName"
-                name["NAME_FULL"] = originalScriptName
-                thisList.append(name)
-
-            # --duplicate this name segment for SingleStringName if supplied
-            singleStringName = getValue(nameValue, "SingleStringName")
-            if singleStringName:
-                name = {}
-                updateStat("NAME_TYPE", "singleStringName")
-                name["NAME_TYPE"] = "singleStringName"
-                name["NAME_FULL"] = singleStringName
-                thisList.append(name)
-
-    if thisList:
-        jsonData["NAMES"] = thisList
-    if orgPersonNameConflict:
-        print("warning: person and org names on record %s" % jsonData["RECORD_ID"])
-
-    # --dates
-    # <DateType Id="1" RecordType="Person" name="Date of Birth"/>
-    # <DateType Id="2" RecordType="Person" name="Deceased Date"/>
-    # <DateType Id="3" RecordType="Entity" name="Date of Registration"/>
-    thisList = []
-    for dateRecord in masterRecord.findall("DateDetails/Date"):
-
-        try:
-            dateType = dateRecord.attrib["DateType"]
-        except:  # --all but the anti-corruption (SOC) feed use DateType
-            try:
-                dateType = dateRecord.attrib["DateTypeId"]
-            except:
-                print("bad date record!")
-                print(
-                    minidom.parseString(
-                        etree.tostring(dateRecord, "utf-8")
-                    ).toprettyxml(indent="\t")
-                )
-                continue
+def trifectaFeed(description1Names):
+    """return the data source of the trifecta feed a profile's descriptions are from"""
+    feeds = set()
+    for description1Name in description1Names:
+        for feedDataSource, namePattern in TRIFECTA_FEEDS:
+            if namePattern.search(description1Name):
+                feeds.add(feedDataSource)
+                break
+        else:
+            return "DJ-PFA"
+    for feedDataSource, namePattern in TRIFECTA_FEEDS:
+        if feedDataSource in feeds:
+            return feedDataSource
+    return "DJ-PFA"
 
-        if dateType == "Date of Birth":
-            dateType = "DATE_OF_BIRTH"
-        elif dateType == "Deceased Date":
-            dateType = "DATE_OF_DEATH"
-        elif dateType == "Date of Registration":
-            dateType = "REGISTRATION_DATE"
-
-        for dateValue in dateRecord.findall("DateValue"):
-            day = getAttr(dateValue, "Day")
-            month = getAttr(dateValue, "Month")
-            year = getAttr(dateValue, "Year")
-            thisDate = concatDateParts(day, month, year)
-            if dateType == "DATE_OF_BIRTH":
-                outputFormat = "%Y-%m-%d"
-                if not day and not month:
-                    updateStat("DOB_DATA", "year only", thisDate)
-                elif year and month and not day:
-                    updateStat("DOB_DATA", "year/month only", thisDate)
-                elif month and day and not year:
-                    updateStat("DOB_DATA", "month/day only", thisDate)
-                else:
-                    updateStat("DOB_DATA", "full", thisDate)
 
-                formattedDate = baseLibrary.formatDate(thisDate)
-                if formattedDate:
-                    thisList.append({dateType: formattedDate})
-            else:
-                jsonData[dateType] = thisDate
-            updateStat("ATTRIBUTE", dateType, thisDate)
-    if thisList:
-        jsonData["DATES"] = thisList
-
-    # --addresses
-    thisList = []
-    for addrRecord in masterRecord.findall("Address"):
-        address = {}
-        addrLine = getValue(addrRecord, "AddressLine")
-        if addrLine:
-            if len(addrLine.split()) > 16:
-                truncation_list.append({"AddressLine": addrLine})
-                updateStat(
-                    "TRUNCATIONS",
-                    "longAddrLineCnt",
-                    jsonData["RECORD_ID"] + " | " + addrLine,
-                )
-                addrLine = " ".join(addrLine.split()[:16])
-            address["ADDR_LINE1"] = addrLine
-        addrCity = getValue(addrRecord, "AddressCity")
-        if addrCity:
-            address["ADDR_CITY"] = addrCity
-        addrCountry = getValue(addrRecord, "AddressCountry")
-        if addrCountry:
-            address["ADDR_COUNTRY"] = (
-                countryCodes[addrCountry]
-                if addrCountry in countryCodes
-                else addrCountry
+# ----------------------------------------
+class DowJonesMapper:
+    """map a Dow Jones file to Senzing json records with its own reference tables
+
+    Call build_references() with the file first, then iterate map_records() over
+    it. Each mapper keeps its own options, tables and statistics, so several can
+    be used at once. The options are keyword arguments only.
+    """
+
+    def __init__(
+        self,
+        *,
+        data_source="DJ-PFA",
+        relationship_style=2,
+        extended_format=False,
+        parser="auto",
+        json_encoder="auto",
+        stats_mode="full",
+        split_feeds=False,
+        use_snapshot=False,
+        max_rss_mb=0,
+        profiler=None,
+        progress_monitor=None,
+    ):
+        if parser == "auto":
+            parser = "etree"
+        elif parser == "lxml" and lxmlEtree is None:
+            raise ValueError(
+                "The lxml parser is not installed, please pip install lxml"
             )
-            isoCountry = baseLibrary.isoCountryCode(address["ADDR_COUNTRY"])
-            if isoCountry:
-                address["ADDR_COUNTRY"] = isoCountry
-
-        thisList.append(address)
-        updateStat("ADDRESS", "UNTYPED")
-
-    if thisList:
-        jsonData["ADDRESSES"] = thisList
-
-    # --company details (address/website)
-    thisList1 = []
-    thisList2 = []
-    for addrRecord in masterRecord.findall("CompanyDetails"):
-        address = {}
-        address["ADDR_TYPE"] = "BUSINESS"
-        addrLine = getValue(addrRecord, "AddressLine")
-        if addrLine:
-            if len(addrLine.split()) > 16:
-                updateStat("TRUNCATIONS", "longAddrLineCnt", addrLine)
-                addrLine = " ".join(addrLine.split()[:16])
-            address["ADDR_LINE1"] = addrLine
-        addrCity = getValue(addrRecord, "AddressCity")
-        if addrCity:
-            address["ADDR_CITY"] = addrCity
-        addrCountry = getValue(addrRecord, "AddressCountry")
-        if addrCountry:
-            address["ADDR_COUNTRY"] = (
-                countryCodes[addrCountry]
-                if addrCountry in countryCodes
-                else addrCountry
+        if json_encoder == "auto":
+            json_encoder = "orjson" if orjson is not None else "json"
+        elif json_encoder == "orjson" and orjson is None:
+            raise ValueError(
+                "The orjson encoder is not installed, please pip install orjson"
             )
-            isoCountry = baseLibrary.isoCountryCode(address["ADDR_COUNTRY"])
-            if isoCountry:
-                address["ADDR_COUNTRY"] = isoCountry
-
-        thisList1.append(address)
-        updateStat("ADDRESS", "BUSINESS")
-
-        url = getValue(addrRecord, "URL")
-        if url:
-            thisList2.append({"WEBSITE_ADDRESS": url})
-            updateStat("ATTRIBUTE", "WEBSITE_ADDRESS")
-
-    if thisList1:
-        jsonData["COMPANY_ADDRESSES"] = thisList1
-    if thisList2:
-        jsonData["COMPANY_WEBSITES"] = thisList2
-
-    # --countries
-    thisList1 = []
-    for birthPlaceRecord in masterRecord.findall("BirthPlace/Place"):
-        birthPlace = birthPlaceRecord.attrib["name"]
-        thisList1.append({"PLACE_OF_BIRTH": birthPlace})
-        updateStat("ATTRIBUTE", "PLACE_OF_BIRTH")
-
-    for countryRecord in masterRecord.findall("CountryDetails/Country"):
-        countryType = countryRecord.attrib["CountryType"]
-        if countryType == "Citizenship":
-            attributeType = "CITIZENSHIP"
-        else:
-            if countryType == "REGISTRATION":
-                usageType = "REGISTRATION"
-            elif countryType == "Resident of":
-                usageType = "RESIDENT"
-            elif countryType == "Jurisdiction":
-                usageType = "JURISDICTION"
-            elif countryType == "Country of Affiliation":
-                usageType = "AFFILIATED"
-            elif countryType == "Enhanced Risk Country":
-                usageType = "RISK"
-            else:
-                usageType = "OTHER"
-            attributeType = usageType + "_COUNTRY_OF_ASSOCIATION"
 
-        itemNum = 0
-        for countryValue in countryRecord.findall("CountryValue"):
-            countryCode = countryValue.attrib["Code"]
-            countryName = (
-                countryCodes[countryCode]
-                if countryCode in countryCodes
-                else countryCode
+        self.dataSource = (data_source or "DJ-PFA").upper()
+        self.relationshipStyle = relationship_style
+        self.extendedFormat = extended_format
+        # --deprecated arguments
+        self.noRelationships = False
+        self.addCompositeKeys = False
+        # --a single pass adds the relationships once the whole file has been read
+        self.deferRelationships = False
+        self.parserBackend = parser
+        self.jsonEncoder = json_encoder
+        self.statsMode = stats_mode
+        self.splitFeeds = split_feeds
+        self.useSnapshot = use_snapshot
+        self.maxRssMb = max_rss_mb
+        # --set when memory goes over the limit, or by the caller to stop mapping
+        self.stopped = False
+        self.profiler = profiler
+        self.progressMonitor = progress_monitor
+        self.progressInterval = 10000
+        self.stats = StatCollector(stats_mode)
+        self.stats.process["PARSER_BACKEND"] = parser
+        self.stats.process["JSON_ENCODER"] = json_encoder
+        self.idNoteCache = BoundedCache(ISO_CACHE_SIZE)
+        self.isoPhraseCache = BoundedCache(ISO_CACHE_SIZE)
+        self.idTypeRuleIndex = compileIdTypeRules()
+        self.idTypeRuleCache = BoundedCache(ID_TYPE_CACHE_SIZE)
+        # --the workers return the query attributes of the records when indexing
+        self.indexAttributes = False
+        self.countryAliases = {}
+        self.countryAliasCount = 0
+        self.resetReferenceTables()
+
+    def resetReferenceTables(self):
+        """start with empty reference tables for the first pass to fill"""
+        self.countryCodes = {}
+        self.countryIsoCodes = {}
+        self.description1Codes = {}
+        self.description2Codes = {}
+        self.description3Codes = {}
+        self.referenceCodes = {}
+        self.relationCodes = {}
+        self.profileIds = ProfileIdTable()
+        self.relationships = AssociateTable(self.profileIds)
+        self.entityNames = ProfileValueTable(self.profileIds)
+        self.entityDuns = ProfileValueTable(self.profileIds)
+
+    def getReferenceTables(self, tableNames=REFERENCE_TABLES):
+        """return the reference tables built by the first pass"""
+        return {tableName: getattr(self, tableName) for tableName in tableNames}
+
+    def iterInputElements(self, inputFileName, tags):
+        """yield the elements with one of the tags from every document in the input"""
+        for inputStream in openInputStreams(inputFileName, self.progressMonitor):
+            yield from self.iterElements(inputStream, tags)
+
+    def iterSourceElements(self, source, tags):
+        """yield the elements with one of the tags from a file name or a binary stream"""
+        if isinstance(source, (str, os.PathLike)):
+            return self.iterInputElements(os.fspath(source), tags)
+        return self.iterElements(source, tags)
+
+    def iterElements(self, source, tags):
+        """yield each element with one of the tags once its end tag has been read
+
+        Elements are detached from the tree once they have been processed and the
+        other sections of the file are cleared as they end, so memory stays flat
+        however large the file is.
+        """
+        streamTags = set(tags) | set(REFERENCE_TAGS)
+        nodeCount = 0
+        if self.parserBackend == "lxml":
+            for event, node in lxmlEtree.iterparse(
+                source, events=("end",), tag=streamTags, huge_tree=True
+            ):
+                if node.tag in tags:
+                    yield node
+                else:
+                    node.clear()
+                while node.getprevious() is not None:
+                    del node.getparent()[0]
+                nodeCount += 1
+                if (
+                    self.maxRssMb
+                    and nodeCount % 10000 == 0
+                    and not checkMemory(self.maxRssMb)
+                ):
+                    self.stopped = True
+                    return
+        else:
+            # --the parser reads ahead of the events, so the parent each element was
+            # --read into is tracked from the start and end events
+            pullParser = etree.XMLPullParser(events=("start", "end"))
+            parents = []
+            while True:
+                xmlData = source.read(64 * 1024)
+                if xmlData:
+                    pullParser.feed(xmlData)
+                else:
+                    pullParser.close()
+                for event, node in pullParser.read_events():
+                    if event == "start":
+                        parents.append(node)
+                        continue
+                    parents.pop()
+                    if node.tag not in streamTags:
+                        continue
+                    if node.tag in tags:
+                        yield node
+                    else:
+                        node.clear()
+                    if parents:
+                        parents[-1].remove(node)
+                    nodeCount += 1
+                    if (
+                        self.maxRssMb
+                        and nodeCount % 10000 == 0
+                        and not checkMemory(self.maxRssMb)
+                    ):
+                        self.stopped = True
+                        return
+                if not xmlData:
+                    break
+
+    def parseElement(self, xmlData):
+        """parse a single element from an xml string"""
+        if self.parserBackend == "lxml":
+            return lxmlEtree.fromstring(xmlData, lxmlEtree.XMLParser(huge_tree=True))
+        return etree.fromstring(xmlData)
+
+    def prettyXml(self, node):
+        """format an element for debug display"""
+        if self.parserBackend == "lxml":
+            xmlString = lxmlEtree.tostring(node, encoding="utf-8")
+        else:
+            xmlString = etree.tostring(node, "utf-8")
+        return minidom.parseString(xmlString).toprettyxml(indent="\t")
+
+    def jsonBytes(self, jsonData, newline=False):
+        """serialize to compact utf-8 json, the same bytes whichever encoder is used"""
+        if self.jsonEncoder == "orjson":
+            return orjson.dumps(
+                jsonData, option=orjson.OPT_APPEND_NEWLINE if newline else 0
+            )
+        jsonString = json.dumps(jsonData, ensure_ascii=False, separators=(",", ":"))
+        return (jsonString + "\n" if newline else jsonString).encode("utf-8")
+
+    def isoLookup(self, maybeCountry, codeType):
+        """look up a country or state phrase, remembering the answer"""
+        cacheKey = (maybeCountry, codeType)
+        isoCode = self.isoPhraseCache.get(cacheKey)
+        if isoCode is BoundedCache.MISSING:
+            isoCode = (
+                baseLibrary.isoCountryCode(maybeCountry)
+                if codeType == "country"
+                else baseLibrary.isoStateCode(maybeCountry)
             )
-            isoCountry = baseLibrary.isoCountryCode(countryName)
+            self.isoPhraseCache.put(cacheKey, isoCode)
+        return isoCode
+
+    def idNoteParse(self, notes, codeType):
+        """return the country or state in id notes, which repeat across profiles"""
+        cacheKey = (notes, codeType)
+        isoCode = self.idNoteCache.get(cacheKey)
+        if isoCode is BoundedCache.MISSING:
+            isoCode = self.parseIdNotes(notes, codeType)
+            self.idNoteCache.put(cacheKey, isoCode)
+        return isoCode
+
+    def parseIdNotes(self, notes, codeType):
+
+        # --check if enclosed in parens
+        notes = notes.lower().replace(".", "")
+        for maybeCountry in ID_NOTE_GROUP_REGEX.findall(notes):
+            maybeCountry = maybeCountry[1:-1]
+            isoCountry = self.isoLookup(maybeCountry, codeType)
             if isoCountry:
-                countryName = isoCountry
-
-            thisList1.append({attributeType: countryName})
-            updateStat("COUNTRIES", attributeType, countryName)
-
-    if thisList1:
-        jsonData["COUNTRIES"] = thisList1
-
-    # --identifiers
-    itemNum = 0
-    thisList = []
-    for idRecord in masterRecord.findall("IDNumberTypes/ID"):
-        idType = idRecord.attrib["IDType"]
-        for idValue in idRecord.findall("IDValue"):
-            idNumber = getValue(idValue)
-            idNotes = getAttr(idValue, "IDnotes")
-            if not idNotes:
-                idNotes = ""
-
-            attrType1 = None
-            attrType2 = None
-            countryCheck = 0
-
-            if idType.upper() == "SOCIAL SECURITY NO.":
-                attrType1 = "SSN_NUMBER"
-            elif idType.upper() == "PASSPORT NO.":
-                attrType1 = "PASSPORT_NUMBER"
-                attrType2 = "PASSPORT_COUNTRY"
-                countryCheck = 1
-            elif idType.upper() == "DRIVING LICENSE NO.":
-                attrType1 = "DRIVERS_LICENSE_NUMBER"
-                attrType2 = "DRIVERS_LICENSE_STATE"
-                countryCheck = 2
-            elif idType.upper() == "NATIONAL ID":
-                attrType1 = "NATIONAL_ID_NUMBER"
-                attrType2 = "NATIONAL_ID_COUNTRY"
-                countryCheck = 1
-            elif idType.upper() == "NATIONAL TAX NO.":
-                attrType1 = "TAX_ID_NUMBER"
-                attrType2 = "TAX_ID_COUNTRY"
-                countryCheck = 1
-            elif idType.upper() == "COMPANY IDENTIFICATION NO.":
-                attrType1 = "COMPANY_ID_NUMBER"
-                attrType2 = "COMPANY_ID_COUNTRY"
-                countryCheck = 1
-            elif idType.upper() == "DUNS NUMBER":
-                attrType1 = "DUNS_NUMBER"
-            elif idType.upper() == "OFAC UNIQUE ID":
-                attrType1 = "OFAC_ID"
-            elif (
-                idType.upper() == "NATIONAL PROVIDER IDENTIFIER (NPI)"
-                or idNotes.startswith("NPI")
-                or "(NPI)" in idNotes.upper()
-            ):
-                attrType1 = "NPI_NUMBER"
-            elif idType.upper() == "LEGAL ENTITY IDENTIFIER (LEI)":
-                attrType1 = "LEI_NUMBER"
-            elif (
-                idType.upper() == "NATIONAL CRIMINAL IDENTIFICATION CODE (USA)"
-                or "(NCIC)" in idNotes.upper()
-            ):
-                attrType1 = "NCIC_NUMBER"
-            elif idType.upper() == "CENTRAL REGISTRATION DEPOSITORY (CRD)":
-                attrType1 = "CRD_NUMBER"
-            elif idType.upper() == "INTERNATIONAL MARITIME ORGANIZATION (IMO) SHIP NO.":
-                attrType1 = "IMO_NUMBER"
-            elif (
-                idType.upper()
-                == "INTERNATIONAL SECURITIES IDENTIFICATION NUMBER (ISIN)"
-            ):
-                attrType1 = "ISIN_NUMBER"
-            elif idType.upper() == "MSB LICENSE NUMBER":
-                attrType1 = "MSB_LICENSE_NUMBER"
-            elif idType.upper() == "MARIJUANA LICENSE NUMBER":
-                attrType1 = "MARIJUANA_LICENSE_NUMBER"
-            elif idType.upper() == "OTHERS" and idNotes.upper() == "MMSI":
-                attrType1 = "MMSI_NUMBER"
-            elif "(MSN)" in idType.upper():
-                attrType1 = "AIRCRAFT_MFG_SERIAL_NUM"
-            elif (
-                idType.upper() == "OTHERS" and "AIRCRAFT TAIL NUMBER" in idNotes.upper()
-            ):
-                attrType1 = "AIRCRAFT_TAIL_NUMBER"
-            else:
-                attrType1 = None
+                return isoCountry
+            elif "," in maybeCountry:
+                countryName = maybeCountry[maybeCountry.find(",") + 1 :].strip()
+                isoCountry = self.isoLookup(maybeCountry, codeType)
+                if isoCountry:
+                    return isoCountry
+
+        # --look for various labels
+        tokenList = []
+        if "country of issue:" in notes:
+            tokenList = notes[notes.find("country of issue:") + 17 :].strip().split()
+        else:  # or try the whole string
+            tokenList = notes.strip().split()
+
+        # --if single token (just confirm or deny)
+        if len(tokenList) == 1:
+            if tokenList[0][-1] in (",", ";", ":"):
+                tokenList[0] = tokenList[0][0:-1]
+            return self.isoLookup(tokenList[0], codeType) or None
+
+        # --try each token and the phrases of up to 4 tokens ending with it
+        priorTokens = []
+        for currentToken in tokenList:
+            if currentToken[-1] in (",", ";", ":"):
+                currentToken = currentToken[0:-1]
+
+            # --careful of connecting words here!
+            if currentToken not in ID_NOTE_CONNECTING_WORDS:
+                isoCountry = self.isoLookup(currentToken, codeType)
+                if isoCountry:
+                    return isoCountry
+            maybeCountry = currentToken
+            for priorToken in reversed(priorTokens):
+                maybeCountry = priorToken + " " + maybeCountry
+                if priorToken:
+                    isoCountry = self.isoLookup(maybeCountry, codeType)
+                    if isoCountry:
+                        return isoCountry
+
+            priorTokens.append(currentToken)
+            if len(priorTokens) > 3:
+                del priorTokens[0]
+
+        return None
+
+    def resolveCountryCode(self, countryCode):
+        """map a dow jones country code to its iso code, or its name if there is none"""
+        countryName = self.countryCodes.get(countryCode, countryCode)
+        isoCountry = baseLibrary.isoCountryCode(countryName)
+        self.countryIsoCodes[countryCode] = isoCountry or countryName
+        return self.countryIsoCodes[countryCode]
+
+    def getIdTypeRules(self, idType):
+        """return the rules that can apply to an id type in order of precedence"""
+        idTypeUpper = idType.upper()
+        idTypeRules = self.idTypeRuleCache.get(idTypeUpper)
+        if idTypeRules is BoundedCache.MISSING:
+            idTypeRules = self.findIdTypeRules(idTypeUpper)
+            self.idTypeRuleCache.put(idTypeUpper, idTypeRules)
+        return idTypeRules
+
+    def findIdTypeRules(self, idTypeUpper):
+        """return the rules that can apply to an upper case id type, in order"""
+        exactRules, otherRules = self.idTypeRuleIndex
+        candidates = list(exactRules.get(idTypeUpper, []))
+        for typeMatch, compiledRule in otherRules:
+            if not typeMatch or typeMatch[1] in idTypeUpper:
+                candidates.append(compiledRule)
+        candidates.sort()
+        return [compiledRule[1:] for compiledRule in candidates]
+
+    def loadReferenceNode(self, node):
+        """load a code list, association or entity name into the reference tables"""
+        if node.tag == "CountryList":
+            print("loading %s ..." % node.tag)
+            for record in node.findall("CountryName"):
+                self.countryCodes[getAttr(record, "code")] = getAttr(record, "name")
+            for countryCode, countryName in self.countryCodes.items():
+                if self.resolveCountryCode(countryCode) == countryName:
+                    self.stats.update(
+                        "COUNTRY_CODES",
+                        "unresolved",
+                        "%s | %s" % (countryCode, countryName),
+                    )
+                else:
+                    self.stats.update("COUNTRY_CODES", "resolved")
+            node.clear()
 
-            # --if mapped
-            if attrType1:
+        elif node.tag == "Description1List":
+            print("loading %s ..." % node.tag)
+            for record in node.findall("Description1Name"):
+                self.description1Codes[getAttr(record, "Description1Id")] = getValue(
+                    record
+                )
+            node.clear()
 
-                # --parse notes for a country or state code
-                isoCode = None
-                if idNotes:
+        elif node.tag == "Description2List":
+            print("loading %s ..." % node.tag)
+            for record in node.findall("Description2Name"):
+                self.description2Codes[getAttr(record, "Description2Id")] = getValue(
+                    record
+                )
+            node.clear()
 
-                    # --try for country code
-                    if countryCheck:
-                        isoCode = idNoteParse(idNotes, "country")
+        elif node.tag == "Description3List":
+            print("loading %s ..." % node.tag)
+            for record in node.findall("Description3Name"):
+                self.description3Codes[getAttr(record, "Description3Id")] = getValue(
+                    record
+                )
+            node.clear()
 
-                    # --try for US state code
-                    if countryCheck == 2 and (isoCode in ("USA", "US") or not isoCode):
-                        isoCode = idNoteParse(idNotes, "state")
+        elif node.tag == "SanctionsReferencesList":
+            print("loading %s ..." % node.tag)
+            for record in node.findall("ReferenceName"):
+                self.referenceCodes[getAttr(record, "code")] = getAttr(record, "name")
+            node.clear()
 
-                # --create the identity structure
-                idDict = {}
-                idDict[attrType1] = idNumber
-                if (
-                    attrType2 and isoCode
-                ):  # --the notes should contain a country or a state
-                    idDict[attrType2] = isoCode
-                thisList.append(idDict)
-                updateStat("ID_TYPE", "%s | %s" % (attrType1, isoCode), idNumber)
+        elif node.tag == "RelationshipList":
+            print("loading %s ..." % node.tag)
+            for record in node.findall("Relationship"):
+                try:
+                    self.relationCodes[getAttr(record, "code")] = getAttr(
+                        record, "name"
+                    ).replace("_", "-")
+                except:  # --all but the anti-corruption (soc) feed use the name attribute
+                    try:
+                        self.relationCodes[getAttr(record, "code")] = getValue(
+                            record
+                        ).replace("_", "-")
+                    except:
+                        print(self.prettyXml(record))
+            node.clear()
 
-            # --un-mapped
-            else:
-                updateStat("UNKNOWN", "%s | %s" % (idType, idNotes), idNumber)
-                itemNum += 1
-                jsonData["ID%s" % itemNum] = (
-                    idType + " = " + idNumber + ((" " + idNotes) if idNotes else "")
-                )
+        elif node.tag in ASSOCIATION_TAGS:
+            if not self.relationships:
+                print("loading Associations ...")
+            self.relationships[getAttr(node, "id")] = [
+                {
+                    "id": getAttr(record1, "id"),
+                    "code": getAttr(record1, "code"),
+                    "ex": getAttr(record1, "ex"),
+                }
+                for record1 in node.findall("Associate")
+            ]
+            node.clear()
 
-    if thisList:
-        jsonData["IDENTIFIERS"] = thisList
+        elif node.tag == "Entity":
+            id = getAttr(node, "id")
+            for nameRecord in node.findall("NameDetails/Name"):
+                if nameRecord.attrib["NameType"] == "Primary Name":
+                    for nameValue in nameRecord.findall("NameValue"):
+                        nameOrg = getValue(nameValue, "EntityName")
+                        if nameOrg:
+                            self.entityNames[id] = nameOrg
+                            break
+                    break
+            for idRecord in node.findall("IDNumberTypes/ID"):
+                if idRecord.attrib["IDType"] == "DUNS Number":
+                    for idValue in idRecord.findall("IDValue"):
+                        idNumber = getValue(idValue)
+                        if idNumber:
+                            self.entityDuns[id] = idNumber
+                            break
+                    break
 
-    # --descriptions
-    itemNum = 0
-    for descriptionRecord in masterRecord.findall("Descriptions/Description"):
-        description1Code = None
-        description2Code = None
-        description3Code = None
-        try:
-            description1 = "%s=%s" % (
-                descriptionRecord.attrib["Description1"],
-                description1Codes[descriptionRecord.attrib["Description1"]],
-            )
-            description1Code = descriptionRecord.attrib["Description1"]
-        except:
-            description1 = ""
-        try:
-            description2 = "%s=%s" % (
-                descriptionRecord.attrib["Description2"],
-                description2Codes[descriptionRecord.attrib["Description2"]],
-            )
-            description2Code = descriptionRecord.attrib["Description2"]
-        except:
-            description2 = ""
-        try:
-            description3 = "%s=%s" % (
-                descriptionRecord.attrib["Description3"],
-                description3Codes[descriptionRecord.attrib["Description3"]],
-            )
-            description3Code = description3Codes[
-                descriptionRecord.attrib["Description3"]
-            ].upper()
-        except:
-            description3 = ""
-        if description1 or description2 or description3:
-            itemNum += 1
-            description = description1
-            description += (" | " if description2 else "") + description2
-            description += (" | " if description3 else "") + description3
-            jsonData["Description%s" % itemNum] = description
-            updateStat("DESCRIPTIONS", description, jsonData["RECORD_ID"])
-
-        # --record type reclassifications
-        if description3Code == "SHIP":
-            recordType = "VESSEL"
-        if description3Code == "AIRCRAFT":
-            recordType = "AIRCRAFT"
-
-    # --roles
-    for roleRecord in masterRecord.findall("RoleDetail/Roles"):
-        itemNum = 0
-        roleType = roleRecord.attrib["RoleType"]
-        for occTitle in roleRecord.findall("OccTitle"):
-            itemNum += 1
-            fromDate = concatDateParts(
-                getAttr(occTitle, "SinceDay"),
-                getAttr(occTitle, "SinceMonth"),
-                getAttr(occTitle, "SinceYear"),
-            )
-            thruDate = concatDateParts(
-                getAttr(occTitle, "ToDay"),
-                getAttr(occTitle, "ToMonth"),
-                getAttr(occTitle, "ToYear"),
-            )
-            thisRole = getValue(occTitle)
-            if fromDate:
-                thisRole += " From " + fromDate
-            if thruDate:
-                thisRole += " To " + thruDate
-            jsonData[roleType + str(itemNum)] = thisRole
-            updateStat("OTHER", "ROLES", thisRole)
-
-    # --references
-    itemNum = 0
-    for referenceRecord in masterRecord.findall("SanctionsReferences/Reference"):
-        itemNum += 1
-        referenceName = "%s=%s" % (
-            getValue(referenceRecord),
-            referenceCodes[getValue(referenceRecord)],
-        )
-        fromDate = concatDateParts(
-            getAttr(referenceRecord, "SinceDay"),
-            getAttr(referenceRecord, "SinceMonth"),
-            getAttr(referenceRecord, "SinceYear"),
-        )
-        thruDate = concatDateParts(
-            getAttr(referenceRecord, "ToDay"),
-            getAttr(referenceRecord, "ToMonth"),
-            getAttr(referenceRecord, "ToYear"),
-        )
-        if fromDate:
-            referenceName += " From " + fromDate
-        if thruDate:
-            referenceName += " To " + thruDate
-        jsonData["Reference%s" % itemNum] = referenceName
-        updateStat("OTHER", "REFERENCES", referenceName)
-
-    # --sources
-    if extendedFormat:  # --disabled to keep reports smaller
-        itemNum = 0
-        for sourceRecord in masterRecord.findall("SourceDescription/Source"):
-            itemNum += 1
-            sourceName = sourceRecord.attrib["name"]
-            updateStat("OTHER", "SOURCES")
-            jsonData["Source%s" % itemNum] = sourceName
+            node.clear()
 
-    # --images
-    if extendedFormat:  # --disabled to keep reports smaller
-        itemNum = 0
-        for imageRecord in masterRecord.findall("Images/Image"):
-            itemNum += 1
-            imageURL = imageRecord.attrib["URL"]
-            # --updateStat('source-' + sourceName) <--too many of these to log
-            jsonData["Image%s" % itemNum] = imageURL
-
-    # --disclosed relationships
-    thisList = []
-    thisId = jsonData["DJ_PROFILE_ID"]
-    if thisId in relationships:
-
-        if relationshipStyle == 2:
-            thisRecord = {}
-            thisRecord["REL_ANCHOR_DOMAIN"] = "DJ_ID"
-            thisRecord["REL_ANCHOR_KEY"] = thisId
-            thisList.append(thisRecord)
-
-        for relationship in relationships[thisId]:
-            otherId = relationship["id"]
-            relType = (
-                relationCodes[relationship["code"]].replace(" ", "_").replace("-", "_")
-            )
-            if relationship["ex"] == "Yes":
-                relType = "EX_" + relType
-
-            thisRecord = {}
-            if noRelationships:
-                thisRecord["Related to"] = "%s | %s | %s" % (
-                    dataSource,
-                    otherId,
-                    relType,
-                )
+        elif node.tag == "Person":
+            node.clear()
 
-            # --new relationship strategy
-            elif relationshipStyle == 2:
-                thisRecord["REL_POINTER_DOMAIN"] = "DJ_ID"
-                thisRecord["REL_POINTER_KEY"] = otherId
-                thisRecord["REL_POINTER_ROLE"] = relType
-            else:
+        else:
+            return False
 
-                # --get other side
-                relType1 = None
-                if otherId in relationships:
-                    for relationship1 in relationships[otherId]:
-                        if relationship1["id"] == thisId:
-                            relType1 = (
-                                relationCodes[relationship1["code"]]
-                                .replace(" ", "_")
-                                .replace("-", "_")
-                            )
-                            break
-                relKey = "-".join(sorted([thisId, otherId]))
-                if relType1 and relType1 != relType:
-                    relType = "/".join(sorted([relType, relType1]))
+        return True
 
-                # --create the relationship
-                thisRecord["RELATIONSHIP_TYPE"] = relType
-                thisRecord["RELATIONSHIP_KEY"] = relKey
+    def buildRelationshipEdges(self):
+        """precompute the type, reciprocal type and key of every relationship"""
+        self.relationships.buildEdges(self.relationCodes)
+        self.stats.process["RELATIONSHIP_EDGES"] = self.relationships.edgeCount()
 
-            updateStat("RELATIONSHIPS", relType)
-            thisList.append(thisRecord)
+    def mapRelationships(self, thisId, recordType):
+        """map the disclosed relationships and group associations of a profile"""
+        thisList = []
+        if thisId in self.relationships:
 
-            # --group association name
-            if recordType == "PERSON" and relationship["id"] in entityNames:
+            if self.relationshipStyle == 2:
                 thisRecord = {}
-                # thisRecord[relType + '_GROUP_ASSOCIATION_TYPE'] = 'ORG'
-                thisRecord[relType + "_GROUP_ASSOCIATION_ORG_NAME"] = entityNames[
-                    relationship["id"]
-                ]
+                thisRecord["REL_ANCHOR_DOMAIN"] = "DJ_ID"
+                thisRecord["REL_ANCHOR_KEY"] = thisId
                 thisList.append(thisRecord)
-                updateStat("GROUP_ASSOCIATION", "NAME", relType)
 
-            # --group association IDs
-            if recordType == "PERSON" and relationship["id"] in entityDuns:
+            for otherId, relType, legacyType, relKey in self.relationships.edges(
+                thisId
+            ):
                 thisRecord = {}
-                thisRecord[relType + "_GROUP_ASSN_ID_TYPE"] = "DUNS"
-                thisRecord[relType + "_GROUP_ASSN_ID_NUMBER"] = entityDuns[
-                    relationship["id"]
-                ]
+                if self.noRelationships:
+                    thisRecord["Related to"] = "%s | %s | %s" % (
+                        self.dataSource,
+                        otherId,
+                        relType,
+                    )
+
+                # --new relationship strategy
+                elif self.relationshipStyle == 2:
+                    thisRecord["REL_POINTER_DOMAIN"] = "DJ_ID"
+                    thisRecord["REL_POINTER_KEY"] = otherId
+                    thisRecord["REL_POINTER_ROLE"] = relType
+                else:
+                    relType = legacyType
+                    thisRecord["RELATIONSHIP_TYPE"] = relType
+                    thisRecord["RELATIONSHIP_KEY"] = relKey
+
+                self.stats.update("RELATIONSHIPS", relType)
                 thisList.append(thisRecord)
-                updateStat("GROUP_ASSOCIATION", "DUNS", relType)
 
-    if thisList:
-        jsonData["RELATIONSHIPS"] = thisList
+                # --group association name
+                if recordType == "PERSON" and otherId in self.entityNames:
+                    thisRecord = {}
+                    # thisRecord[relType + '_GROUP_ASSOCIATION_TYPE'] = 'ORG'
+                    thisRecord[relType + "_GROUP_ASSOCIATION_ORG_NAME"] = (
+                        self.entityNames[otherId]
+                    )
+                    thisList.append(thisRecord)
+                    self.stats.update("GROUP_ASSOCIATION", "NAME", relType)
+
+                # --group association IDs
+                if recordType == "PERSON" and otherId in self.entityDuns:
+                    thisRecord = {}
+                    thisRecord[relType + "_GROUP_ASSN_ID_TYPE"] = "DUNS"
+                    thisRecord[relType + "_GROUP_ASSN_ID_NUMBER"] = self.entityDuns[
+                        otherId
+                    ]
+                    thisList.append(thisRecord)
+                    self.stats.update("GROUP_ASSOCIATION", "DUNS", relType)
+
+        return thisList
+
+    def g2Mapping(self, masterRecord, recordType):
+
+        if self.profiler:
+            self.profiler.startRecord()
+        truncation_list = []
+
+        # --header
+        jsonData = {}
+        jsonData["DATA_SOURCE"] = self.dataSource
+        jsonData["RECORD_ID"] = masterRecord.attrib["id"]
+
+        jsonData["LAST_UPDATE"] = masterRecord.attrib["date"]
+        jsonData["STATUS"] = getValue(masterRecord, "ActiveStatus")
+        jsonData["DJ_PROFILE_ID"] = masterRecord.attrib["id"]
+
+        gender = getValue(masterRecord, "Gender")
+        if gender:
+            jsonData["GENDER"] = gender
+            self.stats.update("ATTRIBUTE", "GENDER")
+
+        deceased = getValue(masterRecord, "Deceased")
+        if deceased == "Yes":
+            jsonData["DECEASED"] = deceased
+            self.stats.update("OTHER", "DECEASED", deceased)
+
+        if self.extendedFormat:
+            profileNotes = getValue(masterRecord, "ProfileNotes")
+            if profileNotes:
+                jsonData["PROFILE_NOTES"] = profileNotes
+                self.stats.update("ATTRIBUTE", "PROFILE_NOTES")
+
+        if self.profiler:
+            self.profiler.lap("header")
+
+        # --names
+        # <NameType NameTypeID="1" RecordType="Person">Primary Name</NameType>
+        # <NameType NameTypeID="2" RecordType="Person">Also Known As</NameType>
+        # <NameType NameTypeID="3" RecordType="Person">Low Quality AKA</NameType>
+        # <NameType NameTypeID="4" RecordType="Person">Maiden Name</NameType>
+        # <NameType NameTypeID="5" RecordType="Person">Formerly Known As</NameType>
+        # <NameType NameTypeID="6" RecordType="Person">Spelling Variation</NameType>
+        # <NameType NameTypeID="7" RecordType="Entity">Primary Name</NameType>
+        # <NameType NameTypeID="8" RecordType="Entity">Also Known As</NameType>
+        # <NameType NameTypeID="9" RecordType="Entity">Formerly Known As</NameType>
+        # <NameType NameTypeID="10" RecordType="Entity">Spelling Variation</NameType>
+        # <NameType NameTypeID="11" RecordType="Entity">Low Quality AKA</NameType>
+        orgPersonNameConflict = False
+        thisList = []
+        for nameRecord in masterRecord.findall("NameDetails/Name"):
+            nameType = nameRecord.attrib["NameType"][0:25]
+            if "PRIMARY" in nameType.upper():
+                nameType = "PRIMARY"
+
+            for nameValue in nameRecord.findall("NameValue"):
+                nameStr = ""
+                name = {}
+                name["NAME_TYPE"] = nameType
+                self.stats.update("NAME_TYPE", nameType)
+
+                nameOrg = getValue(nameValue, "EntityName")
+                if nameOrg:
+                    if len(nameOrg.split()) > 16:
+                        truncation_list.append({"EntityName": nameOrg})
+                        self.stats.update(
+                            "TRUNCATIONS",
+                            "longNameOrgCnt",
+                            jsonData["RECORD_ID"] + " | " + nameOrg,
+                        )
+                        nameOrg = " ".join(nameOrg.split()[:16])
+                    name["NAME_ORG"] = nameOrg
+                    nameStr = nameOrg
+
+                nameLast = getValue(nameValue, "Surname")
+                if nameLast:
+                    if len(nameLast.split()) > 10:
+                        truncation_list.append({"Surname": nameLast})
+                        self.stats.update(
+                            "TRUNCATIONS",
+                            "longNameLastCnt",
+                            jsonData["RECORD_ID"] + " | " + nameLast,
+                        )
+                        nameLast = " ".join(nameLast.split()[:10])
+                    name["NAME_LAST"] = nameLast
+                    nameStr = nameLast
 
-    # --assign the entity and record type
-    jsonData["RECORD_TYPE"] = recordType.upper()
-    updateStat("RECORD_TYPE", jsonData["RECORD_TYPE"])
+                nameMaiden = getValue(nameValue, "MaidenName")
+                if (
+                    nameMaiden and not nameLast
+                ):  # --either Surname or MaidenName will be populated
+                    if len(nameMaiden.split()) > 10:
+                        truncation_list.append({"MaidenName": nameMaiden})
+                        self.stats.update(
+                            "TRUNCATIONS",
+                            "longNameMaidenCnt",
+                            jsonData["RECORD_ID"] + " | " + nameMaiden,
+                        )
+                        nameMaiden = " ".join(nameMaiden.split()[:10])
+                    name["NAME_LAST"] = nameMaiden
+                    nameStr = nameLast
+
+                nameFirst = getValue(nameValue, "FirstName")
+                if nameFirst:
+                    if len(nameFirst.split()) > 10:
+                        truncation_list.append({"FirstName": nameFirst})
+                        self.stats.update(
+                            "TRUNCATIONS",
+                            "longNameFirstCnt",
+                            jsonData["RECORD_ID"] + " | " + nameFirst,
+                        )
+                        nameFirst = " ".join(nameFirst.split()[:10])
+                    name["NAME_FIRST"] = nameFirst
+                    nameStr += " " + nameFirst
+
+                nameMiddle = getValue(nameValue, "MiddleName")
+                if nameMiddle:
+                    if len(nameMiddle.split()) > 10:
+                        truncation_list.append({"MiddleName": nameMiddle})
+                        self.stats.update(
+                            "TRUNCATIONS",
+                            "longNameMiddleCnt",
+                            jsonData["RECORD_ID"] + " | " + nameMiddle,
+                        )
+                        nameMiddle = " ".join(nameMiddle.split()[:10])
+                    name["NAME_MIDDLE"] = nameMiddle
+                    nameStr += " " + nameMiddle
 
-    if truncation_list:
-        jsonData["truncations"] = truncation_list
+                namePrefix = getValue(nameValue, "TitleHonorific")
+                if namePrefix:
+                    name["NAME_PREFIX"] = namePrefix
+                nameSuffix = getValue(nameValue, "Suffix")
+                if nameSuffix:
+                    name["NAME_SUFFIX"] = nameSuffix
 
-    # --add composite keys
-    if addCompositeKeys:
-        jsonData = baseLibrary.jsonUpdater(jsonData)
+                thisList.append(name)
 
-    return jsonData
+                # --check for a name conflict
+                if (recordType == "PERSON" and "NAME_ORG" in name) or (
+                    recordType != "PERSON" and "NAME_LAST" in name
+                ):
+                    orgPersonNameConflict = True
+
+                # --duplicate this name segment for original script version if supplied
+                originalScriptName = getValue(nameValue, "OriginalScriptName")
+                if originalScriptName:
+                    name = {}
+                    self.stats.update("NAME_TYPE", "OriginalScriptName")
+                    name["NAME_TYPE"] = "OriginalScriptName"
+                    name["NAME_FULL"] = originalScriptName
+                    thisList.append(name)
+
+                # --duplicate this name segment for SingleStringName if supplied
+                singleStringName = getValue(nameValue, "SingleStringName")
+                if singleStringName:
+                    name = {}
+                    self.stats.update("NAME_TYPE", "singleStringName")
+                    name["NAME_TYPE"] = "singleStringName"
+                    name["NAME_FULL"] = singleStringName
+                    thisList.append(name)
+
+        if thisList:
+            jsonData["NAMES"] = thisList
+        if orgPersonNameConflict:
+            print("warning: person and org names on record %s" % jsonData["RECORD_ID"])
+
+        if self.profiler:
+            self.profiler.lap("names")
+
+        # --dates
+        # <DateType Id="1" RecordType="Person" name="Date of Birth"/>
+        # <DateType Id="2" RecordType="Person" name="Deceased Date"/>
+        # <DateType Id="3" RecordType="Entity" name="Date of Registration"/>
+        thisList = []
+        for dateRecord in masterRecord.findall("DateDetails/Date"):
 
+            try:
+                dateType = dateRecord.attrib["DateType"]
+            except:  # --all but the anti-corruption (SOC) feed use DateType
+                try:
+                    dateType = dateRecord.attrib["DateTypeId"]
+                except:
+                    print("bad date record!")
+                    print(self.prettyXml(dateRecord))
+                    continue
+
+            if dateType == "Date of Birth":
+                dateType = "DATE_OF_BIRTH"
+            elif dateType == "Deceased Date":
+                dateType = "DATE_OF_DEATH"
+            elif dateType == "Date of Registration":
+                dateType = "REGISTRATION_DATE"
+
+            for dateValue in dateRecord.findall("DateValue"):
+                day = getAttr(dateValue, "Day")
+                month = getAttr(dateValue, "Month")
+                year = getAttr(dateValue, "Year")
+                thisDate = concatDateParts(day, month, year)
+                if dateType == "DATE_OF_BIRTH":
+                    outputFormat = "%Y-%m-%d"
+                    if not day and not month:
+                        self.stats.update("DOB_DATA", "year only", thisDate)
+                    elif year and month and not day:
+                        self.stats.update("DOB_DATA", "year/month only", thisDate)
+                    elif month and day and not year:
+                        self.stats.update("DOB_DATA", "month/day only", thisDate)
+                    else:
+                        self.stats.update("DOB_DATA", "full", thisDate)
+
+                    formattedDate = baseLibrary.formatDate(thisDate)
+                    if formattedDate:
+                        thisList.append({dateType: formattedDate})
+                else:
+                    jsonData[dateType] = thisDate
+                self.stats.update("ATTRIBUTE", dateType, thisDate)
+        if thisList:
+            jsonData["DATES"] = thisList
+
+        if self.profiler:
+            self.profiler.lap("dates")
+
+        # --addresses
+        thisList = []
+        for addrRecord in masterRecord.findall("Address"):
+            address = {}
+            addrLine = getValue(addrRecord, "AddressLine")
+            if addrLine:
+                if len(addrLine.split()) > 16:
+                    truncation_list.append({"AddressLine": addrLine})
+                    self.stats.update(
+                        "TRUNCATIONS",
+                        "longAddrLineCnt",
+                        jsonData["RECORD_ID"] + " | " + addrLine,
+                    )
+                    addrLine = " ".join(addrLine.split()[:16])
+                address["ADDR_LINE1"] = addrLine
+            addrCity = getValue(addrRecord, "AddressCity")
+            if addrCity:
+                address["ADDR_CITY"] = addrCity
+            addrCountry = getValue(addrRecord, "AddressCountry")
+            if addrCountry:
+                address["ADDR_COUNTRY"] = self.countryIsoCodes.get(
+                    addrCountry
+                ) or self.resolveCountryCode(addrCountry)
+
+            thisList.append(address)
+            self.stats.update("ADDRESS", "UNTYPED")
+
+        if thisList:
+            jsonData["ADDRESSES"] = thisList
+
+        if self.profiler:
+            self.profiler.lap("addresses")
+
+        # --company details (address/website)
+        thisList1 = []
+        thisList2 = []
+        for addrRecord in masterRecord.findall("CompanyDetails"):
+            address = {}
+            address["ADDR_TYPE"] = "BUSINESS"
+            addrLine = getValue(addrRecord, "AddressLine")
+            if addrLine:
+                if len(addrLine.split()) > 16:
+                    self.stats.update("TRUNCATIONS", "longAddrLineCnt", addrLine)
+                    addrLine = " ".join(addrLine.split()[:16])
+                address["ADDR_LINE1"] = addrLine
+            addrCity = getValue(addrRecord, "AddressCity")
+            if addrCity:
+                address["ADDR_CITY"] = addrCity
+            addrCountry = getValue(addrRecord, "AddressCountry")
+            if addrCountry:
+                address["ADDR_COUNTRY"] = self.countryIsoCodes.get(
+                    addrCountry
+                ) or self.resolveCountryCode(addrCountry)
+
+            thisList1.append(address)
+            self.stats.update("ADDRESS", "BUSINESS")
+
+            url = getValue(addrRecord, "URL")
+            if url:
+                thisList2.append({"WEBSITE_ADDRESS": url})
+                self.stats.update("ATTRIBUTE", "WEBSITE_ADDRESS")
+
+        if thisList1:
+            jsonData["COMPANY_ADDRESSES"] = thisList1
+        if thisList2:
+            jsonData["COMPANY_WEBSITES"] = thisList2
+
+        if self.profiler:
+            self.profiler.lap("company details")
+
+        # --countries
+        thisList1 = []
+        for birthPlaceRecord in masterRecord.findall("BirthPlace/Place"):
+            birthPlace = birthPlaceRecord.attrib["name"]
+            thisList1.append({"PLACE_OF_BIRTH": birthPlace})
+            self.stats.update("ATTRIBUTE", "PLACE_OF_BIRTH")
+
+        for countryRecord in masterRecord.findall("CountryDetails/Country"):
+            countryType = countryRecord.attrib["CountryType"]
+            if countryType == "Citizenship":
+                attributeType = "CITIZENSHIP"
+            else:
+                if countryType == "REGISTRATION":
+                    usageType = "REGISTRATION"
+                elif countryType == "Resident of":
+                    usageType = "RESIDENT"
+                elif countryType == "Jurisdiction":
+                    usageType = "JURISDICTION"
+                elif countryType == "Country of Affiliation":
+                    usageType = "AFFILIATED"
+                elif countryType == "Enhanced Risk Country":
+                    usageType = "RISK"
+                else:
+                    usageType = "OTHER"
+                attributeType = usageType + "_COUNTRY_OF_ASSOCIATION"
 
-# ----------------------------------------
-if __name__ == "__main__":
-    appPath = os.path.dirname(os.path.abspath(sys.argv[0]))
+            itemNum = 0
+            for countryValue in countryRecord.findall("CountryValue"):
+                countryCode = countryValue.attrib["Code"]
+                countryName = self.countryIsoCodes.get(
+                    countryCode
+                ) or self.resolveCountryCode(countryCode)
 
-    global shutDown
-    shutDown = False
-    signal.signal(signal.SIGINT, signal_handler)
-    procStartTime = time.time()
-    progressInterval = 10000
+                thisList1.append({attributeType: countryName})
+                self.stats.update("COUNTRIES", attributeType, countryName)
 
-    argparser = argparse.ArgumentParser()
-    argparser.add_argument(
-        "-i",
-        "--input_file",
-        default=os.getenv("input_file", None),
-        type=str,
-        help="A Dow Jones xml file for PFA or HRF.",
-    )
-    argparser.add_argument(
-        "-o",
+        if thisList1:
+            jsonData["COUNTRIES"] = thisList1
+
+        if self.profiler:
+            self.profiler.lap("countries")
+
+        # --identifiers
+        itemNum = 0
+        thisList = []
+        for idRecord in masterRecord.findall("IDNumberTypes/ID"):
+            idType = idRecord.attrib["IDType"]
+            idTypeRules = self.getIdTypeRules(idType)
+            for idValue in idRecord.findall("IDValue"):
+                idNumber = getValue(idValue)
+                idNotes = getAttr(idValue, "IDnotes")
+                if not idNotes:
+                    idNotes = ""
+
+                attrType1 = None
+                attrType2 = None
+                countryCheck = 0
+                for (
+                    ruleName,
+                    notesTest,
+                    notesText,
+                    ruleType1,
+                    ruleType2,
+                    ruleCheck,
+                ) in idTypeRules:
+                    if notesTest is None or notesTest(idNotes, notesText):
+                        attrType1 = ruleType1
+                        attrType2 = ruleType2
+                        countryCheck = ruleCheck
+                        self.stats.update("ID_RULES", ruleName)
+                        break
+
+                # --if mapped
+                if attrType1:
+
+                    # --parse notes for a country or state code
+                    isoCode = None
+                    if idNotes:
+
+                        # --try for country code
+                        if countryCheck:
+                            isoCode = self.idNoteParse(idNotes, "country")
+
+                        # --try for US state code
+                        if countryCheck == 2 and (
+                            isoCode in ("USA", "US") or not isoCode
+                        ):
+                            isoCode = self.idNoteParse(idNotes, "state")
+
+                    # --create the identity structure
+                    idDict = {}
+                    idDict[attrType1] = idNumber
+                    if (
+                        attrType2 and isoCode
+                    ):  # --the notes should contain a country or a state
+                        idDict[attrType2] = isoCode
+                    thisList.append(idDict)
+                    self.stats.update(
+                        "ID_TYPE", "%s | %s" % (attrType1, isoCode), idNumber
+                    )
+
+                # --un-mapped
+                else:
+                    self.stats.update(
+                        "UNKNOWN", "%s | %s" % (idType, idNotes), idNumber
+                    )
+                    itemNum += 1
+                    jsonData["ID%s" % itemNum] = (
+                        idType + " = " + idNumber + ((" " + idNotes) if idNotes else "")
+                    )
+
+        if thisList:
+            jsonData["IDENTIFIERS"] = thisList
+
+        if self.profiler:
+            self.profiler.lap("identifiers")
+
+        # --descriptions
+        itemNum = 0
+        description1Names = []
+        for descriptionRecord in masterRecord.findall("Descriptions/Description"):
+            description1Code = None
+            description2Code = None
+            description3Code = None
+            try:
+                description1 = "%s=%s" % (
+                    descriptionRecord.attrib["Description1"],
+                    self.description1Codes[descriptionRecord.attrib["Description1"]],
+                )
+                description1Code = descriptionRecord.attrib["Description1"]
+                description1Names.append(self.description1Codes[description1Code])
+            except:
+                description1 = ""
+            try:
+                description2 = "%s=%s" % (
+                    descriptionRecord.attrib["Description2"],
+                    self.description2Codes[descriptionRecord.attrib["Description2"]],
+                )
+                description2Code = descriptionRecord.attrib["Description2"]
+            except:
+                description2 = ""
+            try:
+                description3 = "%s=%s" % (
+                    descriptionRecord.attrib["Description3"],
+                    self.description3Codes[descriptionRecord.attrib["Description3"]],
+                )
+                description3Code = self.description3Codes[
+                    descriptionRecord.attrib["Description3"]
+                ].upper()
+            except:
+                description3 = ""
+            if description1 or description2 or description3:
+                itemNum += 1
+                description = description1
+                description += (" | " if description2 else "") + description2
+                description += (" | " if description3 else "") + description3
+                jsonData["Description%s" % itemNum] = description
+                self.stats.update("DESCRIPTIONS", description, jsonData["RECORD_ID"])
+
+            # --record type reclassifications
+            if description3Code == "SHIP":
+                recordType = "VESSEL"
+            if description3Code == "AIRCRAFT":
+                recordType = "AIRCRAFT"
+
+        # --each feed of a trifecta file gets its own data source
+        if self.splitFeeds:
+            jsonData["DATA_SOURCE"] = trifectaFeed(description1Names)
+            self.stats.update("FEEDS", jsonData["DATA_SOURCE"])
+
+        if self.profiler:
+            self.profiler.lap("descriptions")
+
+        # --roles
+        for roleRecord in masterRecord.findall("RoleDetail/Roles"):
+            itemNum = 0
+            roleType = roleRecord.attrib["RoleType"]
+            for occTitle in roleRecord.findall("OccTitle"):
+                itemNum += 1
+                fromDate = concatDateParts(
+                    getAttr(occTitle, "SinceDay"),
+                    getAttr(occTitle, "SinceMonth"),
+                    getAttr(occTitle, "SinceYear"),
+                )
+                thruDate = concatDateParts(
+                    getAttr(occTitle, "ToDay"),
+                    getAttr(occTitle, "ToMonth"),
+                    getAttr(occTitle, "ToYear"),
+                )
+                thisRole = getValue(occTitle)
+                if fromDate:
+                    thisRole += " From " + fromDate
+                if thruDate:
+                    thisRole += " To " + thruDate
+                jsonData[roleType + str(itemNum)] = thisRole
+                self.stats.update("OTHER", "ROLES", thisRole)
+
+        if self.profiler:
+            self.profiler.lap("roles")
+
+        # --references
+        itemNum = 0
+        for referenceRecord in masterRecord.findall("SanctionsReferences/Reference"):
+            itemNum += 1
+            referenceName = "%s=%s" % (
+                getValue(referenceRecord),
+                self.referenceCodes[getValue(referenceRecord)],
+            )
+            fromDate = concatDateParts(
+                getAttr(referenceRecord, "SinceDay"),
+                getAttr(referenceRecord, "SinceMonth"),
+                getAttr(referenceRecord, "SinceYear"),
+            )
+            thruDate = concatDateParts(
+                getAttr(referenceRecord, "ToDay"),
+                getAttr(referenceRecord, "ToMonth"),
+                getAttr(referenceRecord, "ToYear"),
+            )
+            if fromDate:
+                referenceName += " From " + fromDate
+            if thruDate:
+                referenceName += " To " + thruDate
+            jsonData["Reference%s" % itemNum] = referenceName
+            self.stats.update("OTHER", "REFERENCES", referenceName)
+
+        if self.profiler:
+            self.profiler.lap("references")
+
+        # --sources
+        if self.extendedFormat:  # --disabled to keep reports smaller
+            itemNum = 0
+            for sourceRecord in masterRecord.findall("SourceDescription/Source"):
+                itemNum += 1
+                sourceName = sourceRecord.attrib["name"]
+                self.stats.update("OTHER", "SOURCES")
+                jsonData["Source%s" % itemNum] = sourceName
+
+        # --images
+        if self.extendedFormat:  # --disabled to keep reports smaller
+            itemNum = 0
+            for imageRecord in masterRecord.findall("Images/Image"):
+                itemNum += 1
+                imageURL = imageRecord.attrib["URL"]
+                # --stats.update('source-' + sourceName) <--too many of these to log
+                jsonData["Image%s" % itemNum] = imageURL
+
+        if self.profiler:
+            self.profiler.lap("sources and images")
+
+        # --disclosed relationships
+        if self.deferRelationships:
+            jsonData["RELATIONSHIPS"] = (
+                None  # --placeholder patched in by finalizeSinglePass()
+            )
+        else:
+            thisList = self.mapRelationships(jsonData["DJ_PROFILE_ID"], recordType)
+            if thisList:
+                jsonData["RELATIONSHIPS"] = thisList
+
+        if self.profiler:
+            self.profiler.lap("relationships")
+
+        # --assign the entity and record type
+        jsonData["RECORD_TYPE"] = recordType.upper()
+        self.stats.update("RECORD_TYPE", jsonData["RECORD_TYPE"])
+
+        if truncation_list:
+            jsonData["truncations"] = truncation_list
+
+        # --add composite keys
+        if self.addCompositeKeys:
+            jsonData = baseLibrary.jsonUpdater(jsonData)
+
+        if self.profiler:
+            self.profiler.lap("record type and keys")
+        return jsonData
+
+    def loadReferences(self, source):
+        """first pass through the file to load the reference tables"""
+        isFileName = isinstance(source, (str, os.PathLike))
+        if self.useSnapshot and isFileName and self.loadSnapshot(os.fspath(source)):
+            return
+        if self.progressMonitor:
+            self.progressMonitor.startPass("references")
+        profileCount = 0
+        for node in self.iterSourceElements(source, REFERENCE_TAGS):
+            if node.tag in RECORD_TAGS or node.tag in ASSOCIATION_TAGS:
+                profileCount += 1
+                if self.progressMonitor and profileCount % self.progressInterval == 0:
+                    self.progressMonitor.report(profileCount, "profiles read")
+            self.loadReferenceNode(node)
+            if self.stopped:
+                return
+        self.buildRelationshipEdges()
+        if self.useSnapshot and isFileName:
+            self.saveSnapshot(os.fspath(source))
+
+    def loadSnapshot(self, inputFileName):
+        """load the reference tables saved by a prior run on the same file
+
+        The snapshot is a json header line followed by the bytes of the table
+        arrays. The header's version, the file fingerprint and the checksum of the
+        bytes must all match or the tables are rebuilt from the file.
+        """
+        snapshotFileName = inputFileName + ".snapshot"
+        if not os.path.exists(snapshotFileName):
+            return False
+        try:
+            with open(snapshotFileName, "rb") as snapshotFile:
+                header = json.loads(snapshotFile.readline())
+                if (
+                    not isinstance(header, dict)
+                    or header.get("version") != SNAPSHOT_VERSION
+                    or header.get("byteorder") != sys.byteorder
+                    or header.get("fingerprint") != fileFingerprint(inputFileName)
+                ):
+                    return False
+                snapshotData = snapshotFile.read()
+            if hashlib.sha256(snapshotData).hexdigest() != header["checksum"]:
+                raise ValueError("checksum does not match")
+            tables = restoreSnapshotTables(header, memoryview(snapshotData))
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            # --a damaged snapshot is rebuilt from the file
+            print(
+                "Could not read reference snapshot %s, rebuilding it" % snapshotFileName
+            )
+            print(" %s" % err)
+            return False
+
+        print("loading reference snapshot %s ..." % snapshotFileName)
+        for tableName in REFERENCE_TABLES:
+            setattr(self, tableName, tables[tableName])
+        self.stats.process["REFERENCE_SNAPSHOT"] = "loaded"
+        return True
+
+    def saveSnapshot(self, inputFileName):
+        """save the reference tables so the first pass can be skipped next time"""
+        snapshotFileName = inputFileName + ".snapshot"
+        print("saving reference snapshot %s ..." % snapshotFileName)
+        header = {
+            "version": SNAPSHOT_VERSION,
+            "fingerprint": fileFingerprint(inputFileName),
+            "byteorder": sys.byteorder,
+            "codes": self.getReferenceTables(REFERENCE_TABLES[:7]),
+            "tables": {},
+            "buffers": [],
+        }
+        buffers = []
+        checksum = hashlib.sha256()
+        for tableName, table in self.getReferenceTables(REFERENCE_TABLES[7:]).items():
+            fields, tableBuffers = table.snapshot()
+            header["tables"][tableName] = fields
+            for bufferName, buffer in tableBuffers.items():
+                if isinstance(buffer, array):
+                    bufferInfo = [buffer.typecode, buffer.itemsize]
+                    bufferBytes = buffer.tobytes()
+                else:
+                    bufferInfo = [None, 1]
+                    bufferBytes = bytes(buffer)
+                header["buffers"].append(
+                    [tableName, bufferName] + bufferInfo + [len(bufferBytes)]
+                )
+                buffers.append(bufferBytes)
+                checksum.update(bufferBytes)
+        header["checksum"] = checksum.hexdigest()
+        try:
+            with open(snapshotFileName + ".tmp", "wb") as snapshotFile:
+                snapshotFile.write(json.dumps(header).encode("utf-8") + b"\n")
+                for bufferBytes in buffers:
+                    snapshotFile.write(bufferBytes)
+            os.replace(snapshotFileName + ".tmp", snapshotFileName)
+        except OSError as err:
+            print("Could not write reference snapshot %s" % snapshotFileName)
+            print(" %s" % err)
+            return
+        self.stats.process["REFERENCE_SNAPSHOT"] = "saved"
+
+    def buildProfileIndex(self, inputFileName, indexFileName):
+        """save the byte offset of every profile along with the reference tables"""
+        print("building profile index %s ..." % indexFileName)
+        self.loadReferences(inputFileName)
+        offsets = {}
+        for tag, recordId, offset, length in scanRecordOffsets(inputFileName):
+            offsets[recordId] = (offset, length)
+
+        if os.path.exists(indexFileName):
+            os.remove(indexFileName)
+        dbConn = sqlite3.connect(indexFileName)
+        dbConn.execute("create table meta (key text primary key, value text)")
+        dbConn.execute(
+            "create table profiles (id text primary key, offset integer, length integer, "
+            "entity_name text, entity_duns text, associates text)"
+        )
+        referenceTables = self.getReferenceTables(REFERENCE_TABLES[:7])
+        dbConn.executemany(
+            "insert into meta values (?, ?)",
+            [
+                ("fingerprint", fileFingerprint(inputFileName)),
+                ("references", json.dumps(referenceTables)),
+            ],
+        )
+        allIds = (
+            set(offsets)
+            | set(self.relationships)
+            | set(self.entityNames)
+            | set(self.entityDuns)
+        )
+        dbConn.executemany(
+            "insert into profiles values (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    profileId,
+                    offsets.get(profileId, (None, None))[0],
+                    offsets.get(profileId, (None, None))[1],
+                    self.entityNames.get(profileId),
+                    self.entityDuns.get(profileId),
+                    (
+                        json.dumps(self.relationships[profileId])
+                        if profileId in self.relationships
+                        else None
+                    ),
+                )
+                for profileId in allIds
+            ),
+        )
+        dbConn.commit()
+        dbConn.close()
+
+    def lookupProfile(self, inputFileName, profileId):
+        """read a single profile using the index, building the index if needed"""
+        indexFileName = inputFileName + ".idx"
+        indexCurrent = False
+        if os.path.exists(indexFileName):
+            try:
+                dbConn = sqlite3.connect(indexFileName)
+                row = dbConn.execute(
+                    "select value from meta where key = 'fingerprint'"
+                ).fetchone()
+                dbConn.close()
+                indexCurrent = row and row[0] == fileFingerprint(inputFileName)
+            except sqlite3.Error:
+                indexCurrent = False
+        if not indexCurrent:
+            try:
+                self.buildProfileIndex(inputFileName, indexFileName)
+            except (IOError, sqlite3.Error) as err:
+                print("Could not build profile index %s" % indexFileName)
+                print(" %s" % err)
+                return None
+
+        dbConn = sqlite3.connect(indexFileName)
+        row = dbConn.execute(
+            "select value from meta where key = 'references'"
+        ).fetchone()
+        referenceTables = json.loads(row[0])
+        self.countryCodes.update(referenceTables["countryCodes"])
+        self.countryIsoCodes.update(referenceTables.get("countryIsoCodes", {}))
+        self.description1Codes.update(referenceTables["description1Codes"])
+        self.description2Codes.update(referenceTables["description2Codes"])
+        self.description3Codes.update(referenceTables["description3Codes"])
+        self.referenceCodes.update(referenceTables["referenceCodes"])
+        self.relationCodes.update(referenceTables["relationCodes"])
+
+        # --only the related profiles are needed to map this one
+        profileSql = "select id, offset, length, entity_name, entity_duns, associates from profiles where id = ?"
+        row = dbConn.execute(profileSql, (profileId,)).fetchone()
+        if not row or row[1] is None:
+            dbConn.close()
+            return None
+        offset, length, associates = row[1], row[2], row[5]
+        if associates:
+            self.relationships[profileId] = json.loads(associates)
+            for relationship in self.relationships[profileId]:
+                otherRow = dbConn.execute(profileSql, (relationship["id"],)).fetchone()
+                if not otherRow:
+                    continue
+                if otherRow[3]:
+                    self.entityNames[otherRow[0]] = otherRow[3]
+                if otherRow[4]:
+                    self.entityDuns[otherRow[0]] = otherRow[4]
+                if otherRow[5]:
+                    self.relationships[otherRow[0]] = json.loads(otherRow[5])
+        dbConn.close()
+        self.buildRelationshipEdges()
+
+        with open(inputFileName, "rb") as inputFile:
+            inputFile.seek(offset)
+            return self.parseElement(inputFile.read(length))
+
+    def addCacheStats(self):
+        """add the hit counts of the iso code caches to the process stats"""
+        self.stats.addProcessCounts("ID_NOTE_CACHE", self.idNoteCache.takeCounts())
+        self.stats.addProcessCounts(
+            "ISO_PHRASE_CACHE", self.isoPhraseCache.takeCounts()
+        )
+
+    def recordAttributes(self, jsonData):
+        """return the attribute and upper case value pairs a query finds a record by"""
+        attributes = {
+            ("RECORD_TYPE", jsonData.get("RECORD_TYPE", "").upper()),
+            ("DATA_SOURCE", jsonData.get("DATA_SOURCE", "").upper()),
+        }
+        for countryRecord in jsonData.get("COUNTRIES", []):
+            for attribute, value in countryRecord.items():
+                if value:
+                    for countryValue in self.countryValues(value):
+                        attributes.add((attribute, countryValue))
+                        attributes.add(("COUNTRY", countryValue))
+        for addressList in ("ADDRESSES", "COMPANY_ADDRESSES"):
+            for address in jsonData.get(addressList, []):
+                if address.get("ADDR_COUNTRY"):
+                    for countryValue in self.countryValues(address["ADDR_COUNTRY"]):
+                        attributes.add(("ADDR_COUNTRY", countryValue))
+                        attributes.add(("COUNTRY", countryValue))
+
+        # --descriptions are code=name for each level present, in level order
+        itemNum = 1
+        while jsonData.get("Description%s" % itemNum):
+            description = jsonData["Description%s" % itemNum]
+            itemNum += 1
+            level = 0
+            for part in description.split(" | "):
+                code, _, name = part.partition("=")
+                for partLevel, codeTable in (
+                    (1, self.description1Codes),
+                    (2, self.description2Codes),
+                    (3, self.description3Codes),
+                ):
+                    if partLevel > level and codeTable.get(code) == name:
+                        level = partLevel
+                        attributes.add(("DESCRIPTION%s" % level, code.upper()))
+                        attributes.add(("DESCRIPTION%s" % level, name.upper()))
+                        break
+
+        itemNum = 1
+        while jsonData.get("Reference%s" % itemNum):
+            code = jsonData["Reference%s" % itemNum].partition("=")[0]
+            itemNum += 1
+            attributes.add(("SANCTIONS", code.upper()))
+            if code in self.referenceCodes:
+                attributes.add(("SANCTIONS", self.referenceCodes[code].upper()))
+        return attributes
+
+    def countryValues(self, mappedCountry):
+        """return the mapped country with the dow jones codes and names it came from"""
+        # --the codes are looked up by the iso code or name they were mapped to
+        if self.countryAliasCount != len(self.countryIsoCodes):
+            self.countryAliases = {}
+            for countryCode, isoCountry in self.countryIsoCodes.items():
+                self.countryAliases.setdefault(isoCountry.upper(), set()).update(
+                    (
+                        countryCode.upper(),
+                        self.countryCodes.get(countryCode, countryCode).upper(),
+                    )
+                )
+            self.countryAliasCount = len(self.countryIsoCodes)
+        mappedCountry = mappedCountry.upper()
+        return {mappedCountry} | self.countryAliases.get(mappedCountry, set())
+
+    def build_references(self, source):
+        """load the code lists and relationships from a file name or binary stream"""
+        self.loadReferences(source)
+
+    def map_records(self, source):
+        """yield the mapped json record of each person and entity in the source"""
+        for node in self.iterSourceElements(source, RECORD_TAGS):
+            if node.tag == "Person":
+                jsonData = self.g2Mapping(node, "PERSON")
+            else:
+                jsonData = self.g2Mapping(node, "ORGANIZATION")
+            node.clear()
+            yield jsonData
+            if self.stopped:
+                break
+
+    def workerCopy(self, indexAttributes=False):
+        """return a copy sharing the reference tables for the worker processes"""
+        mapperCopy = copy.copy(self)
+        mapperCopy.indexAttributes = indexAttributes
+        mapperCopy.deferRelationships = False
+        mapperCopy.maxRssMb = 0
+        mapperCopy.progressMonitor = None
+        return mapperCopy
+
+    def mapRecordRange(self, recordRange):
+        """map the profiles in a byte range of the file in a worker process"""
+        self.stats = StatCollector(self.statsMode)
+        self.profiler = MappingProfiler() if self.profiler else None
+        inputFileName, rangeStart, rangeEnd = recordRange
+        with open(inputFileName, "rb") as inputFile:
+            inputFile.seek(rangeStart)
+            xmlData = (
+                b"<Records>" + inputFile.read(rangeEnd - rangeStart) + b"</Records>"
+            )
+
+        outputLines = []
+        personCount = 0
+        entityCount = 0
+        for node in self.iterElements(io.BytesIO(xmlData), RECORD_TAGS):
+            if node.tag == "Person":
+                jsonData = self.g2Mapping(node, "PERSON")
+                personCount += 1
+            else:
+                jsonData = self.g2Mapping(node, "ORGANIZATION")
+                entityCount += 1
+            outputLines.append(
+                (
+                    jsonData["RECORD_ID"],
+                    jsonData["DATA_SOURCE"],
+                    self.jsonBytes(jsonData, newline=True),
+                    self.recordAttributes(jsonData) if self.indexAttributes else (),
+                )
+            )
+            node.clear()
+        self.addCacheStats()
+
+        return (
+            outputLines,
+            personCount,
+            entityCount,
+            self.stats,
+            self.profiler,
+            rangeEnd,
+            os.getpid(),
+            baseLibrary.statPack,
+        )
+
+
+# ----------------------------------------
+class OutputWriter:
+    """buffered output file that compresses and writes on background threads"""
+
+    def __init__(
+        self, fileName, bufferSize=4 * 1024 * 1024, compressThreads=None, checksum=False
+    ):
+        self.name = fileName
+        if fileName.lower().endswith(".gz"):
+            self.compression = "gzip"
+        elif fileName.lower().endswith((".zst", ".zstd")):
+            self.compression = "zstd"
+        else:
+            self.compression = None
+        if self.compression == "zstd" and zstandard is None:
+            raise IOError("Please pip install zstandard to write .zst files")
+        self.socket = None
+        if fileName == "-":
+            self.rawFile = sys.__stdout__.buffer
+        elif isUnixSocket(fileName):
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(fileName)
+            self.rawFile = self.socket.makefile("wb")
+        else:
+            # --a named pipe opens like a file once its reader is there
+            self.rawFile = open(fileName, "wb")
+        self.buffer = []
+        self.bufferLength = 0
+        self.bufferSize = bufferSize
+        self.error = None
+        self.errorRaised = False
+        self.bytesWritten = 0
+        self.sha256 = hashlib.sha256() if checksum else None
+
+        # --batches are compressed independently, each one becomes a gzip member or zstd frame
+        compressThreads = compressThreads or min(4, os.cpu_count() or 1)
+        self.compressPool = (
+            ThreadPoolExecutor(compressThreads) if self.compression else None
+        )
+        self.pendingBatches = queue.Queue(maxsize=compressThreads * 2)
+        self.writerThread = threading.Thread(target=self.writeBatches, daemon=True)
+        self.writerThread.start()
+
+    def write(self, data):
+        """add bytes to the buffer, handing it off once the buffer is full"""
+        self.buffer.append(data)
+        self.bufferLength += len(data)
+        if self.bufferLength >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        """hand the buffer off to be compressed and written"""
+        if self.error:
+            self.errorRaised = True
+            raise self.error
+        if not self.buffer:
+            return
+        batch = b"".join(self.buffer)
+        self.buffer = []
+        self.bufferLength = 0
+        if self.compressPool:
+            self.pendingBatches.put(self.compressPool.submit(self.compress, batch))
+        else:
+            self.pendingBatches.put(batch)
+
+    def compress(self, batch):
+        """compress a batch, zlib and zstd release the gil while doing so"""
+        if self.compression == "gzip":
+            return gzip.compress(batch, compresslevel=6, mtime=0)
+        return zstandard.ZstdCompressor(level=3).compress(batch)
+
+    def writeBatches(self):
+        """write the batches in order as they become ready"""
+        while True:
+            batch = self.pendingBatches.get()
+            if batch is None:
+                break
+            if self.error:
+                continue
+            try:
+                data = batch.result() if isinstance(batch, Future) else batch
+                self.rawFile.write(data)
+                self.bytesWritten += len(data)
+                if self.sha256:
+                    self.sha256.update(data)
+            except Exception as err:
+                self.error = err if isinstance(err, OSError) else IOError(err)
+
+    def queueDepth(self):
+        """number of batches waiting to be compressed or written"""
+        return self.pendingBatches.qsize()
+
+    def close(self):
+        """write what is left and wait for the background threads"""
+        try:
+            if not self.errorRaised:
+                self.flush()
+        finally:
+            self.pendingBatches.put(None)
+            self.writerThread.join()
+            if self.compressPool:
+                self.compressPool.shutdown()
+            self.closeRawFile()
+        # --an error raised by a write has already stopped the run
+        if self.error and not self.errorRaised:
+            self.errorRaised = True
+            raise self.error
+
+    def closeRawFile(self):
+        """close the file, pipe or socket written to"""
+        try:
+            if self.rawFile is sys.__stdout__.buffer:
+                self.rawFile.flush()
+            else:
+                self.rawFile.close()
+            if self.socket:
+                self.socket.close()
+        except OSError as err:
+            self.error = self.error or err
+        if self.error and self.rawFile is sys.__stdout__.buffer:
+            # --so python does not complain about the closed pipe on exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.__stdout__.fileno())
+
+
+# ----------------------------------------
+class ShardedOutputWriter:
+    """output split into files by a hash of the record id for parallel loading"""
+
+    def __init__(self, fileName, shardCount):
+        self.name = fileName
+        self.shardCount = shardCount
+        self.manifestName = os.path.join(
+            os.path.dirname(fileName), outputFileStem(fileName) + "_manifest.json"
+        )
+        self.shards = []
+        self.recordCounts = [0] * shardCount
+        for shardNumber in range(shardCount):
+            self.shards.append(
+                OutputWriter(
+                    addFileSuffix(fileName, "shard%03d" % shardNumber),
+                    bufferSize=1024 * 1024,
+                    compressThreads=1,
+                    checksum=True,
+                )
+            )
+
+    def shardNumber(self, recordId):
+        """return the shard of a record, the same on every run and platform"""
+        return zlib.crc32(recordId.encode("utf-8")) % self.shardCount
+
+    def write(self, data, recordId):
+        """write a record to its shard"""
+        shardNumber = self.shardNumber(recordId)
+        self.shards[shardNumber].write(data)
+        self.recordCounts[shardNumber] += 1
+
+    def queueDepth(self):
+        """number of batches waiting to be compressed or written"""
+        return sum(shard.queueDepth() for shard in self.shards)
+
+    def close(self):
+        """close every shard, raising the first error if any failed"""
+        firstError = None
+        for shard in self.shards:
+            try:
+                shard.close()
+            except IOError as err:
+                firstError = firstError or err
+        if firstError:
+            raise firstError
+
+    def writeManifest(self, manifestInfo):
+        """write the record count, size and checksum of each shard"""
+        manifest = dict(manifestInfo)
+        manifest.update(
+            {
+                "shard_count": self.shardCount,
+                "shard_key": "crc32(RECORD_ID) % shard_count",
+                "total_records": sum(self.recordCounts),
+                "shards": [
+                    {
+                        "shard": shardNumber,
+                        "file_name": os.path.basename(shard.name),
+                        "records": self.recordCounts[shardNumber],
+                        "bytes": shard.bytesWritten,
+                        "sha256": shard.sha256.hexdigest(),
+                    }
+                    for shardNumber, shard in enumerate(self.shards)
+                ],
+            }
+        )
+        tempFileName = self.manifestName + ".tmp"
+        with open(tempFileName, "w") as manifestFile:
+            json.dump(manifest, manifestFile, indent=4)
+        os.replace(tempFileName, self.manifestName)
+
+
+# ----------------------------------------
+class FeedOutputWriter:
+    """an output for each feed of a trifecta file"""
+
+    def __init__(self, fileName, openOutput, feedDataSources):
+        self.name = fileName
+        self.openOutput = openOutput
+        self.outputs = {}
+        self.recordCounts = {}
+        # --every feed is opened up front so an output that cannot be written stops
+        # --the run before any records are mapped
+        try:
+            for feedDataSource in feedDataSources:
+                self.openFeed(feedDataSource)
+        except IOError:
+            for feedOutput in self.outputs.values():
+                try:
+                    feedOutput.close()
+                except IOError:
+                    pass
+            raise
+
+    def openFeed(self, feedDataSource):
+        """open the output of a feed"""
+        feedOutput = self.openOutput(addFileSuffix(self.name, feedDataSource))
+        self.outputs[feedDataSource] = feedOutput
+        self.recordCounts[feedDataSource] = 0
+        return feedOutput
+
+    def output(self, feedDataSource):
+        """return the output of a feed to write a record to"""
+        feedOutput = self.outputs.get(feedDataSource)
+        if feedOutput is None:
+            feedOutput = self.openFeed(feedDataSource)
+        self.recordCounts[feedDataSource] += 1
+        return feedOutput
+
+    def queueDepth(self):
+        """number of batches waiting to be compressed or written"""
+        return sum(feedOutput.queueDepth() for feedOutput in self.outputs.values())
+
+    def close(self):
+        """close the output of every feed, raising the first error if any failed"""
+        firstError = None
+        for feedOutput in self.outputs.values():
+            try:
+                feedOutput.close()
+            except IOError as err:
+                firstError = firstError or err
+        if firstError:
+            raise firstError
+
+
+# ----------------------------------------
+class DeltaState:
+    """remembers a hash of every record written so only changes are output"""
+
+    def __init__(self, stateFileName, fullFile, stats):
+        self.fullFile = fullFile
+        self.stats = stats
+        self.dbConn = sqlite3.connect(stateFileName)
+        self.upgradeState()
+        self.dbConn.execute(
+            "create table if not exists records (data_source text, record_id text, "
+            "hash blob, primary key (data_source, record_id))"
+        )
+        self.dbConn.execute(
+            "create temp table seen "
+            "(data_source text, record_id text, primary key (data_source, record_id))"
+        )
+        self.seenBatch = []
+        self.dataSources = set()
+
+    def upgradeState(self):
+        """re-key the records of a state file keyed on the record id alone"""
+        primaryKey = [
+            row[1]
+            for row in self.dbConn.execute("pragma table_info(records)")
+            if row[5]
+        ]
+        if primaryKey != ["record_id"]:
+            return
+        self.dbConn.execute("alter table records rename to records_old")
+        self.dbConn.execute(
+            "create table records (data_source text, record_id text, "
+            "hash blob, primary key (data_source, record_id))"
+        )
+        self.dbConn.execute(
+            "insert into records select data_source, record_id, hash from records_old"
+        )
+        self.dbConn.execute("drop table records_old")
+        self.dbConn.commit()
+
+    def isChanged(self, recordId, recordLine, recordDataSource):
+        """check a record against the prior run and remember its new hash"""
+        newHash = hashlib.blake2b(recordLine, digest_size=16).digest()
+        self.dataSources.add(recordDataSource)
+        if self.fullFile:
+            self.seenBatch.append((recordDataSource, recordId))
+            if len(self.seenBatch) >= 10000:
+                self.dbConn.executemany(
+                    "insert or ignore into seen values (?, ?)", self.seenBatch
+                )
+                self.seenBatch = []
+        row = self.dbConn.execute(
+            "select hash from records where data_source = ? and record_id = ?",
+            (recordDataSource, recordId),
+        ).fetchone()
+        if row and row[0] == newHash:
+            self.stats.update("DELTA", "UNCHANGED")
+            return False
+        self.stats.update("DELTA", "CHANGED" if row else "NEW", recordId)
+        self.dbConn.execute(
+            "insert or replace into records values (?, ?, ?)",
+            (recordDataSource, recordId, newHash),
+        )
+        return True
+
+    def deletedRecords(self):
+        """yield the records of the prior run that are missing from a full file,
+        only for the data sources written by this run"""
+        if not self.fullFile:
+            return
+        self.dbConn.executemany(
+            "insert or ignore into seen values (?, ?)", self.seenBatch
+        )
+        self.seenBatch = []
+        for recordDataSource in sorted(self.dataSources):
+            deletedRows = self.dbConn.execute(
+                "select record_id from records where data_source = ? and record_id "
+                "not in (select record_id from seen where data_source = ?)",
+                (recordDataSource, recordDataSource),
+            ).fetchall()
+            for (recordId,) in deletedRows:
+                self.stats.update("DELTA", "DELETED", recordId)
+                self.dbConn.execute(
+                    "delete from records where data_source = ? and record_id = ?",
+                    (recordDataSource, recordId),
+                )
+                yield recordId, recordDataSource
+
+    def close(self, saveChanges):
+        """only save the state if the output was completed"""
+        if saveChanges:
+            self.dbConn.commit()
+        self.dbConn.close()
+
+
+# ----------------------------------------
+class QueryIndex:
+    """indexes the mapped records by their attributes for the query command"""
+
+    def __init__(self, indexFileName, mapper):
+        self.indexFileName = indexFileName
+        # --the relationships are those of the mapper's reference tables
+        self.mapper = mapper
+        # --built beside the index and only put in its place once complete
+        self.buildFileName = indexFileName + ".tmp"
+        if os.path.exists(self.buildFileName):
+            os.remove(self.buildFileName)
+        self.dbConn = sqlite3.connect(self.buildFileName)
+        # --a failed build is thrown away, so it does not need a journal
+        self.dbConn.execute("pragma journal_mode = off")
+        self.dbConn.execute("pragma synchronous = off")
+        self.dbConn.execute("create table meta (key text primary key, value text)")
+        self.dbConn.execute(
+            "create table records "
+            "(record_id text primary key, data_source text, json text)"
+        )
+        self.dbConn.execute(
+            "create table attributes (record_id text, attribute text, value text)"
+        )
+        self.dbConn.execute(
+            "create table relationships "
+            "(record_id text, related_id text, relationship text)"
+        )
+        self.recordBatch = []
+        self.attributeBatch = []
+        self.relationshipBatch = []
+        self.recordCount = 0
+
+    def addRecord(self, recordId, recordLine, recordDataSource, attributes=()):
+        """index a mapped record by its attributes and relationships"""
+        self.recordBatch.append(
+            (recordId, recordDataSource, recordLine.decode("utf-8").rstrip("\n"))
+        )
+        self.addAttributes(recordId, attributes)
+        self.relationshipBatch.extend(
+            (recordId, otherId, relType)
+            for otherId, relType, legacyType, relKey in self.mapper.relationships.edges(
+                recordId
+            )
+        )
+        self.recordCount += 1
+        if len(self.recordBatch) >= 10000:
+            self.flush()
+
+    def addAttributes(self, recordId, attributes):
+        """index a record by the attributes the mapper found for it"""
+        self.attributeBatch.extend(
+            (recordId, attribute, value) for attribute, value in attributes
+        )
+
+    def flush(self):
+        """write the batched rows to the index"""
+        self.dbConn.executemany(
+            "insert or replace into records values (?, ?, ?)", self.recordBatch
+        )
+        self.dbConn.executemany(
+            "insert into attributes values (?, ?, ?)", self.attributeBatch
+        )
+        self.dbConn.executemany(
+            "insert into relationships values (?, ?, ?)", self.relationshipBatch
+        )
+        self.recordBatch = []
+        self.attributeBatch = []
+        self.relationshipBatch = []
+
+    def close(self, saveIndex, indexInfo):
+        """only replace the index if the mapping was completed"""
+        if not saveIndex:
+            self.dbConn.close()
+            os.remove(self.buildFileName)
+            return
+        self.flush()
+        self.dbConn.execute(
+            "create index attribute_values on attributes (attribute, value)"
+        )
+        self.dbConn.execute("create index related_from on relationships (record_id)")
+        self.dbConn.execute("create index related_to on relationships (related_id)")
+        indexInfo["record_count"] = self.recordCount
+        self.dbConn.executemany(
+            "insert into meta values (?, ?)",
+            [(key, json.dumps(value)) for key, value in indexInfo.items()],
+        )
+        self.dbConn.commit()
+        self.dbConn.close()
+        os.replace(self.buildFileName, self.indexFileName)
+
+
+# ----------------------------------------
+def queryRecords(indexFileName, criteria, relatedTo=None, limit=0):
+    """yield the json of the indexed records matching every criteria"""
+    whereClauses = []
+    parameters = []
+    for attribute, value in criteria:
+        # --* is a wildcard, anything else must match the whole value
+        if "*" in value:
+            whereClauses.append(
+                "record_id in (select record_id from attributes "
+                "where attribute = ? and value like ? escape '\\')"
+            )
+            value = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            parameters.extend([attribute, value.replace("*", "%").upper()])
+        else:
+            whereClauses.append(
+                "record_id in (select record_id from attributes "
+                "where attribute = ? and value = ?)"
+            )
+            parameters.extend([attribute, value.upper()])
+    if relatedTo:
+        whereClauses.append(
+            "record_id in (select related_id from relationships where record_id = ? "
+            "union select record_id from relationships where related_id = ?)"
+        )
+        parameters.extend([relatedTo, relatedTo])
+    querySql = "select json from records"
+    if whereClauses:
+        querySql += " where " + " and ".join(whereClauses)
+    querySql += " order by rowid"
+    if limit:
+        querySql += " limit %d" % limit
+
+    dbConn = sqlite3.connect("file:%s?mode=ro" % indexFileName, uri=True)
+    try:
+        for row in dbConn.execute(querySql, parameters):
+            yield row[0]
+    finally:
+        dbConn.close()
+
+
+# ----------------------------------------
+def runQuery(queryArgs):
+    """write the records of a query index that match the query arguments"""
+    mainStdout = sys.stdout
+    # --the records go to stdout unless there is an output file
+    if not queryArgs.output_file and not queryArgs.count:
+        sys.stdout = sys.stderr
+    try:
+        return writeQueryRecords(queryArgs)
+    finally:
+        sys.stdout = mainStdout
+
+
+# ----------------------------------------
+def writeQueryRecords(queryArgs):
+    """write the matching records of a query index, return the exit code"""
+    if not os.path.exists(queryArgs.index_file):
+        print("")
+        print("Query index %s not found!" % queryArgs.index_file)
+        print("")
+        return 1
+    criteria = [
+        (attribute, value)
+        for attribute, value in (
+            ("RECORD_TYPE", queryArgs.record_type),
+            ("DATA_SOURCE", queryArgs.data_source),
+            ("COUNTRY", queryArgs.country),
+            ("CITIZENSHIP", queryArgs.citizenship),
+            ("DESCRIPTION1", queryArgs.description1),
+            ("DESCRIPTION2", queryArgs.description2),
+            ("DESCRIPTION3", queryArgs.description3),
+            ("SANCTIONS", queryArgs.sanctions),
+        )
+        if value
+    ]
+    queryOutput = None
+    recordCount = 0
+    try:
+        if queryArgs.output_file and not queryArgs.count:
+            queryOutput = open(queryArgs.output_file, "w", encoding="utf-8")
+        elif not queryArgs.count:
+            queryOutput = sys.__stdout__
+        for recordJson in queryRecords(
+            queryArgs.index_file, criteria, queryArgs.related_to, queryArgs.limit
+        ):
+            if queryOutput:
+                queryOutput.write(recordJson + "\n")
+            recordCount += 1
+        if queryOutput:
+            queryOutput.flush()
+    except BrokenPipeError:
+        # --the reader only wanted the first records, so python does not complain
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.__stdout__.fileno())
+        return 0
+    except (IOError, sqlite3.Error) as err:
+        print("")
+        print("Could not query %s" % queryArgs.index_file)
+        print(" %s" % err)
+        print("")
+        return 1
+    finally:
+        if queryArgs.output_file and queryOutput:
+            queryOutput.close()
+    if queryArgs.count:
+        print("%s records match" % recordCount)
+    elif queryArgs.output_file:
+        print("%s records written to %s" % (recordCount, queryArgs.output_file))
+    return 0
+
+
+# ----------------------------------------
+def isUnixSocket(fileName):
+    """return True if the file name is a unix socket to connect to"""
+    try:
+        return stat.S_ISSOCK(os.stat(fileName).st_mode)
+    except OSError:
+        return False
+
+
+# ----------------------------------------
+def isStreamOutput(fileName):
+    """return True if the output is stdout, a named pipe or a unix socket"""
+    if fileName == "-":
+        return True
+    try:
+        fileMode = os.stat(fileName).st_mode
+    except OSError:
+        return False
+    return stat.S_ISFIFO(fileMode) or stat.S_ISSOCK(fileMode)
+
+
+# ----------------------------------------
+def mergeStatPack(targetStats, sourceStats):
+    """add the base library statistics of a worker process to these ones"""
+    for key, value in sourceStats.items():
+        if key not in targetStats:
+            targetStats[key] = value
+        elif isinstance(value, dict):
+            mergeStatPack(targetStats[key], value)
+        elif isinstance(value, list):
+            for example in value:
+                if len(targetStats[key]) >= 5:
+                    break
+                if example not in targetStats[key]:
+                    targetStats[key].append(example)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            targetStats[key] += value
+
+
+# ----------------------------------------
+def clearStatPack(stats):
+    """zero the counts in a stat pack while keeping its structure"""
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            clearStatPack(value)
+        elif isinstance(value, list):
+            value.clear()
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            stats[key] = 0
+
+
+# ----------------------------------------
+def scanRecordOffsets(inputFileName, chunkSize=8 * 1024 * 1024):
+    """yield the tag, id, byte offset and length of every person and entity"""
+    tagPattern = re.compile(rb"<(/?)(Person|Entity)[\s>]")
+    idPattern = re.compile(rb'\sid="([^"]*)"')
+    with open(inputFileName, "rb") as inputFile:
+        bufferOffset = 0
+        buffer = b""
+        recordStart = None
+        recordId = None
+        while True:
+            chunk = inputFile.read(chunkSize)
+            buffer += chunk
+            position = 0
+            for match in tagPattern.finditer(buffer):
+                if match.group(1):
+                    if recordStart is not None:
+                        yield (
+                            match.group(2).decode(),
+                            recordId,
+                            recordStart,
+                            bufferOffset + match.end() - recordStart,
+                        )
+                        recordStart = None
+                    position = match.end()
+                else:
+                    tagEnd = buffer.find(b">", match.start())
+                    if tagEnd == -1:  # --attributes continue in the next chunk
+                        position = match.start()
+                        break
+                    idMatch = idPattern.search(buffer, match.start(), tagEnd)
+                    recordId = idMatch.group(1).decode() if idMatch else None
+                    recordStart = bufferOffset + match.start()
+                    position = tagEnd + 1
+            if not chunk:
+                break
+            # --keep the tail from the last open bracket in case a tag was split
+            lastBracket = buffer.rfind(b"<", position)
+            position = lastBracket if lastBracket != -1 else len(buffer)
+            bufferOffset += position
+            buffer = buffer[position:]
+
+
+# ----------------------------------------
+def fileFingerprint(fileName, sampleSize=1024 * 1024):
+    """identify a version of a file by its size, time and a hash of both ends"""
+    fileStat = os.stat(fileName)
+    fileHash = hashlib.sha256()
+    with open(fileName, "rb") as inputFile:
+        fileHash.update(inputFile.read(sampleSize))
+        if fileStat.st_size > sampleSize:
+            inputFile.seek(max(sampleSize, fileStat.st_size - sampleSize))
+            fileHash.update(inputFile.read(sampleSize))
+    return "%s:%s:%s" % (fileStat.st_size, fileStat.st_mtime_ns, fileHash.hexdigest())
+
+
+# ----------------------------------------
+def restoreSnapshotTables(header, snapshotData):
+    """return the reference tables from a snapshot's header and array bytes"""
+    tableBuffers = {tableName: {} for tableName in header["tables"]}
+    bufferStart = 0
+    for tableName, bufferName, typeCode, itemSize, bufferLength in header["buffers"]:
+        bufferBytes = snapshotData[bufferStart : bufferStart + bufferLength]
+        bufferStart += bufferLength
+        if typeCode:
+            tableBuffer = array(typeCode)
+            if tableBuffer.itemsize != itemSize:
+                raise ValueError("array item sizes do not match")
+            tableBuffer.frombytes(bufferBytes)
+        else:
+            tableBuffer = bytearray(bufferBytes)
+        tableBuffers[tableName][bufferName] = tableBuffer
+    if bufferStart != len(snapshotData):
+        raise ValueError("array lengths do not match the snapshot size")
+
+    tables = {
+        tableName: header["codes"][tableName] for tableName in REFERENCE_TABLES[:7]
+    }
+    tables["profileIds"] = ProfileIdTable()
+    tables["relationships"] = AssociateTable(tables["profileIds"])
+    tables["entityNames"] = ProfileValueTable(tables["profileIds"])
+    tables["entityDuns"] = ProfileValueTable(tables["profileIds"])
+    for tableName in REFERENCE_TABLES[7:]:
+        tables[tableName].restore(header["tables"][tableName], tableBuffers[tableName])
+    return tables
+
+
+# ----------------------------------------
+def initMappingWorker(mapper):
+    """set up a worker process with a copy of the mapper of the main process"""
+    global workerMapper
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    workerMapper = mapper
+    # --zero the base library stats so only this worker's counts are merged
+    clearStatPack(baseLibrary.statPack)
+
+
+# ----------------------------------------
+def mapRecordRange(recordRange):
+    """map the profiles in a byte range of the file with the worker's mapper"""
+    return workerMapper.mapRecordRange(recordRange)
+
+
+# ----------------------------------------
+def chunkRecordRanges(inputFileName, chunkRecords):
+    """group consecutive profiles into byte ranges for the workers"""
+    chunkStart = None
+    chunkEnd = None
+    recordCount = 0
+    for tag, recordId, offset, length in scanRecordOffsets(inputFileName):
+        if chunkStart is None:
+            chunkStart = offset
+        chunkEnd = offset + length
+        recordCount += 1
+        if recordCount == chunkRecords:
+            yield (inputFileName, chunkStart, chunkEnd)
+            chunkStart = None
+            recordCount = 0
+    if chunkStart is not None:
+        yield (inputFileName, chunkStart, chunkEnd)
+
+
+# ----------------------------------------
+def expandInputFiles(inputNames):
+    """return the input files, with the Dow Jones files in any directories given"""
+    inputFileNames = []
+    for inputName in inputNames:
+        if os.path.isdir(inputName):
+            inputFileNames.extend(
+                os.path.join(inputName, fileName)
+                for fileName in sorted(os.listdir(inputName))
+                if fileName.lower().endswith(INPUT_FILE_EXTENSIONS)
+                and os.path.isfile(os.path.join(inputName, fileName))
+            )
+        else:
+            inputFileNames.append(inputName)
+    return inputFileNames
+
+
+# ----------------------------------------
+def inferDataSource(inputFileName):
+    """return the data source for a file from names like PFA2_*, DJRC_HRF_XML_*"""
+    baseName = os.path.basename(inputFileName or "")
+    for namePattern, patternDataSource in DATA_SOURCE_PATTERNS:
+        if namePattern.search(baseName):
+            return patternDataSource
+    return "DJ-PFA"
+
+
+# ----------------------------------------
+def inputFileStem(inputFileName):
+    """return the name of an input file without its xml and compression extensions"""
+    return re.sub(
+        r"(\.xml)?(\.zip|\.gz|\.bz2|\.zst)?$",
+        "",
+        os.path.basename(inputFileName),
+        flags=re.IGNORECASE,
+    )
+
+
+# ----------------------------------------
+def outputFileStem(fileName):
+    """return the name of a file without its extension and compression extension"""
+    return re.sub(
+        r"(\.[^.]*)?(\.gz|\.zst|\.zstd)?$",
+        "",
+        os.path.basename(fileName),
+        flags=re.IGNORECASE,
+    )
+
+
+# ----------------------------------------
+def addFileSuffix(fileName, suffix):
+    """return the file name with a suffix added before its extensions"""
+    fileDir, baseName = os.path.split(fileName)
+    stem = outputFileStem(baseName)
+    return os.path.join(fileDir, "%s_%s%s" % (stem, suffix, baseName[len(stem) :]))
+
+
+# ----------------------------------------
+class LinePrefixWriter:
+    """text stream that starts each line with the name of the file being mapped"""
+
+    def __init__(self, stream, prefix):
+        self.stream = stream
+        self.prefix = prefix
+        self.lineStart = True
+
+    def write(self, text):
+        output = []
+        for line in text.splitlines(keepends=True):
+            if self.lineStart:
+                output.append(self.prefix)
+            output.append(line)
+            self.lineStart = line.endswith("\n")
+        self.stream.write("".join(output))
+        # --whole lines at a time so the messages of each file do not mix
+        if self.lineStart:
+            self.stream.flush()
+        return len(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+# ----------------------------------------
+def forkInputFiles(inputFileNames, parallelFiles, mapFile, isStopped=None):
+    """fork a copy of this process to map each input file, a few at a time
+
+    The copy of each file calls mapFile with its file name and exits with the
+    code it returns, so only the original returns. No more copies are started
+    once isStopped returns True. It returns the exit code of each file started
+    once every copy has finished.
+    """
+    runningFiles = {}
+    exitCodes = {}
+    sys.stdout.flush()
+    for inputFileName in inputFileNames:
+        while len(runningFiles) >= parallelFiles:
+            pid, status = os.wait()
+            exitCodes[runningFiles.pop(pid)] = os.waitstatus_to_exitcode(status)
+        if isStopped and isStopped():
+            break
+        pid = os.fork()
+        if pid == 0:
+            exitCode = 1
+            try:
+                sys.stdout = LinePrefixWriter(
+                    sys.stdout, "[%s] " % os.path.basename(inputFileName)
+                )
+                exitCode = mapFile(inputFileName)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                # --the copy must not return into the code that called the original
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exitCode)
+        runningFiles[pid] = inputFileName
+    while runningFiles:
+        pid, status = os.wait()
+        exitCodes[runningFiles.pop(pid)] = os.waitstatus_to_exitcode(status)
+    return exitCodes
+
+
+# ----------------------------------------
+def combineFileLogs(fileLogs, logFileName):
+    """write one statistics file with the stats of each input file and their totals"""
+    statPack = {"FILES": {}, "TOTAL": {}}
+    for inputFileName, fileLog in fileLogs.items():
+        try:
+            with open(fileLog) as fileLogHandle:
+                fileStats = fileLogHandle.read()
+            os.remove(fileLog)
+        except OSError:
+            continue
+        statPack["FILES"][os.path.basename(inputFileName)] = json.loads(fileStats)
+        mergeStatPack(statPack["TOTAL"], json.loads(fileStats))
+    with open(logFileName, "w") as outfile:
+        json.dump(statPack, outfile, indent=4, sort_keys=True)
+
+
+# ----------------------------------------
+class MappingRun:
+    """map the input files of the command line arguments to the output file"""
+
+    def __init__(self, args):
+        self.args = args
+        self.outputFileName = args.output_file
+        self.logFile = args.log_file
+        self.dataSource = args.data_source
+        self.debugLevel = args.debug_level
+        self.dj_profile_id = args.dj_profile_id
+        self.singlePass = args.single_pass
+        self.workerCount = args.workers
+        self.deltaStateFileName = args.delta_state
+        self.metricsFileName = args.metrics_file
+        self.profileDumpFileName = args.profile_dump
+        self.outputShards = args.shards
+        self.splitFeeds = args.split_feeds
+        self.queryIndexFileName = args.query_index
+        self.procStartTime = time.time()
+        self.inputFileName = None
+        self.mapper = None
+        self.profiler = None
+        self.progressMonitor = None
+        self.outputFileHandle = None
+        self.deltaState = None
+        self.queryIndex = None
+        # --set when the output cannot be written
+        self.aborted = False
+        # --set when the user interrupts, shared with the runs of each input file
+        self.interrupted = threading.Event()
+        self.recordCnt = 0
+        self.personCnt = 0
+        self.entityCnt = 0
+
+        if (
+            self.dj_profile_id and not self.debugLevel
+        ):  # --looking up a profile is a form of debugging
+            self.debugLevel = 1
+        if self.debugLevel:  # --debugging needs the reference tables up front
+            self.singlePass = False
+            self.workerCount = 1
+
+    def stop(self, signum=None, frame=None):
+        """stop the run when the user interrupts it, this is the SIGINT handler"""
+        print("USER INTERRUPT! Shutting down ... (please wait)")
+        self.interrupted.set()
+
+    def isStopped(self):
+        """return True if the run should stop"""
+        return (
+            self.interrupted.is_set()
+            or self.aborted
+            or (self.mapper is not None and self.mapper.stopped)
+        )
+
+    def run(self):
+        """map the input files and return the exit code of the run"""
+        mainStdout = sys.stdout
+        # --status messages go to stderr when the records go to stdout
+        if self.outputFileName == "-":
+            sys.stdout = sys.stderr
+        try:
+            if self.singlePass and self.workerCount > 1:
+                print("")
+                print("Single pass mode is not available with multiple workers")
+                self.singlePass = False
+
+            inputFileNames = expandInputFiles(self.args.input_file or [])
+            if len(inputFileNames) > 1:
+                return self.mapInputFiles(inputFileNames)
+            return self.mapInputFile(inputFileNames[0] if inputFileNames else None)
+        finally:
+            sys.stdout = mainStdout
+
+    def mapInputFiles(self, inputFileNames):
+        """map each of several input files with a copy of this process"""
+        if self.debugLevel:
+            print("")
+            print("Debugging and lookups need a single input file")
+            print("")
+            return 1
+        if not self.outputFileName or isStreamOutput(self.outputFileName):
+            print("")
+            print("Please supply an output directory for several input files.")
+            print("")
+            return 1
+        if os.path.isfile(self.outputFileName):
+            print("")
+            print("The output for several input files must be a directory")
+            print("")
+            return 1
+        fileDataSources = [
+            (self.dataSource or inferDataSource(fileName)).upper()
+            for fileName in inputFileNames
+        ]
+        if self.deltaStateFileName and len(set(fileDataSources)) < len(fileDataSources):
+            print("")
+            print("Each input file needs a different data source to keep a delta state")
+            print("")
+            return 1
+        os.makedirs(self.outputFileName, exist_ok=True)
+        fileLogs = {
+            fileName: os.path.join(
+                tempfile.gettempdir(), "dj_mapper_%s_%s.json" % (os.getpid(), fileNum)
+            )
+            for fileNum, fileName in enumerate(inputFileNames)
+        }
+        print("")
+        print("Mapping %s input files ..." % len(inputFileNames))
+
+        def mapFile(inputFileName):
+            fileRun = self.fileRun(inputFileName, fileLogs[inputFileName])
+            return fileRun.mapInputFile(inputFileName)
+
+        if hasattr(os, "fork"):
+            exitCodes = forkInputFiles(
+                inputFileNames,
+                max(1, self.args.parallel_files),
+                mapFile,
+                self.isStopped,
+            )
+        else:
+            exitCodes = self.mapFilesInTurn(inputFileNames, fileLogs)
+
+        failedFiles = [name for name, code in exitCodes.items() if code != 0]
+        if self.logFile:
+            combineFileLogs(fileLogs, self.logFile)
+            print("")
+            print("Mapping stats of all files written to %s" % self.logFile)
+        print("")
+        for failedFile in failedFiles:
+            print("Mapping %s failed!" % failedFile)
+        print(
+            "%s of %s input files mapped in %s minutes"
+            % (
+                len(exitCodes) - len(failedFiles),
+                len(inputFileNames),
+                round((time.time() - self.procStartTime) / 60, 1),
+            )
+        )
+        print("")
+        return 1 if failedFiles or len(exitCodes) < len(inputFileNames) else 0
+
+    def mapFilesInTurn(self, inputFileNames, fileLogs):
+        """map the input files one after the other where processes cannot fork"""
+        exitCodes = {}
+        mainStdout = sys.stdout
+        for inputFileName in inputFileNames:
+            if self.isStopped():
+                break
+            # --each file's log only has the base library stats of that file
+            clearStatPack(baseLibrary.statPack)
+            sys.stdout = LinePrefixWriter(
+                mainStdout, "[%s] " % os.path.basename(inputFileName)
+            )
+            try:
+                fileRun = self.fileRun(inputFileName, fileLogs[inputFileName])
+                exitCodes[inputFileName] = fileRun.mapInputFile(inputFileName)
+            finally:
+                sys.stdout = mainStdout
+        return exitCodes
+
+    def fileRun(self, inputFileName, fileLog):
+        """return the run of one of several input files, with outputs of its own"""
+        fileRun = copy.copy(self)
+        inputStem = inputFileStem(inputFileName)
+        fileRun.outputFileName = os.path.join(self.outputFileName, inputStem + ".json")
+        fileRun.logFile = fileLog if self.logFile else None
+        fileRun.dataSource = self.dataSource or inferDataSource(inputFileName)
+        if self.deltaStateFileName:
+            fileRun.deltaStateFileName = addFileSuffix(
+                self.deltaStateFileName, fileRun.dataSource.upper()
+            )
+        if self.metricsFileName:
+            fileRun.metricsFileName = addFileSuffix(self.metricsFileName, inputStem)
+        if self.profileDumpFileName:
+            fileRun.profileDumpFileName = addFileSuffix(
+                self.profileDumpFileName, inputStem
+            )
+        if self.queryIndexFileName:
+            fileRun.queryIndexFileName = addFileSuffix(
+                self.queryIndexFileName, inputStem
+            )
+        return fileRun
+
+    def mapInputFile(self, inputFileName):
+        """map a single input file and return the exit code"""
+        self.inputFileName = inputFileName
+        self.profiler = MappingProfiler() if self.args.profile else None
+        self.progressMonitor = ProgressMonitor(self.metricsFileName)
+        fullFile = self.args.full_file or bool(
+            re.search(
+                r"_F(\.xml)?(\.zip|\.gz|\.bz2|\.zst)?$",
+                inputFileName or "",
+                re.IGNORECASE,
+            )
+        )
+        if not self.dataSource and inputFileName:
+            self.dataSource = inferDataSource(inputFileName)
+
+        if not inputFileName:
+            print("")
+            print("Please select a dow jones xml input file")
+            print("")
+            return 1
+
+        if not os.path.exists(inputFileName):
+            print("")
+            print("Input file %s not found!" % inputFileName)
+            print("")
+            return 1
+
+        # --the mapper holds the options and reference tables the mapping reads
+        try:
+            self.mapper = DowJonesMapper(
+                data_source=self.dataSource,
+                relationship_style=self.args.relationship_style,
+                extended_format=self.args.extended_format,
+                parser=self.args.parser,
+                json_encoder=self.args.json_encoder,
+                stats_mode=self.args.stats_mode,
+                split_feeds=self.splitFeeds,
+                use_snapshot=self.args.snapshot,
+                max_rss_mb=self.args.max_rss_mb,
+                profiler=self.profiler,
+                progress_monitor=self.progressMonitor,
+            )
+        except ValueError as err:
+            print("")
+            print(err)
+            print("")
+            return 1
+        self.mapper.deferRelationships = self.singlePass
+
+        # --compressed files can only be streamed
+        compressedInput = inputCompression(inputFileName)
+        if compressedInput == "zstd" and zstandard is None:
+            print("")
+            print("Please pip install zstandard to read .zst files")
+            print("")
+            return 1
+        if compressedInput and self.workerCount > 1:
+            print("")
+            print("Multiple workers need an uncompressed input file")
+            self.workerCount = 1
+
+        if not (self.outputFileName) and not self.debugLevel:
+            print("")
+            print("Please supply an output file name.")
+            print("")
+            return 1
+
+        if not self.openOutputs():
+            return 1
+
+        # --open the state of prior runs
+        if self.deltaStateFileName and not self.debugLevel:
+            try:
+                self.deltaState = DeltaState(
+                    self.deltaStateFileName, fullFile, self.mapper.stats
+                )
+            except sqlite3.Error as err:
+                print("")
+                print("Could not open delta state file %s" % self.deltaStateFileName)
+                print(" %s" % err)
+                print("")
+                return 1
+
+        # --index the records for the query command
+        if self.queryIndexFileName and not self.debugLevel:
+            try:
+                self.queryIndex = QueryIndex(self.queryIndexFileName, self.mapper)
+            except (IOError, sqlite3.Error) as err:
+                print("")
+                print("Could not create query index %s" % self.queryIndexFileName)
+                print(" %s" % err)
+                print("")
+                return 1
+
+        if self.profileDumpFileName:
+            processProfile = cProfile.Profile()
+            processProfile.enable()
+
+        # --iterate through the xml file serially as it is huge!
+        print("")
+        print("Data source set to %s" % self.mapper.dataSource)
+        print("Parser backend set to %s" % self.mapper.parserBackend)
+        print("Json encoder set to %s" % self.mapper.jsonEncoder)
+        print("")
+        print("Reading from: %s ..." % inputFileName)
+        # --a single pass is not needed if the reference tables are already complete
+        referencesLoaded = False
+        if self.singlePass and self.mapper.useSnapshot:
+            referencesLoaded = self.mapper.loadSnapshot(inputFileName)
+            self.singlePass = self.mapper.deferRelationships = not referencesLoaded
+
+        lookupNode = None
+        if self.singlePass:
+            self.mapSinglePass()
+        elif self.dj_profile_id and not compressedInput:
+            lookupNode = self.mapper.lookupProfile(inputFileName, self.dj_profile_id)
+            if lookupNode is None:
+                print("")
+                print("Profile %s not found!" % self.dj_profile_id)
+        elif self.debugLevel != 1 and not referencesLoaded:
+            if self.profiler:
+                self.profiler.nextPass("references")
+            self.mapper.build_references(inputFileName)
+
+        # --go through a second time to process the records
+        if not self.singlePass:
+            if self.profiler:
+                self.profiler.nextPass("records")
+            self.progressMonitor.startPass("records")
+        if self.workerCount > 1:
+            print("")
+            print("processing records with %s workers ..." % self.workerCount)
+            self.mapWithWorkers()
+        elif not self.singlePass and not (self.debugLevel or self.dj_profile_id):
+            print("")
+            print("processing records ...")
+            self.mapRecords()
+        elif not self.singlePass:
+            print("")
+            if self.dj_profile_id:
+                print("searching for %s ..." % self.dj_profile_id)
+            else:
+                print("processing records ...")
+            if self.dj_profile_id and not compressedInput:
+                xmlReader = [lookupNode] if lookupNode is not None else []
+            else:
+                xmlReader = self.mapper.iterInputElements(inputFileName, RECORD_TAGS)
+            self.debugRecords(xmlReader)
+
+        if self.deltaState:
+            if self.profiler:
+                self.profiler.nextPass("deletes")
+            if not self.isStopped():
+                self.writeDeletes()
+            self.deltaState.close(not self.isStopped())
+
+        self.closeOutputs()
+        if self.profiler:
+            self.profiler.nextPass()
+        self.progressMonitor.finish(
+            "aborted" if self.isStopped() else "completed", self.recordCnt
+        )
+        if self.profileDumpFileName:
+            processProfile.disable()
+            processProfile.dump_stats(self.profileDumpFileName)
+
+        print("%s rows processed, completed!" % self.recordCnt)
+        print("%s persons" % self.personCnt)
+        print("%s entities" % self.entityCnt)
+        if self.splitFeeds and self.outputFileName:
+            for feedDataSource, feedCount in sorted(
+                self.outputFileHandle.recordCounts.items()
+            ):
+                print(
+                    "%s %s records to %s"
+                    % (
+                        feedCount,
+                        feedDataSource,
+                        addFileSuffix(self.outputFileName, feedDataSource),
+                    )
+                )
+
+        # --write statistics file
+        if self.logFile:
+            print("")
+            self.writeStats()
+
+        if self.profiler:
+            self.profiler.printSummary()
+        if self.profileDumpFileName:
+            print("")
+            print("Profile dump written to %s" % self.profileDumpFileName)
+
+        print("")
+        elapsedMins = round((time.time() - self.procStartTime) / 60, 1)
+        if not self.isStopped():
+            print("Process completed successfully in %s minutes!" % elapsedMins)
+        else:
+            print("Process aborted after %s minutes!" % elapsedMins)
+        print("")
+        return 1 if self.isStopped() else 0
+
+    def openOutputs(self):
+        """open the output file, or its feeds or shards, return False if not"""
+        streamOutput = self.outputFileName and isStreamOutput(self.outputFileName)
+        if streamOutput and self.outputShards > 1:
+            print("")
+            print("Shards need an output file rather than a pipe or socket")
+            print("")
+            return False
+        if streamOutput and self.splitFeeds:
+            print("")
+            print("Split feeds need an output file rather than a pipe or socket")
+            print("")
+            return False
+        if not self.outputFileName:
+            return True
+
+        outputShards = self.outputShards
+        feedDataSources = ["DJ-PFA"] + [
+            feedDataSource for feedDataSource, namePattern in TRIFECTA_FEEDS
+        ]
+        try:
+            if self.splitFeeds and outputShards > 1:
+                self.outputFileHandle = FeedOutputWriter(
+                    self.outputFileName,
+                    lambda feedFileName: ShardedOutputWriter(
+                        feedFileName, outputShards
+                    ),
+                    feedDataSources,
+                )
+            elif self.splitFeeds:
+                self.outputFileHandle = FeedOutputWriter(
+                    self.outputFileName, OutputWriter, feedDataSources
+                )
+            elif outputShards > 1:
+                self.outputFileHandle = ShardedOutputWriter(
+                    self.outputFileName, outputShards
+                )
+            elif streamOutput:
+                # --small batches so the reader gets records as soon as they are mapped
+                self.outputFileHandle = OutputWriter(
+                    self.outputFileName, bufferSize=64 * 1024
+                )
+            else:
+                self.outputFileHandle = OutputWriter(self.outputFileName)
+        except IOError as err:
+            print("")
+            print("Could not open output file %s for writing" % self.outputFileName)
+            print(" %s" % err)
+            print("")
+            return False
+        return True
+
+    def mapSinglePass(self):
+        """map the records as the reference tables are read, then add relationships"""
+        mapper = self.mapper
+        if self.profiler:
+            self.profiler.nextPass("single pass")
+        self.progressMonitor.startPass("single pass")
+        if isStreamOutput(self.outputFileName):
+            spoolFileName = os.path.join(
+                tempfile.gettempdir(), "dj_mapper_%s.spool" % os.getpid()
+            )
+        else:
+            spoolFileName = self.outputFileName + ".spool"
+        spoolFileHandle = open(spoolFileName, "wb")
+        print("")
+        print("processing records in a single pass ...")
+        for node in mapper.iterInputElements(self.inputFileName, REFERENCE_TAGS):
+            if node.tag in RECORD_TAGS:
+                if node.tag == "Person":
+                    jsonData = mapper.g2Mapping(node, "PERSON")
+                    self.personCnt += 1
+                else:
+                    jsonData = mapper.g2Mapping(node, "ORGANIZATION")
+                    self.entityCnt += 1
+                spoolPrefix = "%s\t%s\t%s\t" % (
+                    jsonData["DJ_PROFILE_ID"],
+                    jsonData["RECORD_TYPE"],
+                    jsonData["DATA_SOURCE"],
+                )
+                try:
+                    spoolFileHandle.write(
+                        spoolPrefix.encode("utf-8")
+                        + mapper.jsonBytes(jsonData, newline=True)
+                    )
+                except IOError as err:
+                    print("")
+                    print("Could not write to %s" % spoolFileName)
+                    print(" %s" % err)
+                    print("")
+                    self.aborted = True
+                # --the record is indexed by its attributes now and by its line once the
+                # --relationships are added
+                if self.queryIndex:
+                    self.queryIndex.addAttributes(
+                        jsonData["RECORD_ID"], mapper.recordAttributes(jsonData)
+                    )
+
+                self.recordCnt += 1
+                if self.recordCnt % mapper.progressInterval == 0:
+                    self.progressMonitor.report(self.recordCnt, "rows processed")
+
+            # --entity names and duns are collected after mapping as this clears the node
+            mapper.loadReferenceNode(node)
+            if self.isStopped():
+                break
+
+        spoolFileHandle.close()
+        # --a stopped run only read part of the file, so its records are not written
+        if self.isStopped():
+            os.remove(spoolFileName)
+            return
+        self.finalizeSinglePass(spoolFileName)
+        if mapper.useSnapshot and not self.isStopped():
+            mapper.saveSnapshot(self.inputFileName)
+
+    def finalizeSinglePass(self, spoolFileName):
+        """patch the deferred relationships into the spooled records"""
+        mapper = self.mapper
+        placeholder = mapper.jsonBytes({"RELATIONSHIPS": None})[1:-1]
+        print("")
+        print("adding relationships ...")
+        if self.profiler:
+            self.profiler.nextPass("relationships")
+        mapper.buildRelationshipEdges()
+        self.progressMonitor.startPass("relationships")
+        lineCount = 0
+        with open(spoolFileName, "rb") as spoolFileHandle:
+            self.progressMonitor.trackFile(
+                spoolFileHandle, os.path.getsize(spoolFileName)
+            )
+            for line in spoolFileHandle:
+                thisId, recordType, recordDataSource, recordLine = line.decode(
+                    "utf-8"
+                ).split("\t", 3)
+                thisList = mapper.mapRelationships(thisId, recordType)
+                recordLine = recordLine.encode("utf-8")
+                if thisList:
+                    recordLine = recordLine.replace(
+                        placeholder, placeholder[:-4] + mapper.jsonBytes(thisList), 1
+                    )
+                else:
+                    recordLine = recordLine.replace(b"," + placeholder, b"", 1)
+                self.writeRecord(thisId, recordLine, recordDataSource)
+                if self.isStopped():
+                    break
+                lineCount += 1
+                if lineCount % mapper.progressInterval == 0:
+                    self.progressMonitor.report(lineCount, "relationships added")
+        os.remove(spoolFileName)
+
+    def mapRecords(self):
+        """map the records of the file in this process"""
+        for jsonData in self.mapper.map_records(self.inputFileName):
+            if jsonData["RECORD_TYPE"] == "PERSON":
+                self.personCnt += 1
+            else:
+                self.entityCnt += 1
+            self.writeRecord(
+                jsonData["RECORD_ID"],
+                self.mapper.jsonBytes(jsonData, newline=True),
+                jsonData["DATA_SOURCE"],
+                self.queryAttributes(jsonData),
+            )
+            if self.isStopped():
+                break
+
+            self.recordCnt += 1
+            if self.recordCnt % self.mapper.progressInterval == 0:
+                self.progressMonitor.report(self.recordCnt, "rows processed")
+
+    def debugRecords(self, xmlReader):
+        """show the xml and json of the records, or of the profile looked up"""
+        mapper = self.mapper
+        for node in xmlReader:
+            if self.isStopped():
+                break
+
+            if self.dj_profile_id and node.attrib["id"] != self.dj_profile_id:
+                node.clear()
+                continue
+
+            if self.debugLevel in (1, 2):
+                print("=" * 50)
+                print(mapper.prettyXml(node))
+            if self.debugLevel == 1:
+                if pause() is None:
+                    self.interrupted.set()
+                continue
+
+            if node.tag == "Person":
+                jsonData = mapper.g2Mapping(node, "PERSON")
+                self.personCnt += 1
+            else:
+                jsonData = mapper.g2Mapping(node, "ORGANIZATION")
+                self.entityCnt += 1
+            if self.debugLevel == 2:
+                print("-" * 50)
+                print(json.dumps(jsonData, ensure_ascii=False, indent=4))
+                if pause() is None:
+                    self.interrupted.set()
+
+            if self.outputFileName:
+                self.writeRecord(
+                    jsonData["RECORD_ID"],
+                    mapper.jsonBytes(jsonData, newline=True),
+                    jsonData["DATA_SOURCE"],
+                    self.queryAttributes(jsonData),
+                )
+
+            if self.dj_profile_id and node.attrib["id"] == self.dj_profile_id:
+                break
+
+            node.clear()
+
+            if self.isStopped():
+                break
+
+            self.recordCnt += 1
+            if self.recordCnt % mapper.progressInterval == 0:
+                self.progressMonitor.report(self.recordCnt, "rows processed")
+
+    def mapWithWorkers(self):
+        """map the records section in parallel and merge the results"""
+        if "fork" in multiprocessing.get_all_start_methods():
+            mpContext = multiprocessing.get_context("fork")
+        else:
+            mpContext = multiprocessing.get_context()
+
+        workerBaseStats = {}
+        # --the chunks being mapped or waiting to be written, the depth is the backlog
+        chunksQueued = [0]
+        bytesDone = 0
+        # --the pool only takes a chunk when there is a free slot, so the output of
+        # --the workers cannot pile up in memory when the output is slow
+        chunkSlots = threading.Semaphore(self.workerCount * 4)
+        stopQueueing = threading.Event()
+
+        def queueChunks(recordRanges):
+            for recordRange in recordRanges:
+                chunkSlots.acquire()
+                if stopQueueing.is_set():
+                    return
+                chunksQueued[0] += 1
+                yield recordRange
+
+        self.progressMonitor.setTotalBytes(os.path.getsize(self.inputFileName))
+        with mpContext.Pool(
+            self.workerCount,
+            initializer=initMappingWorker,
+            initargs=(self.mapper.workerCopy(self.queryIndex is not None),),
+        ) as workerPool:
+            recordRanges = queueChunks(chunkRecordRanges(self.inputFileName, 1000))
+            if self.args.ordered_output:
+                results = workerPool.imap(mapRecordRange, recordRanges)
+            else:
+                results = workerPool.imap_unordered(mapRecordRange, recordRanges)
+            try:
+                for (
+                    chunkOutput,
+                    chunkPersons,
+                    chunkEntities,
+                    chunkStats,
+                    chunkProfiler,
+                    chunkEnd,
+                    pid,
+                    baseStats,
+                ) in results:
+                    chunksQueued[0] -= 1
+                    chunkSlots.release()
+                    bytesDone = max(bytesDone, chunkEnd)
+                    for (
+                        recordId,
+                        recordDataSource,
+                        recordLine,
+                        attributes,
+                    ) in chunkOutput:
+                        self.writeRecord(
+                            recordId, recordLine, recordDataSource, attributes
+                        )
+                        if self.isStopped():
+                            break
+                    self.mapper.stats.merge(chunkStats)
+                    if chunkProfiler:
+                        self.profiler.merge(chunkProfiler)
+                    workerBaseStats[pid] = baseStats
+
+                    priorCount = self.recordCnt
+                    self.personCnt += chunkPersons
+                    self.entityCnt += chunkEntities
+                    self.recordCnt += chunkPersons + chunkEntities
+                    progressInterval = self.mapper.progressInterval
+                    if (
+                        self.recordCnt // progressInterval
+                        > priorCount // progressInterval
+                    ):
+                        self.progressMonitor.report(
+                            self.recordCnt, "rows processed", bytesDone, chunksQueued[0]
+                        )
+                        if self.mapper.maxRssMb and not checkMemory(
+                            self.mapper.maxRssMb
+                        ):
+                            self.mapper.stopped = True
+                    if self.isStopped():
+                        break
+            finally:
+                # --wake the pool's queueing of chunks if it waits for a slot, so
+                # --leaving the pool can terminate it
+                stopQueueing.set()
+                chunkSlots.release()
+
+        for baseStats in workerBaseStats.values():
+            mergeStatPack(baseLibrary.statPack, baseStats)
+
+    def queryAttributes(self, jsonData):
+        """return the attributes to index a mapped record by, if there is an index"""
+        if self.queryIndex:
+            return self.mapper.recordAttributes(jsonData)
+        return ()
+
+    def writeRecord(self, recordId, recordLine, recordDataSource, attributes=()):
+        """write a mapped record to the output file"""
+        if self.queryIndex:
+            self.queryIndex.addRecord(
+                recordId, recordLine, recordDataSource, attributes
+            )
+        if self.deltaState and not self.deltaState.isChanged(
+            recordId, recordLine, recordDataSource
+        ):
+            return
+        self.writeOutput(recordLine, recordId, recordDataSource)
+
+    def writeOutput(self, outputLine, recordId, recordDataSource):
+        """write a json line to the output file, or its feed or shard of the output"""
+        try:
+            recordOutput = self.outputFileHandle
+            if self.splitFeeds:
+                recordOutput = self.outputFileHandle.output(recordDataSource)
+            if self.outputShards > 1:
+                recordOutput.write(outputLine, recordId)
+            else:
+                recordOutput.write(outputLine)
+        except IOError as err:
+            self.reportWriteError(err)
+
+    def reportWriteError(self, err):
+        """stop the run when the output cannot be written"""
+        print("")
+        if isinstance(err, ConnectionError):
+            outputName = "stdout" if self.outputFileName == "-" else self.outputFileName
+            print("The reader of %s has closed it, stopping ..." % outputName)
+        else:
+            print("Could not write to %s" % self.outputFileName)
+            print(" %s" % err)
+        print("")
+        self.aborted = True
+
+    def writeDeletes(self):
+        """write a delete for each record of the prior run missing from a full file"""
+        for recordId, recordDataSource in self.deltaState.deletedRecords():
+            self.writeOutput(
+                self.mapper.jsonBytes(
+                    {
+                        "DATA_SOURCE": recordDataSource,
+                        "RECORD_ID": recordId,
+                        "DSRC_ACTION": "D",
+                    },
+                    newline=True,
+                ),
+                recordId,
+                recordDataSource,
+            )
+
+    def closeOutputs(self):
+        """close the output, then write the shard manifests and the query index"""
+        if self.outputFileName:
+            try:
+                self.outputFileHandle.close()
+            except IOError as err:
+                self.reportWriteError(err)
+        # --the manifest tells the loaders the shards are complete
+        if self.outputShards > 1 and self.outputFileName and not self.isStopped():
+            shardedOutputs = {self.mapper.dataSource: self.outputFileHandle}
+            if self.splitFeeds:
+                shardedOutputs = self.outputFileHandle.outputs
+            for manifestDataSource, shardedOutput in shardedOutputs.items():
+                try:
+                    shardedOutput.writeManifest(
+                        {
+                            "input_file": os.path.basename(self.inputFileName),
+                            "data_source": manifestDataSource,
+                            "created": datetime.now().isoformat(timespec="seconds"),
+                        }
+                    )
+                    print("")
+                    print("Shard manifest written to %s" % shardedOutput.manifestName)
+                except IOError as err:
+                    print("")
+                    print("Could not write to %s" % shardedOutput.manifestName)
+                    print(" %s" % err)
+                    print("")
+                    self.aborted = True
+        if self.queryIndex:
+            try:
+                self.queryIndex.close(
+                    not self.isStopped(),
+                    {
+                        "input_file": os.path.basename(self.inputFileName),
+                        "data_source": self.mapper.dataSource,
+                        "created": datetime.now().isoformat(timespec="seconds"),
+                    },
+                )
+                if not self.isStopped():
+                    print("")
+                    print("Query index written to %s" % self.queryIndexFileName)
+            except (IOError, sqlite3.Error) as err:
+                print("")
+                print("Could not write query index %s" % self.queryIndexFileName)
+                print(" %s" % err)
+                print("")
+                self.aborted = True
+
+    def writeStats(self):
+        """write the mapping statistics to the log file"""
+        mapper = self.mapper
+        mapper.addCacheStats()
+        mapper.stats.process["REFERENCE_TABLE_BYTES"] = {
+            "profileIds": mapper.profileIds.footprint(),
+            "relationships": mapper.relationships.footprint(),
+            "entityNames": mapper.entityNames.footprint(),
+            "entityDuns": mapper.entityDuns.footprint(),
+        }
+        mapper.stats.process["PEAK_RSS_MB"] = peakRssMb()
+        if self.workerCount > 1:
+            mapper.stats.process["PEAK_WORKER_RSS_MB"] = peakRssMb("children")
+        statPack = mapper.stats.toDict()
+        statPack["BASE_LIBRARY"] = baseLibrary.statPack
+        if self.profiler:
+            statPack["PROFILE"] = self.profiler.toDict()
+        with open(self.logFile, "w") as outfile:
+            json.dump(statPack, outfile, indent=4, sort_keys=True)
+        print("Mapping stats written to %s" % self.logFile)
+
+
+# ----------------------------------------
+def buildArgumentParser():
+    """return the parser of the command line arguments"""
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        "-i",
+        "--input_file",
+        default=[os.getenv("input_file")] if os.getenv("input_file") else None,
+        nargs="+",
+        type=str,
+        help="Dow Jones xml files or directories of them for PFA, HRF or AME, may be zipped or compressed with gzip, bz2 or zstd.",
+    )
+    argparser.add_argument(
+        "-o",
         "--output_file",
         default=os.getenv("output_file", None),
         type=str,
-        help="output filename, defaults to input file name with a .json extension.",
+        help="output filename, - for stdout, or a named pipe or unix socket. A .gz or .zst extension compresses it.",
     )
     argparser.add_argument(
         "-l",
@@ -912,7 +4117,7 @@ if __name__ == "__main__":
         "--data_source",
         default=os.getenv("data_source".upper(), None),
         type=str,
-        help="please use DJ-PFA, DJ-HRF or DJ-AME based on the type of file.",
+        help="defaults to DJ-PFA, DJ-HRF or DJ-AME based on the name of the file.",
     )
     argparser.add_argument(
         "-r",
@@ -945,295 +4150,219 @@ if __name__ == "__main__":
         type=str,
         help="enter a DJ profile ID to lookup for debugging purposes",
     )
+    argparser.add_argument(
+        "-s",
+        "--single_pass",
+        dest="single_pass",
+        action="store_true",
+        default=False,
+        help="read the file only once, relationships are added at the end",
+    )
+    argparser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="number of processes to map the records with, defaults to 1",
+    )
+    argparser.add_argument(
+        "--ordered_output",
+        dest="ordered_output",
+        action="store_true",
+        default=False,
+        help="keep the original record order when mapping with multiple workers",
+    )
+    argparser.add_argument(
+        "--parser",
+        dest="parser",
+        choices=("auto", "lxml", "etree"),
+        default="auto",
+        help="xml parser to use, auto uses etree as it maps faster than lxml",
+    )
+    argparser.add_argument(
+        "--json_encoder",
+        dest="json_encoder",
+        choices=("auto", "orjson", "json"),
+        default="auto",
+        help="json encoder to use, defaults to orjson if installed",
+    )
+    argparser.add_argument(
+        "--stats",
+        dest="stats_mode",
+        choices=("off", "counts", "full"),
+        default="full",
+        help="statistics to collect for the log file, counts skips the examples",
+    )
+    argparser.add_argument(
+        "--snapshot",
+        dest="snapshot",
+        action="store_true",
+        default=False,
+        help="save the reference tables next to the input file and reuse them while it is unchanged",
+    )
+    argparser.add_argument(
+        "--delta_state",
+        dest="delta_state",
+        type=str,
+        help="state file of the records written by prior runs, only new or changed records are written",
+    )
+    argparser.add_argument(
+        "--full_file",
+        dest="full_file",
+        action="store_true",
+        default=False,
+        help="write deletes for records missing from this file, assumed for file names ending in _F.xml or _F.zip",
+    )
+    argparser.add_argument(
+        "--max_rss_mb",
+        dest="max_rss_mb",
+        type=int,
+        default=0,
+        help="stop if the memory used goes over this many megabytes",
+    )
+    argparser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        default=False,
+        help="time each section of the mapping and add it to the log file",
+    )
+    argparser.add_argument(
+        "--profile_dump",
+        dest="profile_dump",
+        type=str,
+        help="write a cProfile dump of the main process to this file",
+    )
+    argparser.add_argument(
+        "--metrics_file",
+        dest="metrics_file",
+        type=str,
+        help="keep the progress of the run in this json file, or in prometheus format if it ends in .prom",
+    )
+    argparser.add_argument(
+        "--shards",
+        dest="shards",
+        type=int,
+        default=1,
+        help="split the output into this many files by record id, with a manifest of them",
+    )
+    argparser.add_argument(
+        "--split_feeds",
+        dest="split_feeds",
+        action="store_true",
+        default=False,
+        help="write the pfa, adverse media and state owned profiles of a trifecta file to their own outputs and data sources",
+    )
+    argparser.add_argument(
+        "--parallel_files",
+        dest="parallel_files",
+        type=int,
+        default=1,
+        help="number of input files to map at once, defaults to 1",
+    )
+    argparser.add_argument(
+        "--query_index",
+        dest="query_index",
+        type=str,
+        help="index the mapped records in this file so they can be found with the query command",
+    )
 
-    args = argparser.parse_args()
-    inputFileName = args.input_file
-    outputFileName = args.output_file
-    logFile = args.log_file
-    dataSource = args.data_source
-    relationshipStyle = args.relationship_style
-    extendedFormat = args.extended_format
-    debugLevel = args.debug_level
-    dj_profile_id = args.dj_profile_id
-    if (
-        dj_profile_id and not debugLevel
-    ):  # --looking up a profile is a form of debugging
-        debugLevel = 1
-
-    # --deprecated arguments
-    noRelationships = False
-    addCompositeKeys = False
-
-    if not inputFileName:
-        print("")
-        print("Please select a dow jones xml input file")
-        print("")
-        sys.exit(1)
-
-    if not os.path.exists(inputFileName):
-        print("")
-        print("Input file %s not found!" % inputFileName)
-        print("")
-        sys.exit(1)
-
-    # --default and validate the data source
-    if not dataSource:
-        dataSource = "DJ-PFA"
-    else:
-        dataSource = dataSource.upper()
-
-    if not (outputFileName) and not debugLevel:
-        print("")
-        print("Please supply an output file name.")
-        print("")
-        sys.exit(1)
-
-    # --open output file
-    if outputFileName:
-        try:
-            outputFileHandle = open(outputFileName, "w", encoding="utf-8")
-        except IOError as err:
-            print("")
-            print("Could not open output file %s for writing" % outputFileName)
-            print(" %s" % err)
-            print("")
-            sys.exit(1)
-
-    # --initialize some stats
-    recordCnt = 0
-    personCnt = 0
-    entityCnt = 0
-    statPack = {}
-
-    # --initialize code dictionaries
-    countryCodes = {}
-    description1Codes = {}
-    description2Codes = {}
-    description3Codes = {}
-    referenceCodes = {}
-    relationCodes = {}
-    relationships = {}
-    entityNames = {}
-    entityDuns = {}
-
-    # --iterate through the xml file serially as it is huge!
-    print("")
-    print("Data source set to %s" % dataSource)
-    print("")
-    print("Reading from: %s ..." % inputFileName)
-    if debugLevel != 1:
-        xmlReader = etree.iterparse(inputFileName, events=("start", "end"))
-        for event, node in xmlReader:
-            if event == "end":
-
-                if node.tag == "CountryList":
-                    print("loading %s ..." % node.tag)
-                    for record in node.findall("CountryName"):
-                        countryCodes[getAttr(record, "code")] = getAttr(record, "name")
-                    node.clear()
-
-                elif node.tag == "Description1List":
-                    print("loading %s ..." % node.tag)
-                    for record in node.findall("Description1Name"):
-                        description1Codes[getAttr(record, "Description1Id")] = getValue(
-                            record
-                        )
-                    node.clear()
-
-                elif node.tag == "Description2List":
-                    print("loading %s ..." % node.tag)
-                    for record in node.findall("Description2Name"):
-                        description2Codes[getAttr(record, "Description2Id")] = getValue(
-                            record
-                        )
-                    node.clear()
-
-                elif node.tag == "Description3List":
-                    print("loading %s ..." % node.tag)
-                    for record in node.findall("Description3Name"):
-                        description3Codes[getAttr(record, "Description3Id")] = getValue(
-                            record
-                        )
-                    node.clear()
-
-                elif node.tag == "SanctionsReferencesList":
-                    print("loading %s ..." % node.tag)
-                    for record in node.findall("ReferenceName"):
-                        referenceCodes[getAttr(record, "code")] = getAttr(
-                            record, "name"
-                        )
-                    node.clear()
-
-                elif node.tag == "RelationshipList":
-                    print("loading %s ..." % node.tag)
-                    for record in node.findall("Relationship"):
-                        try:
-                            relationCodes[getAttr(record, "code")] = getAttr(
-                                record, "name"
-                            ).replace("_", "-")
-                        except:  # --all but the anti-corruption (soc) feed use the name attribute
-                            try:
-                                relationCodes[getAttr(record, "code")] = getValue(
-                                    record
-                                ).replace("_", "-")
-                            except:
-                                print(
-                                    minidom.parseString(
-                                        etree.tostring(record, "utf-8")
-                                    ).toprettyxml(indent="\t")
-                                )
-                    node.clear()
-
-                elif node.tag == "Associations":
-                    print("loading %s ..." % node.tag)
-                    for record in node.findall("PublicFigure"):
-                        id = getAttr(record, "id")
-                        relationships[id] = []
-                        for record1 in record.findall("Associate"):
-                            relationships[id].append(
-                                {
-                                    "id": getAttr(record1, "id"),
-                                    "code": getAttr(record1, "code"),
-                                    "ex": getAttr(record1, "ex"),
-                                }
-                            )
-                    for record in node.findall("SpecialEntity"):
-                        id = getAttr(record, "id")
-                        relationships[id] = []
-                        for record1 in record.findall("Associate"):
-                            relationships[id].append(
-                                {
-                                    "id": getAttr(record1, "id"),
-                                    "code": getAttr(record1, "code"),
-                                    "ex": getAttr(record1, "ex"),
-                                }
-                            )
-                    node.clear()
-
-                elif node.tag == "Entity":
-                    id = getAttr(node, "id")
-                    for nameRecord in node.findall("NameDetails/Name"):
-                        if nameRecord.attrib["NameType"] == "Primary Name":
-                            for nameValue in nameRecord.findall("NameValue"):
-                                nameOrg = getValue(nameValue, "EntityName")
-                                if nameOrg:
-                                    entityNames[id] = nameOrg
-                                    break
-                            break
-                    for idRecord in node.findall("IDNumberTypes/ID"):
-                        if idRecord.attrib["IDType"] == "DUNS Number":
-                            for idValue in idRecord.findall("IDValue"):
-                                idNumber = getValue(idValue)
-                                if idNumber:
-                                    entityDuns[id] = idNumber
-                                    break
-                            break
-
-                    node.clear()
-
-                elif node.tag in ("Person"):
-                    node.clear()
-
-    # print('countryCodes', len(countryCodes))
-    # print('description1Codes', len(description1Codes))
-    # print('description2Codes', len(description2Codes))
-    # print('description3Codes', len(description3Codes))
-    # print('referenceCodes', len(referenceCodes))
-    # print('relationCodes', len(relationCodes))
-    # print('relationships', len(relationships))
-    # print('entityNames', len(entityNames))
-    # sys.exit(1)
-
-    # --go through a second time to process the records
-    print("")
-    if dj_profile_id:
-        print("searching for %s ..." % dj_profile_id)
-    else:
-        print("processing records ...")
-    xmlReader = etree.iterparse(inputFileName, events=("start", "end"))
-    for event, node in xmlReader:
-        if event == "end" and node.tag in ("Person", "Entity"):
-            if shutDown:
-                break
-
-            if dj_profile_id and node.attrib["id"] != dj_profile_id:
-                node.clear()
-                continue
-
-            if debugLevel in (1, 2):
-                print("=" * 50)
-                print(
-                    minidom.parseString(etree.tostring(node, "utf-8")).toprettyxml(
-                        indent="\t"
-                    )
-                )
-            if debugLevel == 1:
-                pause()
-                continue
-
-            if node.tag == "Person":
-                jsonData = g2Mapping(node, "PERSON")
-                personCnt += 1
-            else:
-                jsonData = g2Mapping(node, "ORGANIZATION")
-                entityCnt += 1
-            msg = json.dumps(jsonData, ensure_ascii=False)
-
-            if debugLevel == 2:
-                print("-" * 50)
-                print(json.dumps(jsonData, ensure_ascii=False, indent=4))
-                pause()
-
-            if outputFileName:
-                try:
-                    outputFileHandle.write(msg + "\n")
-                except IOError as err:
-                    print("")
-                    print("Could not write to %s" % outputFileName)
-                    print(" %s" % err)
-                    print("")
-                    shutDown = True
-
-            if dj_profile_id and node.attrib["id"] == dj_profile_id:
-                break
-
-            node.clear()
-
-            if shutDown:
-                break
+    # --the query command reads an index built by an earlier run
+    subparsers = argparser.add_subparsers(dest="command", metavar="{query}")
+    queryParser = subparsers.add_parser(
+        "query",
+        help="write the records of a query index that match all of the options given",
+    )
+    queryParser.add_argument(
+        "index_file",
+        type=str,
+        help="a query index built with --query_index",
+    )
+    queryParser.add_argument(
+        "--record_type",
+        dest="record_type",
+        type=str,
+        help="PERSON, ORGANIZATION, VESSEL or AIRCRAFT",
+    )
+    queryParser.add_argument(
+        "--data_source",
+        dest="data_source",
+        type=str,
+        help="records of this data source, for an index of split feeds",
+    )
+    queryParser.add_argument(
+        "--country",
+        dest="country",
+        type=str,
+        help="records with this country of any type or in an address",
+    )
+    queryParser.add_argument(
+        "--citizenship",
+        dest="citizenship",
+        type=str,
+        help="records with this citizenship",
+    )
+    queryParser.add_argument(
+        "--description1",
+        dest="description1",
+        type=str,
+        help="records with this Description1 code or name",
+    )
+    queryParser.add_argument(
+        "--description2",
+        dest="description2",
+        type=str,
+        help="records with this Description2 code or name",
+    )
+    queryParser.add_argument(
+        "--description3",
+        dest="description3",
+        type=str,
+        help="records with this Description3 code or name, such as SHIP",
+    )
+    queryParser.add_argument(
+        "--sanctions",
+        dest="sanctions",
+        type=str,
+        help="records on the sanctions list with this code or name",
+    )
+    queryParser.add_argument(
+        "--related_to",
+        dest="related_to",
+        type=str,
+        help="records related to the profile with this DJ profile ID",
+    )
+    queryParser.add_argument(
+        "-o",
+        "--output_file",
+        dest="output_file",
+        type=str,
+        help="json file to write the records to, defaults to stdout",
+    )
+    queryParser.add_argument(
+        "--limit",
+        dest="limit",
+        type=int,
+        default=0,
+        help="stop after this many records",
+    )
+    queryParser.add_argument(
+        "--count",
+        dest="count",
+        action="store_true",
+        default=False,
+        help="only print the number of matching records",
+    )
+    return argparser
 
-            recordCnt += 1
-            if recordCnt % progressInterval == 0:
-                print("%s rows processed" % recordCnt)
-
-    if outputFileName:
-        outputFileHandle.close()
-
-    print("%s rows processed, completed!" % recordCnt)
-    print("%s persons" % personCnt)
-    print("%s entities" % entityCnt)
-    # print('%s longNameOrgCnt' % longNameOrgCnt)
-    # print('%s longNameLastCnt' % longNameLastCnt)
-    # print('%s longNameMaidenCnt' % longNameMaidenCnt)
-    # print('%s longNameFirstCnt' % longNameFirstCnt)
-    # print('%s longNameMiddleCnt' % longNameMiddleCnt)
-    # print('%s longAddrLineCnt' % longAddrLineCnt)
-    # print('')
-
-    # --write statistics file
-    if logFile:
-        print("")
-        statPack["BASE_LIBRARY"] = baseLibrary.statPack
-        with open(logFile, "w") as outfile:
-            json.dump(statPack, outfile, indent=4, sort_keys=True)
-        print("Mapping stats written to %s" % logFile)
 
-    print("")
-    elapsedMins = round((time.time() - procStartTime) / 60, 1)
-    if shutDown == 0:
-        print("Process completed successfully in %s minutes!" % elapsedMins)
-    else:
-        print("Process aborted after %s minutes!" % elapsedMins)
-    print("")
+# ----------------------------------------
+if __name__ == "__main__":
 
-    sys.exit(0)
+    args = buildArgumentParser().parse_args()
+    if args.command == "query":
+        sys.exit(runQuery(args))
+    mappingRun = MappingRun(args)
+    signal.signal(signal.SIGINT, mappingRun.stop)
+    sys.exit(mappingRun.run())
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# --the mapper is a script in src rather than an installed package
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
@@ -0,0 +1,583 @@
+import bz2
+import gzip
+import io
+import json
+import os
+import sys
+import zipfile
+
+import pytest
+
+# --the mapper needs the mapper-base project on the PYTHONPATH
+pytest.importorskip("base_mapper")
+dj_mapper = pytest.importorskip("dj_mapper")
+
+SAMPLE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "sample.xml"
+)
+RELATION_CODES = {
+    "1": "Wife",
+    "2": "Husband",
+    "3": "Employee",
+    "4": "Employer_Of",
+    "5": "Business Associate",
+}
+
+
+# ----------------------------------------
+def mapSample(tmp_path, fileName, *mapperArgs):
+    """map the sample file with the command line arguments, return its records by id"""
+    outputFileName = str(tmp_path / fileName)
+    args = dj_mapper.buildArgumentParser().parse_args(
+        ["-i", SAMPLE_FILE, "-o", outputFileName] + list(mapperArgs)
+    )
+    assert dj_mapper.MappingRun(args).run() == 0
+    with open(outputFileName) as outputFile:
+        records = [json.loads(line) for line in outputFile]
+    return {record["RECORD_ID"]: record for record in records}
+
+
+# ----------------------------------------
+def test_single_pass_patches_relationships(tmp_path):
+    twoPassRecords = mapSample(tmp_path, "two_pass.json")
+    singlePassRecords = mapSample(tmp_path, "single_pass.json", "-s")
+
+    assert singlePassRecords == twoPassRecords
+    assert {
+        "REL_POINTER_DOMAIN": "DJ_ID",
+        "REL_POINTER_KEY": "10",
+        "REL_POINTER_ROLE": "Wife",
+    } in singlePassRecords["11"]["RELATIONSHIPS"]
+    # --the placeholder of a profile without associates is removed
+    assert "RELATIONSHIPS" not in singlePassRecords["22"]
+    with open(tmp_path / "single_pass.json") as outputFile:
+        assert "null" not in outputFile.read()
+    assert not os.path.exists(tmp_path / "single_pass.json.spool")
+
+
+# ----------------------------------------
+@pytest.mark.parametrize("chunkSize", list(range(1, 80)) + [512, 4096, 8 * 1024 * 1024])
+def test_scan_record_offsets_across_chunk_boundaries(chunkSize):
+    with open(SAMPLE_FILE, "rb") as sampleFile:
+        sampleData = sampleFile.read()
+
+    recordOffsets = list(dj_mapper.scanRecordOffsets(SAMPLE_FILE, chunkSize))
+
+    assert [(tag, recordId) for tag, recordId, offset, length in recordOffsets] == [
+        ("Person", "10"),
+        ("Person", "11"),
+        ("Entity", "20"),
+        ("Entity", "21"),
+        ("Entity", "22"),
+    ]
+    for tag, recordId, offset, length in recordOffsets:
+        recordData = sampleData[offset : offset + length]
+        assert recordData.startswith(b'<%s id="%s"' % (tag.encode(), recordId.encode()))
+        assert recordData.endswith(b"</%s>" % tag.encode())
+
+
+# ----------------------------------------
+def test_delta_state_deletes_only_from_data_sources_written(tmp_path):
+    stateFileName = str(tmp_path / "delta.db")
+    stats = dj_mapper.StatCollector()
+
+    deltaState = dj_mapper.DeltaState(stateFileName, True, stats)
+    assert deltaState.isChanged("1", b"one\n", "DJ-PFA")
+    assert deltaState.isChanged("2", b"two\n", "DJ-PFA")
+    assert deltaState.isChanged("1", b"one\n", "DJ-AME")
+    assert not list(deltaState.deletedRecords())
+    deltaState.close(True)
+
+    # --the next full file drops profile 2 and has no DJ-AME records at all
+    deltaState = dj_mapper.DeltaState(stateFileName, True, stats)
+    assert not deltaState.isChanged("1", b"one\n", "DJ-PFA")
+    assert list(deltaState.deletedRecords()) == [("2", "DJ-PFA")]
+    deltaState.close(True)
+
+    deltaState = dj_mapper.DeltaState(stateFileName, True, stats)
+    assert deltaState.isChanged("2", b"two\n", "DJ-PFA")
+    assert not deltaState.isChanged("1", b"one\n", "DJ-AME")
+    assert list(deltaState.deletedRecords()) == [("1", "DJ-PFA")]
+    # --an aborted run keeps the state of the last completed one
+    deltaState.close(False)
+
+    assert stats.counts[("DELTA", "DELETED")] == 2
+
+
+# ----------------------------------------
+def test_delta_state_does_not_delete_for_a_partial_file(tmp_path):
+    stateFileName = str(tmp_path / "delta.db")
+    stats = dj_mapper.StatCollector()
+    deltaState = dj_mapper.DeltaState(stateFileName, True, stats)
+    deltaState.isChanged("1", b"one\n", "DJ-PFA")
+    deltaState.isChanged("2", b"two\n", "DJ-PFA")
+    deltaState.close(True)
+
+    deltaState = dj_mapper.DeltaState(stateFileName, False, stats)
+    assert deltaState.isChanged("1", b"one changed\n", "DJ-PFA")
+    assert not list(deltaState.deletedRecords())
+    deltaState.close(True)
+
+
+# ----------------------------------------
+def test_stat_collector_merge():
+    stats = dj_mapper.StatCollector()
+    stats.update("NAMES", "PRIMARY", "John Smith")
+    stats.addProcessCounts("ID_NOTE_CACHE", {"hits": 1})
+    workerStats = dj_mapper.StatCollector()
+    workerStats.update("NAMES", "PRIMARY", "Jane Doe")
+    workerStats.update("NAMES", "AKA")
+    workerStats.addProcessCounts("ID_NOTE_CACHE", {"hits": 2, "misses": 1})
+    workerStats.process["PARSER_BACKEND"] = "etree"
+
+    stats.merge(workerStats)
+
+    statPack = stats.toDict()
+    assert statPack["NAMES"]["PRIMARY"] == {
+        "count": 2,
+        "examples": ["John Smith", "Jane Doe"],
+    }
+    assert statPack["NAMES"]["AKA"] == {"count": 1}
+    assert statPack["PROCESS"]["ID_NOTE_CACHE"] == {"hits": 3, "misses": 1}
+    assert statPack["PROCESS"]["PARSER_BACKEND"] == "etree"
+
+
+# ----------------------------------------
+def test_stat_collector_merge_keeps_a_sample_of_the_examples():
+    stats = dj_mapper.StatCollector(sampleSize=3)
+    workerStats = dj_mapper.StatCollector(sampleSize=3)
+    for exampleNum in range(100):
+        stats.update("NAMES", "PRIMARY", "main %s" % exampleNum)
+        workerStats.update("NAMES", "PRIMARY", "worker %s" % exampleNum)
+
+    stats.merge(workerStats)
+
+    examples = stats.toDict()["NAMES"]["PRIMARY"]["examples"]
+    assert len(examples) == 3
+    assert len(set(examples)) == 3
+    assert stats.counts[("NAMES", "PRIMARY")] == 200
+
+
+# ----------------------------------------
+def mappedRecord(profileId):
+    """return the mapped record of a profile of the sample file"""
+    mapper = dj_mapper.DowJonesMapper()
+    mapper.build_references(SAMPLE_FILE)
+    for record in mapper.map_records(SAMPLE_FILE):
+        if record["RECORD_ID"] == profileId:
+            return record
+    return None
+
+
+# ----------------------------------------
+def test_id_type_rules_by_precedence():
+    mapper = dj_mapper.DowJonesMapper()
+
+    def firstRule(idType, idNotes):
+        for idTypeRule in mapper.getIdTypeRules(idType):
+            notesTest, notesText, attrType1 = idTypeRule[1:4]
+            if notesTest is None or notesTest(idNotes, notesText):
+                return attrType1
+        return None
+
+    # --an exact id type comes before a notes match listed after it
+    assert firstRule("Social Security No.", "NPI thing") == "SSN_NUMBER"
+    assert firstRule("Unknown Thing", "NPI 9") == "NPI_NUMBER"
+    # --a notes match listed first wins over the others id type rules
+    assert firstRule("Others", "(NCIC)") == "NCIC_NUMBER"
+    assert firstRule("Others", "MMSI") == "MMSI_NUMBER"
+    assert firstRule("Others", "aircraft tail number 5") == "AIRCRAFT_TAIL_NUMBER"
+    assert firstRule("Others", "mystery") is None
+    assert (
+        firstRule("Aircraft Manufacturer's Serial Number (MSN)", "")
+        == "AIRCRAFT_MFG_SERIAL_NUM"
+    )
+    assert firstRule("passport no.", "") == "PASSPORT_NUMBER"
+
+
+# ----------------------------------------
+def test_id_type_rules_keep_their_order_across_kinds_of_match():
+    mapper = dj_mapper.DowJonesMapper()
+    mapper.idTypeRuleIndex = dj_mapper.compileIdTypeRules(
+        (
+            (("contains", "ID"), None, "FIRST", None, 0),
+            (("equals", "NATIONAL ID"), None, "SECOND", None, 0),
+            (None, ("startswith", "X"), "THIRD", None, 0),
+        )
+    )
+
+    assert [rule[3] for rule in mapper.getIdTypeRules("National ID")] == [
+        "FIRST",
+        "SECOND",
+        "THIRD",
+    ]
+    assert [rule[3] for rule in mapper.getIdTypeRules("Other")] == ["THIRD"]
+
+
+# ----------------------------------------
+def test_id_type_rules_are_cached_by_upper_case_type(monkeypatch):
+    monkeypatch.setattr(dj_mapper, "ID_TYPE_CACHE_SIZE", 2)
+    mapper = dj_mapper.DowJonesMapper()
+
+    rules = mapper.getIdTypeRules("Passport No.")
+    assert mapper.getIdTypeRules("PASSPORT NO.") is rules
+    assert mapper.getIdTypeRules("passport no.") is rules
+    for idType in ("Other A", "Other B", "Other C"):
+        mapper.getIdTypeRules(idType)
+    assert len(mapper.idTypeRuleCache.entries) == 2
+
+
+# ----------------------------------------
+def test_mapped_identifiers():
+    record = mappedRecord("10")
+
+    identifiers = record["IDENTIFIERS"]
+    for identifier in (
+        {"SSN_NUMBER": "123-45"},
+        {"NPI_NUMBER": "NP1"},
+        {"MMSI_NUMBER": "M1"},
+        {"NCIC_NUMBER": "C1"},
+        {"AIRCRAFT_TAIL_NUMBER": "T1"},
+        {"AIRCRAFT_MFG_SERIAL_NUM": "S1"},
+    ):
+        assert identifier in identifiers
+    assert record["ID1"] == "Others = X1 mystery"
+
+
+# ----------------------------------------
+def test_build_edges_finds_reciprocal_relationships():
+    profileIds = dj_mapper.ProfileIdTable()
+    relationships = dj_mapper.AssociateTable(profileIds)
+    relationships["10"] = [
+        {"id": "11", "code": "2", "ex": "No"},
+        {"id": "20", "code": "3", "ex": "Yes"},
+        {"id": "99", "code": "5", "ex": "No"},
+    ]
+    relationships["11"] = [{"id": "10", "code": "1", "ex": "No"}]
+    relationships["20"] = [{"id": "10", "code": "4", "ex": "No"}]
+    # --an associate listed twice is matched to the first listing
+    relationships["30"] = [{"id": "31", "code": "5", "ex": "No"}]
+    relationships["31"] = [
+        {"id": "30", "code": "1", "ex": "No"},
+        {"id": "30", "code": "2", "ex": "No"},
+    ]
+    relationships.buildEdges(RELATION_CODES)
+
+    assert list(relationships.edges("10")) == [
+        ("11", "Husband", "Husband/Wife", "10-11"),
+        ("20", "EX_Employee", "EX_Employee/Employer_Of", "10-20"),
+        ("99", "Business_Associate", "Business_Associate", "10-99"),
+    ]
+    assert list(relationships.edges("11")) == [("10", "Wife", "Husband/Wife", "10-11")]
+    assert list(relationships.edges("20")) == [
+        ("10", "Employer_Of", "Employee/Employer_Of", "10-20")
+    ]
+    assert list(relationships.edges("30")) == [
+        ("31", "Business_Associate", "Business_Associate/Wife", "30-31")
+    ]
+    assert not list(relationships.edges("99"))
+
+
+# ----------------------------------------
+@pytest.mark.parametrize("parser", ["etree", "lxml"])
+@pytest.mark.parametrize("xmlLayout", ["extra_element", "nested_sections"])
+def test_stream_elements_of_any_layout(parser, xmlLayout):
+    if parser == "lxml" and dj_mapper.lxmlEtree is None:
+        pytest.skip("lxml is not installed")
+    records = '<Person id="1"/><Notes>a</Notes><Entity id="2"><Name/></Entity>'
+    if xmlLayout == "extra_element":
+        xmlData = "<PFA><Header/><Records><Notes/>%s</Records></PFA>" % records
+    else:
+        xmlData = "<PFA><Body><Records><Group>%s</Group></Records></Body></PFA>" % (
+            records
+        )
+    mapper = dj_mapper.DowJonesMapper(parser=parser)
+
+    streamed = [
+        (node.tag, node.get("id"), len(node))
+        for node in mapper.iterElements(
+            io.BytesIO(xmlData.encode()), ("Person", "Entity")
+        )
+    ]
+
+    assert streamed == [("Person", "1", 0), ("Entity", "2", 1)]
+
+
+# ----------------------------------------
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="processes cannot fork")
+def test_forked_copies_exit_after_mapping_their_file(tmp_path):
+    mainPid = os.getpid()
+
+    def mapFile(inputFileName):
+        (tmp_path / inputFileName).write_text(str(os.getpid()))
+        if inputFileName == "broken":
+            raise ValueError("cannot map")
+        return 3 if inputFileName == "partial" else 0
+
+    exitCodes = dj_mapper.forkInputFiles(["good", "partial", "broken"], 2, mapFile)
+
+    assert os.getpid() == mainPid
+    assert exitCodes == {"good": 0, "partial": 3, "broken": 1}
+    for inputFileName in exitCodes:
+        assert (tmp_path / inputFileName).read_text() != str(mainPid)
+
+
+# ----------------------------------------
+def test_snapshot_reloads_the_reference_tables(tmp_path):
+    inputFileName = str(tmp_path / "sample.xml")
+    with open(SAMPLE_FILE, "rb") as sampleFile:
+        (tmp_path / "sample.xml").write_bytes(sampleFile.read())
+    mapper = dj_mapper.DowJonesMapper(use_snapshot=True)
+    mapper.build_references(inputFileName)
+    assert mapper.stats.process["REFERENCE_SNAPSHOT"] == "saved"
+    with open(inputFileName + ".snapshot", "rb") as snapshotFile:
+        assert json.loads(snapshotFile.readline())["version"] == (
+            dj_mapper.SNAPSHOT_VERSION
+        )
+
+    snapshotMapper = dj_mapper.DowJonesMapper(use_snapshot=True)
+    assert snapshotMapper.loadSnapshot(inputFileName)
+
+    for tableName in dj_mapper.REFERENCE_TABLES[:7]:
+        assert getattr(snapshotMapper, tableName) == getattr(mapper, tableName)
+    assert snapshotMapper.profileIds.numbers == mapper.profileIds.numbers
+    for profileId in mapper.relationships:
+        assert snapshotMapper.relationships[profileId] == (
+            mapper.relationships[profileId]
+        )
+        assert list(snapshotMapper.relationships.edges(profileId)) == list(
+            mapper.relationships.edges(profileId)
+        )
+    assert dict(
+        (profileId, snapshotMapper.entityNames[profileId])
+        for profileId in snapshotMapper.entityNames
+    ) == dict(
+        (profileId, mapper.entityNames[profileId]) for profileId in mapper.entityNames
+    )
+    assert list(snapshotMapper.map_records(inputFileName)) == list(
+        mapper.map_records(inputFileName)
+    )
+
+
+# ----------------------------------------
+def test_damaged_snapshot_is_not_loaded(tmp_path):
+    inputFileName = str(tmp_path / "sample.xml")
+    with open(SAMPLE_FILE, "rb") as sampleFile:
+        (tmp_path / "sample.xml").write_bytes(sampleFile.read())
+    dj_mapper.DowJonesMapper(use_snapshot=True).build_references(inputFileName)
+    with open(inputFileName + ".snapshot", "rb") as snapshotFile:
+        snapshotData = bytearray(snapshotFile.read())
+    snapshotData[-1] ^= 0xFF
+    (tmp_path / "sample.xml.snapshot").write_bytes(bytes(snapshotData))
+
+    assert not dj_mapper.DowJonesMapper(use_snapshot=True).loadSnapshot(inputFileName)
+
+
+# ----------------------------------------
+def test_memory_limit_stops_only_its_own_mapper(monkeypatch):
+    monkeypatch.setattr(dj_mapper, "currentRssMb", lambda: 100)
+    xmlData = "<PFA><Records>%s</Records></PFA>" % "".join(
+        '<Person id="%s"/>' % profileId for profileId in range(10500)
+    )
+    limitedMapper = dj_mapper.DowJonesMapper(max_rss_mb=50)
+    otherMapper = dj_mapper.DowJonesMapper(max_rss_mb=500)
+
+    limitedCount = sum(
+        1
+        for node in limitedMapper.iterElements(io.BytesIO(xmlData.encode()), ["Person"])
+    )
+    otherCount = sum(
+        1 for node in otherMapper.iterElements(io.BytesIO(xmlData.encode()), ["Person"])
+    )
+
+    assert limitedMapper.stopped
+    assert limitedCount == 10000
+    assert not otherMapper.stopped
+    assert otherCount == 10500
+
+
+# ----------------------------------------
+def test_runs_restore_stdout(tmp_path):
+    mainStdout = sys.stdout
+    queryArgs = dj_mapper.buildArgumentParser().parse_args(
+        ["query", str(tmp_path / "missing.db")]
+    )
+
+    assert dj_mapper.runQuery(queryArgs) == 1
+    assert sys.stdout is mainStdout
+
+
+# ----------------------------------------
+@pytest.mark.parametrize("extension", ["json", "json.gz"])
+def test_output_writer_writes_every_batch(tmp_path, extension):
+    lines = [b'{"RECORD_ID":"%d"}\n' % lineNumber for lineNumber in range(1000)]
+    outputFileName = str(tmp_path / ("output." + extension))
+
+    outputWriter = dj_mapper.OutputWriter(outputFileName, bufferSize=1000)
+    for line in lines:
+        outputWriter.write(line)
+    outputWriter.close()
+
+    with open(outputFileName, "rb") as outputFile:
+        outputData = outputFile.read()
+    if extension.endswith(".gz"):
+        # --no time in the gzip headers, so the same records make the same bytes
+        assert outputData[4:8] == bytes(4)
+        outputData = gzip.decompress(outputData)
+    assert outputData == b"".join(lines)
+
+
+# ----------------------------------------
+@pytest.mark.parametrize(
+    "fileName, suffixedName",
+    [
+        ("out.json", "out_DJ-PFA.json"),
+        ("out.json.gz", "out_DJ-PFA.json.gz"),
+        ("out.2024.06.json.zst", "out.2024.06_DJ-PFA.json.zst"),
+        ("delta.db", "delta_DJ-PFA.db"),
+        ("out", "out_DJ-PFA"),
+    ],
+)
+def test_file_suffix_goes_before_the_extensions(fileName, suffixedName):
+    assert dj_mapper.addFileSuffix(os.path.join("v1.2", fileName), "DJ-PFA") == (
+        os.path.join("v1.2", suffixedName)
+    )
+
+
+# ----------------------------------------
+def test_shards_split_the_records_by_id(tmp_path):
+    shardedOutput = dj_mapper.ShardedOutputWriter(str(tmp_path / "out.2024.json.gz"), 3)
+    for recordId in (str(recordNumber) for recordNumber in range(300)):
+        shardedOutput.write(b'{"RECORD_ID":"%s"}\n' % recordId.encode(), recordId)
+    shardedOutput.close()
+    shardedOutput.writeManifest({"data_source": "DJ-PFA"})
+
+    with open(tmp_path / "out.2024_manifest.json") as manifestFile:
+        manifest = json.load(manifestFile)
+    assert manifest["total_records"] == 300
+    shardIds = []
+    for shard in manifest["shards"]:
+        assert shard["file_name"] == "out.2024_shard%03d.json.gz" % shard["shard"]
+        with gzip.open(tmp_path / shard["file_name"]) as shardFile:
+            shardRecordIds = [json.loads(line)["RECORD_ID"] for line in shardFile]
+        assert len(shardRecordIds) == shard["records"]
+        assert {shardedOutput.shardNumber(recordId) for recordId in shardRecordIds} == {
+            shard["shard"]
+        }
+        shardIds.extend(shardRecordIds)
+    assert sorted(shardIds, key=int) == [str(recordId) for recordId in range(300)]
+
+
+# ----------------------------------------
+@pytest.mark.parametrize("compression", ["gz", "bz2", "zip", "zst"])
+def test_compressed_input_maps_like_the_plain_file(tmp_path, compression):
+    if compression == "zst" and dj_mapper.zstandard is None:
+        pytest.skip("zstandard is not installed")
+    with open(SAMPLE_FILE, "rb") as sampleFile:
+        sampleData = sampleFile.read()
+    inputFileName = str(tmp_path / ("sample.xml." + compression))
+    if compression == "gz":
+        with gzip.open(inputFileName, "wb") as inputFile:
+            inputFile.write(sampleData)
+    elif compression == "bz2":
+        with bz2.open(inputFileName, "wb") as inputFile:
+            inputFile.write(sampleData)
+    elif compression == "zip":
+        with zipfile.ZipFile(inputFileName, "w") as inputFile:
+            inputFile.writestr("sample.xml", sampleData)
+    else:
+        with open(inputFileName, "wb") as inputFile:
+            inputFile.write(dj_mapper.zstandard.ZstdCompressor().compress(sampleData))
+    mapper = dj_mapper.DowJonesMapper()
+    mapper.build_references(inputFileName)
+    plainMapper = dj_mapper.DowJonesMapper()
+    plainMapper.build_references(SAMPLE_FILE)
+
+    assert list(mapper.map_records(inputFileName)) == list(
+        plainMapper.map_records(SAMPLE_FILE)
+    )
+
+
+# ----------------------------------------
+def test_lookup_maps_a_profile_from_its_index(tmp_path, capsys):
+    inputFileName = str(tmp_path / "sample.xml")
+    with open(SAMPLE_FILE, "rb") as sampleFile:
+        (tmp_path / "sample.xml").write_bytes(sampleFile.read())
+
+    for lookupNumber in range(2):
+        mapper = dj_mapper.DowJonesMapper()
+        node = mapper.lookupProfile(inputFileName, "11")
+        assert mapper.g2Mapping(node, "PERSON") == mappedRecord("11")
+        # --the index is built by the first lookup and used by the next
+        assert ("building profile index" in capsys.readouterr().out) == (
+            lookupNumber == 0
+        )
+    assert os.path.exists(inputFileName + ".idx")
+    assert dj_mapper.DowJonesMapper().lookupProfile(inputFileName, "99") is None
+
+
+# ----------------------------------------
+def test_split_feeds_write_each_feed_to_its_own_output(tmp_path):
+    with open(SAMPLE_FILE) as sampleFile:
+        sampleXml = sampleFile.read()
+    # --profile 11 becomes a state owned company and the entities adverse media
+    sampleXml = sampleXml.replace(
+        "Special Interest Person (SIP)", "State-Owned Companies (SOC)"
+    ).replace(">Sanctions Lists<", ">Adverse Media Entities<")
+    inputFileName = tmp_path / "trifecta.xml"
+    inputFileName.write_text(sampleXml)
+    outputFileName = str(tmp_path / "out.json")
+    args = dj_mapper.buildArgumentParser().parse_args(
+        ["-i", str(inputFileName), "-o", outputFileName, "--split_feeds"]
+    )
+
+    assert dj_mapper.MappingRun(args).run() == 0
+
+    feedRecords = {}
+    for feedDataSource in ("DJ-PFA", "DJ-AME", "DJ-SOC"):
+        with open(tmp_path / ("out_%s.json" % feedDataSource)) as feedFile:
+            feedRecords[feedDataSource] = {
+                record["RECORD_ID"]: record
+                for record in (json.loads(line) for line in feedFile)
+            }
+    assert {
+        feedDataSource: sorted(
+            (record["RECORD_ID"], record["DATA_SOURCE"]) for record in records.values()
+        )
+        for feedDataSource, records in feedRecords.items()
+    } == {
+        "DJ-PFA": [("10", "DJ-PFA")],
+        "DJ-AME": [("20", "DJ-AME"), ("21", "DJ-AME"), ("22", "DJ-AME")],
+        "DJ-SOC": [("11", "DJ-SOC")],
+    }
+    # --relationships across feeds are kept
+    assert {
+        "REL_POINTER_DOMAIN": "DJ_ID",
+        "REL_POINTER_KEY": "10",
+        "REL_POINTER_ROLE": "Wife",
+    } in feedRecords["DJ-SOC"]["11"]["RELATIONSHIPS"]
+    assert not os.path.exists(outputFileName)
+
+
+# ----------------------------------------
+def test_query_index_finds_the_mapped_records(tmp_path):
+    indexFileName = str(tmp_path / "query.db")
+    mappedRecords = mapSample(tmp_path, "sample.json", "--query_index", indexFileName)
+
+    def queryIds(*queryOptions):
+        queryFileName = str(tmp_path / "query.json")
+        queryArgs = dj_mapper.buildArgumentParser().parse_args(
+            ["query", indexFileName, "-o", queryFileName] + list(queryOptions)
+        )
+        assert dj_mapper.runQuery(queryArgs) == 0
+        with open(queryFileName) as queryFile:
+            records = [json.loads(line) for line in queryFile]
+        for record in records:
+            assert record == mappedRecords[record["RECORD_ID"]]
+        return sorted(record["RECORD_ID"] for record in records)
+
+    assert queryIds("--record_type", "person") == ["10", "11"]
+    assert queryIds("--related_to", "10") == ["11", "20"]
+    assert queryIds("--record_type", "PERSON", "--related_to", "10") == ["11"]
+    assert queryIds("--description1", "Politically Exposed Person (PEP)") == ["10"]
+    assert queryIds("--data_source", "DJ-AME") == []